@@ -1,7 +1,10 @@
 import os
+import time
 import asyncio
 import pandas as pd
-import psycopg2
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import asyncpg
 import pytz
 from datetime import datetime
 from watchdog.observers import Observer
@@ -25,6 +28,9 @@ os.makedirs(log_dir, exist_ok=True)
 logger.add(os.path.join(log_dir, "etl.log"), rotation="500 MB", level="INFO", encoding="utf-8")  # 添加文件输出
 
 class CSVProcessor:
+    # 每个 CSV 分块的最大行数
+    COPY_CHUNK_ROWS = 100000
+
     def __init__(self):
         self.db_params = {
             'dbname': os.getenv('DB_NAME'),
@@ -33,6 +39,27 @@ class CSVProcessor:
             'host': os.getenv('DB_HOST'),
             'port': os.getenv('DB_PORT')
         }
+        # 所有文件共用的连接池，首次写入时创建
+        self.pool = None
+        self.pool_lock = asyncio.Lock()
+
+    async def get_pool(self) -> asyncpg.Pool:
+        """返回共享的连接池，多个协程并发调用时只创建一次"""
+        async with self.pool_lock:
+            if self.pool is None:
+                self.pool = await asyncpg.create_pool(
+                    database=self.db_params['dbname'],
+                    user=self.db_params['user'],
+                    password=self.db_params['password'],
+                    host=self.db_params['host'],
+                    port=int(self.db_params['port']) if self.db_params['port'] else None
+                )
+        return self.pool
+
+    async def close(self) -> None:
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
         
     async def process_file(self, file_path: str) -> pd.DataFrame:
         """异步处理单个CSV文件"""
@@ -95,24 +122,32 @@ class CSVProcessor:
         
         return df
     
+    def csv_chunks(self, table: pa.Table):
+        """按 COPY_CHUNK_ROWS 分块，由 Arrow 的 CSV 写入器直接从列缓冲区编码，不转换为 Python 对象"""
+        options = pa_csv.WriteOptions(include_header=False)
+        for offset in range(0, table.num_rows, self.COPY_CHUNK_ROWS):
+            sink = pa.BufferOutputStream()
+            pa_csv.write_csv(table.slice(offset, self.COPY_CHUNK_ROWS), sink, write_options=options)
+            yield sink.getvalue()
+
     async def load_to_postgres(self, df: pd.DataFrame) -> None:
-        """异步批量写入PostgreSQL"""
+        """通过一条 COPY ... FROM STDIN (FORMAT csv) 异步批量写入PostgreSQL，使用共享的连接池
+
+        CSV 中未加引号的空值为 NULL，字符串总是加引号，空字符串与 NULL 可以区分。
+        """
         try:
-            conn = psycopg2.connect(**self.db_params)
-            cur = conn.cursor()
-            
-            # 准备批量插入数据
-            data_tuples = [tuple(x) for x in df.to_numpy()]
-            columns = ','.join(df.columns)
-            values = ','.join(['%s'] * len(df.columns))
-            
-            # 执行批量插入
-            query = f"INSERT INTO orders ({columns}) VALUES ({values})"
-            cur.executemany(query, data_tuples)
-            
-            conn.commit()
-            cur.close()
-            conn.close()
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            # 字典列解码为普通列后再编码
+            table = pa.table([column.cast(column.type.value_type) if pa.types.is_dictionary(column.type) else column
+                              for column in table.columns], names=table.column_names)
+
+            async def source():
+                for chunk in self.csv_chunks(table):
+                    yield chunk
+
+            pool = await self.get_pool()
+            async with pool.acquire() as conn:
+                await conn.copy_to_table('orders', source=source(), columns=table.column_names, format='csv')
             
         except Exception as e:
             logger.error(f"数据库写入错误: {str(e)}")
@@ -147,6 +182,8 @@ async def main():
             event_handler.processing_queue.task_done()
     except KeyboardInterrupt:
         observer.stop()
+    finally:
+        await event_handler.processor.close()
     observer.join()
 
 if __name__ == '__main__':
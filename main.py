@@ -6,164 +6,392 @@ from watchdog.events import FileSystemEventHandler
 from loguru import logger
 from src.etl.extractor import CSVExtractor
 from src.etl.transformer import DataTransformer
-from src.etl.loader import PostgresLoader
-from src.config import FILE_MONITOR_CONFIG, LOG_CONFIG
-from src.utils.file_index import FileIndexManager
+from src.etl.sinks import create_sink
+from src.etl.coalescer import MicroBatch, MicroBatchCoalescer
+from src.etl.process_pool import ArrowHandle, ProcessPoolRunner
+from src.etl.spool import SpoolDrainer, WriteAheadSpool
+from src.etl.readiness import FileReadinessTracker
+from src.etl.work_queue import PriorityWorkQueue
+from src.etl.pipeline import BatchProgress, PipelineJob, PipelineStage, StagedPipeline
+from src.monitor.stats_collector import StatsCollector
+from src.config import (FILE_MONITOR_CONFIG, LOG_CONFIG, BATCH_CONFIG, STATS_CONFIG, PROCESS_POOL_CONFIG,
+                        SPOOL_CONFIG, SINK_CONFIG, FILE_INDEX_CONFIG, READINESS_CONFIG, WORKER_CONFIG,
+                        PIPELINE_CONFIG, CLAIM_CONFIG)
+from src.utils.file_index import FileIndexManager, match_patterns
+from src.utils.work_claims import WorkClaimManager
 import os
+import pandas as pd
 from datetime import datetime
 
-# 配置日志输出
-log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs')
-os.makedirs(log_dir, exist_ok=True)
-
-# 移除所有已存在的日志处理器
-logger.remove()
-
-# 添加控制台输出
-logger.add(
-    sink=sys.stdout,
-    format="<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
-    level="DEBUG"  # 将日志级别改为DEBUG以显示更多信息
-)
-
-# 添加文件输出
-logger.add(
-    sink=os.path.join(log_dir, LOG_CONFIG['log_file']),
-    format="{time:YYYY-MM-DD HH:mm:ss.SSS} | {level: <8} | {name}:{function}:{line} - {message}",
-    rotation=LOG_CONFIG['rotation'],
-    encoding='utf-8',
-    level="DEBUG"
-)
+def setup_logging():
+    """配置日志输出，只在主进程中调用，处理进程以 spawn 方式重新导入本模块时不会重复添加文件输出"""
+    log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs')
+    os.makedirs(log_dir, exist_ok=True)
+
+    # 移除所有已存在的日志处理器
+    logger.remove()
+
+    # 添加控制台输出
+    logger.add(
+        sink=sys.stdout,
+        format="<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
+        level="DEBUG"  # 将日志级别改为DEBUG以显示更多信息
+    )
+
+    # 添加文件输出
+    logger.add(
+        sink=os.path.join(log_dir, LOG_CONFIG['log_file']),
+        format="{time:YYYY-MM-DD HH:mm:ss.SSS} | {level: <8} | {name}:{function}:{line} - {message}",
+        rotation=LOG_CONFIG['rotation'],
+        encoding='utf-8',
+        level="DEBUG"
+    )
 
 class FileHandler(FileSystemEventHandler):
     def __init__(self):
         self.extractor = CSVExtractor()
-        self.transformer = DataTransformer()
-        self.loader = PostgresLoader()
-        self.processing_queue = asyncio.Queue()
+        # 转换和加载两个阶段共用一个统计收集器，按时间窗口累加
+        self.stats = StatsCollector.from_config(STATS_CONFIG)
+        self.transformer = DataTransformer(stats=self.stats)
+        # 写入目标由配置选择，配置多个时同一批次同时写入
+        self.loader = create_sink(SINK_CONFIG)
+        # 转换结果先写入本地预写缓冲即确认，由后台排空协程加载到数据库
+        self.spool = WriteAheadSpool.from_config(SPOOL_CONFIG) if SPOOL_CONFIG['enabled'] else None
+        # 有界优先级队列，队列满时就绪检查协程等待入队
+        self.processing_queue = PriorityWorkQueue(WORKER_CONFIG['queue_maxsize'], WORKER_CONFIG['priority'])
         self.start_time = datetime.now()
-        self.file_index = FileIndexManager()
+        self.file_index = FileIndexManager(**FILE_INDEX_CONFIG)
+        # 多个实例共享监控目录时，先在共享的认领目录中认领文件再处理
+        self.claims = None
+        if CLAIM_CONFIG['enabled']:
+            self.claims = WorkClaimManager(
+                claim_dir=CLAIM_CONFIG['claim_dir'],
+                root=FILE_MONITOR_CONFIG['watch_path'],
+                node_id=CLAIM_CONFIG['node_id'],
+                lease_seconds=CLAIM_CONFIG['lease_seconds'],
+                renew_interval=CLAIM_CONFIG['renew_interval'],
+                partitions=CLAIM_CONFIG['partitions'],
+                partition=CLAIM_CONFIG['partition'],
+                partition_grace_seconds=CLAIM_CONFIG['partition_grace_seconds']
+            )
+            if self.spool is not None:
+                # 本地缓冲只在本节点上，写入缓冲后就写完成标记，本节点停止时这些数据在整个集群中丢失；
+                # 认领时直接加载到数据库，提交成功后才写完成标记，缓冲只重放之前遗留的批次
+                logger.warning("已启用工作认领，新的批次不写入本地缓冲，直接加载到数据库")
+        # 监控线程的事件交给事件循环，文件写完后才进入处理队列
+        self.readiness = FileReadinessTracker(
+            self.enqueue,
+            stable_seconds=READINESS_CONFIG['stable_seconds'],
+            poll_interval=READINESS_CONFIG['poll_interval'],
+            max_tracked=READINESS_CONFIG['max_tracked']
+        )
+        self.processed_count = 0
+        # 提取和转换在进程池中执行，事件循环只负责调度和数据库 I/O
+        self.pool = None
+        if PROCESS_POOL_CONFIG['enabled']:
+            self.pool = ProcessPoolRunner(
+                max_workers=PROCESS_POOL_CONFIG['max_workers'],
+                spool_dir=PROCESS_POOL_CONFIG['spool_dir'],
+                start_method=PROCESS_POOL_CONFIG['start_method'],
+                format_cache=self.extractor.format_cache,
+                transformer=self.transformer
+            )
+        self.coalescer = MicroBatchCoalescer(
+            self.processing_queue,
+            self.pool.extract if self.pool is not None else self.extractor.extract,
+            max_rows=BATCH_CONFIG['max_rows'],
+            max_wait_seconds=BATCH_CONFIG['max_wait_seconds'],
+            max_files=BATCH_CONFIG['max_files'],
+            should_stream=self.extractor.should_stream
+        )
+        # 提取、转换、加载分为三个阶段，由有界队列连接，各阶段的协程数独立伸缩
+        self.pipeline = StagedPipeline(
+            self.coalescer.next_batch,
+            self.processing_queue,
+            [
+                PipelineStage('extract', self.extract_stage, **PIPELINE_CONFIG['extract']),
+                PipelineStage('transform', self.transform_stage, **PIPELINE_CONFIG['transform']),
+                PipelineStage('load', self.load_stage, **PIPELINE_CONFIG['load'])
+            ],
+            target_latency=WORKER_CONFIG['target_latency_seconds'],
+            scale_interval=WORKER_CONFIG['scale_interval_seconds'],
+            source_busy=lambda: self.coalescer.collecting
+        )
         logger.debug("FileHandler初始化完成")
     
-    def on_created(self, event):
-        if event.is_directory or not event.src_path.endswith('.csv'):
+    def _notify(self, path, complete: bool = False):
+        """在监控线程中调用，只把匹配的文件事件转交给事件循环"""
+        if not match_patterns(path, FILE_MONITOR_CONFIG['patterns']):
             return
-        
-        file_path = os.path.abspath(event.src_path)
-        if not self.file_index.is_file_processed(file_path):
-            logger.info(f"检测到新文件: {file_path}")
-            # 使用put_nowait直接添加到队列
-            self.processing_queue.put_nowait(file_path)
-            logger.debug(f"文件已添加到处理队列: {file_path}")
-        else:
+        self.readiness.notify_threadsafe(os.path.abspath(path), complete)
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self._notify(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self._notify(event.src_path)
+
+    def on_closed(self, event):
+        # 关闭写入事件（inotify）表示写入方已写完
+        if not event.is_directory:
+            self._notify(event.src_path, complete=True)
+
+    def on_moved(self, event):
+        # 先写临时文件再重命名到位的文件，重命名后即已写完
+        if not event.is_directory:
+            self._notify(event.dest_path, complete=True)
+
+    async def enqueue(self, file_path: str):
+        """文件写完后检查是否已处理过，未处理的加入处理队列"""
+        if await asyncio.to_thread(self.file_index.is_file_processed, file_path):
             logger.debug(f"文件已处理过，跳过: {file_path}")
-    
-    async def process_new_file(self, file_path: str):
-        logger.debug(f"将文件添加到处理队列: {file_path}")
+            return
+        if self.claims is not None and not await self.claim(file_path):
+            return
+        logger.info(f"检测到新文件: {file_path}")
         await self.processing_queue.put(file_path)
+        logger.debug(f"文件已添加到处理队列: {file_path}")
     
-    async def process_file(self, file_path: str):
-        start_time = time.time()
-        df = None
-        try:
-            logger.info(f"开始处理文件: {file_path}")
-            logger.debug(f"文件处理开始时间: {datetime.fromtimestamp(start_time)}")
-            
-            # 提取数据
-            extract_start = time.time()
-            logger.info(f"正在提取数据: {file_path}")
-            try:
-                df = await self.extractor.extract(file_path)
-                if df is None:
-                    logger.warning(f"文件提取失败: {file_path}")
-                    return
-                extract_time = time.time() - extract_start
-                logger.debug(f"数据提取完成，耗时: {extract_time:.2f}秒，数据行数: {len(df)}")
-            except Exception as e:
-                logger.error(f"数据提取过程发生错误: {str(e)}")
-                return
-            
-            # 转换数据
-            transform_start = time.time()
-            logger.info(f"正在转换数据: {file_path}")
+    async def scan_existing(self, watch_path: str):
+        """在线程中逐个取出启动扫描发现的未处理文件（检查索引和计算内容哈希都在线程中），
+        交给就绪检查；等待中的文件达到上限或处理队列已满时扫描随之暂停"""
+        files = self.file_index.scan_directory(watch_path, FILE_MONITOR_CONFIG['patterns'])
+        count = 0
+        while True:
+            file_path = await asyncio.to_thread(next, files, None)
+            if file_path is None:
+                break
+            await self.readiness.admit(file_path)
+            count += 1
+            logger.debug(f"添加未处理的文件到队列: {file_path}")
+        logger.info(f"启动扫描完成，发现未处理的文件 {count} 个")
+
+    async def claim(self, file_path: str) -> bool:
+        """在共享的认领目录中认领文件，已由其他实例处理完成的文件记入本地索引"""
+        status = await asyncio.to_thread(self.claims.claim, file_path)
+        if status == WorkClaimManager.DONE:
+            logger.debug(f"文件已由其他节点处理，跳过: {file_path}")
+            self.file_index.mark_file_processed(file_path)
+        elif status == WorkClaimManager.HELD:
+            logger.debug(f"文件已被其他节点认领，稍后重试: {file_path}")
+        return status == WorkClaimManager.CLAIMED
+
+    async def reclaim(self):
+        """定期重试认领其他实例持有的文件，持有者停止、租约过期后由本实例接管"""
+        while True:
+            await asyncio.sleep(CLAIM_CONFIG['reclaim_interval'])
             try:
-                df = await self.transformer.transform(df)
-                if df is None:
-                    logger.warning(f"数据转换失败: {file_path}")
-                    return
-                transform_time = time.time() - transform_start
-                logger.debug(f"数据转换完成，耗时: {transform_time:.2f}秒，转换后数据行数: {len(df)}")
+                for file_path, status in await asyncio.to_thread(self.claims.reclaim):
+                    if status == WorkClaimManager.DONE:
+                        self.file_index.mark_file_processed(file_path)
+                        continue
+                    logger.info(f"接管其他节点未完成的文件: {file_path}")
+                    await self.processing_queue.put(file_path)
             except Exception as e:
-                logger.error(f"数据转换过程发生错误: {str(e)}")
+                logger.error(f"重新认领文件时发生错误: {str(e)}")
+
+    async def transform_batch(self, batch: MicroBatch):
+        """转换微批数据，使用进程池时合并工作进程返回的统计"""
+        if self.pool is None:
+            return await self.transformer.transform(batch.to_frame())
+        df, stats = await self.pool.transform(batch.frames)
+        self.stats.merge(stats)
+        return df
+
+    async def transform_table(self, table):
+        """转换流式读取的一个批次"""
+        if self.pool is None:
+            return await self.transformer.transform(table.to_pandas(types_mapper=pd.ArrowDtype))
+        df, stats = await self.pool.transform([self.pool.write(table.unify_dictionaries())])
+        self.stats.merge(stats)
+        return df
+
+    async def load(self, df):
+        """写入本地缓冲（缓冲已满时等待），未启用缓冲或启用工作认领时直接加载到数据库"""
+        if self.spool is not None and self.claims is None:
+            await self.spool.append(df)
+            return
+        await self.loader.load(df)
+        self.stats.update(df, stage='loaded')
+
+    def drainers(self):
+        """创建把本地缓冲排空到数据库的后台协程，未启用缓冲时为空"""
+        if self.spool is None:
+            return []
+        return [
+            SpoolDrainer(
+                self.spool,
+                self.loader.load,
+                on_loaded=lambda df: self.stats.update(df, stage='loaded'),
+                retry_initial_seconds=SPOOL_CONFIG['retry_initial_seconds'],
+                retry_max_seconds=SPOOL_CONFIG['retry_max_seconds'],
+                # 连续的小批次按加载器当前的自适应批次行数合并写入
+                batch_rows=self.loader.sizer.batch_rows if self.loader.sizer is not None else None
+            )
+            for _ in range(SPOOL_CONFIG['drain_workers'])
+        ]
+
+    async def extract_stage(self, batch: MicroBatch, emit):
+        """提取阶段：微批作为一项工作交给转换阶段，大文件按固定行数分块逐块交出"""
+        progress = BatchProgress(batch, self.complete_batch)
+        try:
+            if batch.stream_file is not None:
+                logger.info(f"开始流式处理文件: {batch.stream_file}")
+                # 在线程中读取下一个分块，避免阻塞事件循环
+                tables = self.extractor.iter_tables(batch.stream_file)
+                # 已交出的分块转换或加载失败后整个文件都会重试，不再读取剩余的分块
+                while not progress.failed:
+                    extract_start = time.time()
+                    table = await asyncio.to_thread(next, tables, None)
+                    progress.timings['extract'] += time.time() - extract_start
+                    if table is None:
+                        break
+                    await emit(progress.job(table))
+                if progress.failed:
+                    tables.close()
+                    logger.warning(f"文件的分块处理失败，停止读取剩余的分块: {batch.stream_file}")
+            elif batch.files:
+                logger.info(f"开始处理微批，文件数: {len(batch.files)}，数据行数: {batch.rows}")
+                await emit(progress.job(batch))
+        except Exception as e:
+            logger.error(f"数据提取过程发生错误: {progress.files}, {str(e)}")
+            progress.failed = True
+        finally:
+            progress.seal()
+
+    @staticmethod
+    def _discard(job: PipelineJob):
+        """删除失败的工作留在进程间交换目录中的 IPC 文件"""
+        if isinstance(job.data, MicroBatch):
+            for frame in job.data.frames:
+                if isinstance(frame, ArrowHandle):
+                    frame.unlink()
+
+    async def transform_stage(self, job: PipelineJob, emit):
+        """转换阶段：CPU 密集的转换在进程池中执行（未启用时在事件循环中执行）"""
+        if job.progress.failed:
+            self._discard(job)
+            job.fail()
+            return
+        transform_start = time.time()
+        try:
+            if isinstance(job.data, MicroBatch):
+                df = await self.transform_batch(job.data)
+            else:
+                df = await self.transform_table(job.data)
+        except Exception as e:
+            logger.error(f"数据转换过程发生错误: {job.progress.files}, {str(e)}")
+            self._discard(job)
+            job.fail()
+            return
+        job.progress.timings['transform'] += time.time() - transform_start
+        if df is None:
+            logger.warning(f"数据转换失败: {job.progress.files}")
+            job.fail()
+            return
+        job.data = df
+        await emit(job)
+
+    async def load_stage(self, job: PipelineJob, emit):
+        """加载阶段：写入本地缓冲或数据库"""
+        if job.progress.failed:
+            job.fail()
+            return
+        load_start = time.time()
+        try:
+            await self.load(job.data)
+        except Exception as e:
+            logger.error(f"数据加载过程发生错误: {job.progress.files}, {str(e)}")
+            job.fail()
+            return
+        job.progress.timings['load'] += time.time() - load_start
+        job.progress.rows += len(job.data)
+        job.done()
+
+    def complete_batch(self, progress: BatchProgress):
+        """微批的所有工作结束后调用，全部写入缓冲或提交成功后才逐个标记源文件"""
+        try:
+            if self.claims is not None:
+                # 释放提取失败的文件，成功的文件写完成标记，失败的释放给其他实例重试
+                for file_path in progress.batch.failed:
+                    self.claims.release(file_path)
+                for file_path in progress.files:
+                    if progress.failed:
+                        self.claims.release(file_path)
+                    else:
+                        self.claims.complete(file_path)
+            if progress.failed:
+                logger.warning(f"微批处理失败，源文件不标记为已处理: {progress.files}")
                 return
-            
-            # 加载数据
-            load_start = time.time()
-            logger.info(f"正在加载数据到数据库: {file_path}")
-            try:
-                await self.loader.load(df)
-                load_time = time.time() - load_start
-                logger.debug(f"数据加载完成，耗时: {load_time:.2f}秒")
-            except Exception as e:
-                logger.error(f"数据加载到数据库过程发生错误: {str(e)}")
+            if not progress.files:
                 return
-            
-            # 数据处理结果统计
-            logger.info("数据处理结果统计:")
-            logger.info(f"- 总记录数: {len(df)}")
-            logger.info(f"- 订单状态分布:\n{df['order_status'].value_counts().to_string()}")
-            logger.info(f"- 支付方式分布:\n{df['payment_method'].value_counts().to_string()}")
-            logger.info(f"- 订单金额统计:\n{df['total_price'].describe().to_string()}")
-            
-            # 记录处理成功
-            self.file_index.mark_file_processed(file_path)
-            process_time = time.time() - start_time
-            logger.success(f"文件处理完成: {file_path}")
+            for file_path in progress.files:
+                self.file_index.mark_file_processed(file_path)
+                logger.success(f"文件处理完成: {file_path}")
+            self.processed_count += len(progress.files)
+            timings = progress.timings
             logger.info(f"处理详情:\n"
-                      f"- 总处理时间: {process_time:.2f}秒\n"
-                      f"- 数据提取时间: {extract_time:.2f}秒\n"
-                      f"- 数据转换时间: {transform_time:.2f}秒\n"
-                      f"- 数据加载时间: {load_time:.2f}秒")
-            
+                      f"- 文件数: {len(progress.files)}\n"
+                      f"- 写入记录数: {progress.rows}\n"
+                      f"- 总处理时间: {time.time() - progress.start_time:.2f}秒\n"
+                      f"- 数据提取时间: {timings['extract']:.2f}秒\n"
+                      f"- 数据转换时间: {timings['transform']:.2f}秒\n"
+                      f"- 数据加载时间: {timings['load']:.2f}秒")
+
             # 统计信息
-            total_files = len(self.processed_files)
+            total_files = self.processed_count
             total_time = (datetime.now() - self.start_time).total_seconds()
             avg_time = total_time / total_files if total_files > 0 else 0
             logger.info(f"处理统计 - 总文件数: {total_files}, 平均处理时间: {avg_time:.2f}秒")
-            
         except Exception as e:
-            logger.error(f"处理文件 {file_path} 时发生错误: {str(e)}")
+            logger.error(f"标记微批处理结果时发生错误: {progress.files}, {str(e)}")
             logger.exception(e)
-            raise  # 重新抛出异常，让上层处理
+        finally:
+            progress.batch.task_done()
 
-async def process_queue(event_handler):
-    """处理文件队列的协程"""
-    logger.debug("队列处理协程启动")
-    while True:
-        try:
-            # 从队列中获取文件路径
-            logger.debug("等待队列中的新文件...")
-            file_path = await event_handler.processing_queue.get()
-            logger.debug(f"从队列中获取到文件: {file_path}")
-            
-            # 处理文件
+    async def close(self):
+        """关闭所有资源，某一项失败时继续关闭其余各项"""
+        steps = [('文件索引', self.file_index.close)]
+        if self.claims is not None:
+            steps.append(('工作认领', self.claims.close))
+        steps.append(('写入目标', self.loader.close))
+        if self.pool is not None:
+            steps.append(('处理进程池', self.pool.shutdown))
+        if self.spool is not None:
+            steps.append(('本地缓冲', self.spool.close))
+        if self.transformer.user_stats is not None:
+            steps.append(('用户聚合', self.transformer.user_stats.close))
+        for name, close in steps:
             try:
-                await event_handler.process_file(file_path)
-                logger.debug(f"文件处理完成: {file_path}")
+                result = close()
+                if asyncio.iscoroutine(result):
+                    await result
             except Exception as e:
-                logger.error(f"处理文件时发生错误: {file_path}")
-                logger.exception(e)
-            finally:
-                # 无论处理是否成功，都标记任务完成
-                event_handler.processing_queue.task_done()
-                logger.debug(f"队列任务已标记完成: {file_path}")
-                
-        except asyncio.CancelledError:
-            logger.info("队列处理协程被取消")
-            break
+                logger.error(f"关闭{name}时发生错误: {str(e)}")
+
+async def report_stats(event_handler):
+    """定期合并最近一个统计周期内的窗口并输出汇总"""
+    interval = STATS_CONFIG['report_interval_seconds']
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            for stage in ('transformed', 'loaded'):
+                event_handler.stats.log_report(stage, seconds=interval)
+            event_handler.loader.log_metrics()
+            event_handler.pipeline.log_metrics()
+            if event_handler.claims is not None:
+                metrics = event_handler.claims.metrics()
+                logger.info(f"工作认领: 持有租约 {metrics['leases']} 个，其他节点持有 {metrics['held']} 个，"
+                            f"已完成 {metrics['completed']} 个，接管过期租约 {metrics['reclaimed']} 个")
+            if event_handler.spool is not None:
+                metrics = event_handler.spool.metrics()
+                logger.info(f"本地缓冲: 待加载批次 {metrics['segments']} 个，"
+                            f"{metrics['bytes']} 字节，使用率 {metrics['utilization']:.1%}，"
+                            f"重试中 {metrics['retrying']} 个，已隔离 {metrics['quarantined']} 个")
         except Exception as e:
-            logger.error(f"队列处理过程中发生错误: {str(e)}")
-            logger.exception(e)
+            logger.error(f"输出统计汇总时发生错误: {str(e)}")
 
 async def main():
     # 设置文件监控
@@ -171,38 +399,42 @@ async def main():
     observer = Observer()
     watch_path = os.path.abspath(FILE_MONITOR_CONFIG['watch_path'])
     logger.info(f"开始监控目录: {watch_path}")
-    
-    # 扫描目录中的未处理文件
-    for file_path in event_handler.file_index.scan_directory(watch_path):
-        event_handler.processing_queue.put_nowait(file_path)
-        logger.debug(f"添加未处理的文件到队列: {file_path}")
-    
-    observer.schedule(
-        event_handler,
-        path=watch_path,
-        recursive=FILE_MONITOR_CONFIG['recursive']
-    )
-    observer.start()
-    
-    # 创建多个处理队列的任务
     queue_workers = []
-    for _ in range(10):  # 增加并发处理任务数量到10个
-        worker = asyncio.create_task(process_queue(event_handler))
-        queue_workers.append(worker)
-    
+
     try:
+        observer.schedule(
+            event_handler,
+            path=watch_path,
+            recursive=FILE_MONITOR_CONFIG['recursive']
+        )
+        observer.start()
+
+        # 流水线各阶段的工作协程，协程数按各自的积压和处理耗时自动伸缩
+        queue_workers.append(asyncio.create_task(event_handler.pipeline.run()))
+        queue_workers.append(asyncio.create_task(report_stats(event_handler)))
+        queue_workers.append(asyncio.create_task(event_handler.readiness.run()))
+        # 扫描目录中的未处理文件，按处理队列的空位逐步交给就绪检查，同样等写完后再进入处理队列
+        queue_workers.append(asyncio.create_task(event_handler.scan_existing(watch_path)))
+        if event_handler.claims is not None:
+            queue_workers.append(asyncio.create_task(event_handler.reclaim()))
+        for drainer in event_handler.drainers():
+            queue_workers.append(asyncio.create_task(drainer.run()))
+
         # 等待直到被中断
         await asyncio.Event().wait()
-    except KeyboardInterrupt:
-        # 停止所有工作任务
+    finally:
+        # asyncio.run 中的 Ctrl-C 以 CancelledError 到达 main，异常退出时同样在这里停止任务并关闭所有资源
+        logger.info("正在停止 ETL 处理器")
         for worker in queue_workers:
             worker.cancel()
         await asyncio.gather(*queue_workers, return_exceptions=True)
-        observer.stop()
-    
-    observer.join()
+        if observer.is_alive():
+            observer.stop()
+            observer.join()
+        await event_handler.close()
 
 if __name__ == '__main__':
+    setup_logging()
     logger.info("ETL处理器启动")
     logger.info(f"监控目录: {FILE_MONITOR_CONFIG['watch_path']}")
     
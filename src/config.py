@@ -6,22 +6,195 @@ load_dotenv()
 
 # 数据库配置
 DB_CONFIG = {
-    'dbname': os.getenv('DB_NAME'),
-    'user': os.getenv('DB_USER'),
-    'password': os.getenv('DB_PASSWORD'),
-    'host': os.getenv('DB_HOST'),
-    'port': os.getenv('DB_PORT')
+    'dbname': os.getenv('DB_NAME', 'etl_db'),
+    'user': os.getenv('DB_USER', 'postgres'),
+    'password': os.getenv('DB_PASSWORD', 'postgres'),
+    'host': os.getenv('DB_HOST', 'localhost'),
+    'port': os.getenv('DB_PORT', '5432')
+}
+
+# 数据库连接池配置，所有处理协程共享同一个连接池
+DB_POOL_CONFIG = {
+    'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),     # 连接池最小连接数
+    'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 10)),    # 连接池最大连接数
+    'acquire_timeout': 30.0,                               # 等待空闲连接的超时时间（秒）
+    'connect_timeout': 10.0,                               # 建立新连接的超时时间（秒）
+    'max_inactive_connection_lifetime': 300.0,             # 空闲连接的最长保留时间（秒）
+    'max_concurrent_writes': int(os.getenv('DB_MAX_CONCURRENT_WRITES', 4))  # 同时进行的写入事务数上限
 }
 
 # 文件监控配置
 FILE_MONITOR_CONFIG = {
     'watch_path': os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data'),
     'recursive': False,
-    'patterns': ['*.csv']
+    'patterns': ['*.csv', '*.csv.gz', '*.csv.zst', '*.parquet', '*.arrow', '*.feather']
+}
+
+# 已处理文件索引配置
+FILE_INDEX_CONFIG = {
+    'db_file': 'file_index.sqlite3',    # SQLite 索引文件（WAL 模式）
+    'legacy_cache_file': 'file_index.db',  # 旧版 shelve 缓存，索引为空时导入一次
+    'bloom_file': 'file_index.bloom',   # 内存映射的布隆过滤器位图，启动时无需重建
+    'expected_items': 100000,           # 位图容量，超出后下次启动按两倍容量重建
+    'false_positive_rate': 0.001,
+    'group_commit_size': 64,            # 攒够该数量的标记后一起提交
+    'group_commit_interval': 1.0,       # 标记最多等待该秒数后提交
+    'checkpoint_commits': 1000,         # 每提交该次数后把 WAL 合并回主库
+    'content_hash': True,               # 新文件额外计算抽样内容哈希（大小和首尾各 64KB），相同时比较全文确认，跳过以新文件名重新投递的相同内容
+    'incremental_scan': True            # 启动扫描跳过早于上次水位的文件，关闭后全量扫描
+}
+
+# 文件就绪检查配置
+READINESS_CONFIG = {
+    'stable_seconds': 2.0,      # 没有关闭写入事件时，大小和修改时间保持不变超过该秒数才视为写完
+    'poll_interval': 0.5,       # 检查等待中的文件的间隔（秒）
+    'max_tracked': 1000         # 启动扫描的文件在等待中的文件达到该数量时暂停加入
+}
+
+# 处理队列和工作协程配置
+WORKER_CONFIG = {
+    'queue_maxsize': 1000,              # 处理队列最多积压的文件数，队列满时新文件等待入队
+    'priority': 'oldest',               # 出队顺序: oldest 按文件名时间戳从早到晚，smallest 小文件优先，fair 各数据源轮流，fifo 按入队顺序
+    'target_latency_seconds': 30.0,     # 阶段平均处理耗时超过该秒数时不再增加协程，并逐步减少
+    'scale_interval_seconds': 5.0       # 检查是否伸缩的间隔（秒）
+}
+
+# 流水线各阶段配置，工作协程数在 min_workers 到 max_workers 之间伸缩，
+# queue_size 为阶段输入队列的容量，满时上一阶段等待（0 表示 max_workers 的两倍）
+PIPELINE_CONFIG = {
+    'extract': {'min_workers': 2, 'max_workers': 6},                    # 从处理队列收集微批并提取
+    'transform': {'min_workers': 1, 'max_workers': 4, 'queue_size': 4}, # 使用进程池时并发数不超过进程数才有意义
+    'load': {'min_workers': 2, 'max_workers': 8, 'queue_size': 8}       # 写入缓冲或数据库
+}
+
+# 多实例工作认领配置，多个实例监控同一个共享目录时启用，认领目录须位于所有实例共享的存储上
+CLAIM_CONFIG = {
+    'enabled': bool(os.getenv('ETL_CLAIM_DIR')),
+    'claim_dir': os.getenv('ETL_CLAIM_DIR', 'claims'),  # 各实例必须使用同一个目录
+    'node_id': os.getenv('ETL_NODE_ID'),                # 实例标识，未设置时使用“主机名-进程号”
+    'lease_seconds': 60.0,              # 租约超过该秒数未续期视为持有者已停止，其他实例接管
+    'renew_interval': 15.0,             # 续期租约的间隔（秒）
+    'reclaim_interval': 30.0,           # 重试认领其他实例持有的文件的间隔（秒）
+    'partitions': int(os.getenv('ETL_PARTITIONS', 1)),  # 按文件名哈希分区的实例数，1 表示不分区
+    'partition': int(os.getenv('ETL_PARTITION', 0)),    # 本实例负责的分区序号
+    'partition_grace_seconds': 120.0    # 其他分区的文件超过该秒数仍未完成时本实例也可以认领
 }
 
 # 日志配置
 LOG_CONFIG = {
     'log_file': 'etl.log',
     'rotation': '500 MB'
+}
+
+# 微批合并配置
+BATCH_CONFIG = {
+    'max_rows': 5000,          # 单个微批的最大行数
+    'max_wait_seconds': 2.0,   # 收集微批的最长等待时间（秒）
+    'max_files': 100           # 单个微批的最大文件数
+}
+
+# 数据提取配置
+EXTRACT_CONFIG = {
+    'stream_threshold_bytes': 256 * 1024 * 1024,  # 超过该大小的文件使用流式分块提取
+    'stream_batch_rows': 100000,                  # 流式提取时每个批次的行数
+    'block_size': 4 * 1024 * 1024                 # pyarrow CSV 读取块大小（字节）
+}
+
+# CSV 解析格式缓存配置
+FORMAT_CACHE_CONFIG = {
+    'enabled': True,                    # 关闭后每个文件都按默认选项解析
+    'cache_file': 'format_cache.json',  # 按数据源保存分隔符、编码、列顺序和时间格式的缓存文件
+    'sample_rows': 200                  # 推断格式时使用的样本行数
+}
+
+# 提取和转换进程池配置
+PROCESS_POOL_CONFIG = {
+    'enabled': True,           # 关闭后在事件循环所在的进程中提取和转换
+    'max_workers': None,       # 工作进程数，None 表示 CPU 核数
+    'spool_dir': None,         # 进程间交换 Arrow IPC 文件的目录，None 表示 /dev/shm
+    'start_method': 'spawn'    # 工作进程的启动方式，避免 fork 复制监控线程和数据库连接
+}
+
+# 数据转换配置
+TRANSFORM_CONFIG = {
+    'engine': 'arrow',                      # 转换引擎: arrow（列式向量化）或 pandas（原实现）
+    'valid_status': ['completed', 'paid'],  # 保留的有效订单状态
+    # 从 log_info 中解析保留的字段，timestamp 输出为 log_timestamp 列
+    'log_info_fields': ['timestamp', 'device_model', 'os_version', 'browser',
+                        'browser_version', 'ip_address', 'user_agent'],
+    'output_columns': None                  # 转换输出的列，None 表示 Order 模型的全部字段
+}
+
+# 用户累计聚合配置
+USER_STATS_CONFIG = {
+    'enabled': True,              # 关闭后 avg_price 退回为单个批次内的用户平均值
+    'db_file': 'user_stats.db'    # 按用户累计聚合的 SQLite 文件
+}
+
+# 数据加载配置
+LOAD_CONFIG = {
+    # upsert 为 COPY 到临时暂存表后按 order_id 合并（重复加载是空操作），
+    # copy 为直接二进制 COPY，orm 为 Tortoise bulk_create
+    'mode': 'upsert',
+    'copy_batch_rows': 100000   # 单次 COPY 的最大行数，同一批次的所有分块在一个事务中提交
+}
+
+# 本地预写缓冲配置
+SPOOL_CONFIG = {
+    'enabled': True,                    # 关闭后转换结果直接写入数据库，写入成功才标记文件
+    'directory': 'spool',               # Arrow IPC 段文件目录，启动时重放其中未加载的批次
+    'max_bytes': 1024 * 1024 * 1024,    # 段文件总大小上限，超过后新的批次等待排空（背压）
+    'fsync': True,                      # 段文件写入后落盘再确认，关闭可提高吞吐但掉电可能丢失批次
+    'drain_workers': 2,                 # 并发排空到数据库的协程数
+    'retry_initial_seconds': 1.0,       # 加载失败后的首次重试间隔，之后按指数增长
+    'retry_max_seconds': 60.0,          # 重试间隔上限
+    'max_attempts': 5                   # 同一批次因数据错误加载失败该次数后移入 quarantine 子目录（连接错误不计）
+}
+
+# 数据写入目标配置
+SINK_CONFIG = {
+    # 可选 postgres、sqlite、parquet，配置多个时同一批次同时写入所有目标
+    'sinks': [name.strip() for name in os.getenv('ETL_SINKS', 'postgres').split(',') if name.strip()],
+    'sqlite': {
+        'db_file': 'orders.db',         # 嵌入式 SQLite 数据库文件
+        'table': 'orders'
+    },
+    'parquet': {
+        'root': 'lake/orders',          # 数据湖目录，按 order_day 和 province 分区
+        'row_group_rows': 100000,       # 每个行组的最大行数
+        'compact_min_files': 8,         # 分区内文件数达到该值时合并
+        'compression': 'zstd'
+    }
+}
+
+# 自适应写入批次配置
+ADAPTIVE_BATCH_CONFIG = {
+    'enabled': True,                    # 关闭后每个批次整批提交
+    'target_latency_seconds': 1.0,      # 单次提交的目标耗时
+    'initial_rows': 50000,              # 启动时的单次写入行数
+    'min_rows': 1000,                   # 单次写入行数下限
+    'max_rows': 500000,                 # 单次写入行数上限
+    'max_bytes': 256 * 1024 * 1024,     # 单次写入的内存上限（按批次每行内存占用估算）
+    'smoothing': 0.3                    # 提交耗时和吞吐的指数加权系数，越大对最近的提交越敏感
+}
+
+# 跨文件订单去重索引配置
+ORDER_INDEX_CONFIG = {
+    'enabled': True,                    # 关闭后只在单个批次内去重
+    'db_file': 'order_index.db',        # 已加载 order_id 的 SQLite 精确索引
+    'bloom_file': 'order_index.bloom',  # 布隆过滤器的保存文件
+    'initial_capacity': 1000000,        # 布隆过滤器的初始容量，超出后自动扩展
+    'error_rate': 0.001                 # 布隆过滤器的误判率，误判只会多一次精确索引查询
+}
+
+# 流式统计配置
+STATS_CONFIG = {
+    'enabled': True,                # 关闭后不再累加分布和分位数统计
+    'sample_rate': 1.0,             # 抽样比例，小于 1 时按比例抽样并按权重还原计数
+    'window_seconds': 60,           # 统计窗口长度（秒）
+    'retention_windows': 60,        # 保留的窗口个数
+    'report_interval_seconds': 60,  # 定期输出统计汇总的间隔（秒）
+    'relative_accuracy': 0.01,      # 金额分位数的相对误差上限
+    # 统计分布的维度，device_model 缺失时从 log_info 中提取
+    'dimensions': ['order_status', 'payment_method', 'province', 'device_model', 'order_date']
 }
\ No newline at end of file
@@ -2,4 +2,5 @@
 # This package contains the core ETL components:
 # - extractor: Handles data extraction from CSV files
 # - transformer: Implements data transformation logic
-# - loader: Manages data loading into PostgreSQL
\ No newline at end of file
+# - loader: Manages data loading into PostgreSQL
+# - sinks: Sink interface and fan-out; sqlite_sink and parquet_sink are embedded and lake backends
\ No newline at end of file
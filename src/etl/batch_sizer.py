@@ -0,0 +1,83 @@
+import pandas as pd
+from loguru import logger
+from typing import Optional
+
+class AdaptiveBatchSizer:
+    """根据最近的提交耗时调整单次写入的行数，使每次提交接近目标耗时
+
+    按指数加权平均估计写入吞吐（行/秒），目标行数 = 吞吐 × 目标耗时；
+    每次调整最多放大或缩小 max_step 倍，避免单次异常耗时造成抖动，
+    并受最小、最大行数和单批内存上限约束。
+    """
+
+    def __init__(self, target_latency: float = 1.0, initial_rows: int = 50000, min_rows: int = 1000,
+                 max_rows: int = 500000, max_bytes: int = 256 * 1024 * 1024, smoothing: float = 0.3,
+                 max_step: float = 2.0):
+        self.target_latency = target_latency
+        self.min_rows = min_rows
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.smoothing = smoothing
+        self.max_step = max_step
+        self.rows = self._clamp(initial_rows)
+        # 指标
+        self.throughput: Optional[float] = None
+        self.latency: Optional[float] = None
+        self.bytes_per_row: Optional[float] = None
+        self.samples = 0
+        self.adjustments = 0
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'AdaptiveBatchSizer':
+        return cls(
+            target_latency=config['target_latency_seconds'],
+            initial_rows=config['initial_rows'],
+            min_rows=config['min_rows'],
+            max_rows=config['max_rows'],
+            max_bytes=config['max_bytes'],
+            smoothing=config['smoothing']
+        )
+
+    def _clamp(self, rows: float) -> int:
+        return int(max(self.min_rows, min(self.max_rows, rows)))
+
+    def _ewma(self, current: Optional[float], value: float) -> float:
+        return value if current is None else current + self.smoothing * (value - current)
+
+    def observe(self, df: pd.DataFrame) -> None:
+        """记录待写入数据的每行内存占用，用于限制单次写入的内存"""
+        if len(df):
+            row_bytes = df.memory_usage(index=False, deep=False).sum() / len(df)
+            self.bytes_per_row = self._ewma(self.bytes_per_row, row_bytes)
+
+    def batch_rows(self) -> int:
+        """返回当前的单次写入行数，按每行内存占用限制在 max_bytes 以内"""
+        if self.bytes_per_row:
+            return max(1, min(self.rows, int(self.max_bytes / self.bytes_per_row)))
+        return self.rows
+
+    def record(self, rows: int, seconds: float) -> None:
+        """记录一次提交的行数和耗时，并调整下一次的写入行数"""
+        if rows <= 0 or seconds <= 0:
+            return
+        self.samples += 1
+        self.latency = self._ewma(self.latency, seconds)
+        self.throughput = self._ewma(self.throughput, rows / seconds)
+        target = self.throughput * self.target_latency
+        target = max(self.rows / self.max_step, min(self.rows * self.max_step, target))
+        rows = self._clamp(target)
+        if rows != self.rows:
+            self.adjustments += 1
+            logger.debug(f"调整写入批次行数: {self.rows} -> {rows}（吞吐 {self.throughput:.0f}行/秒，"
+                         f"平均提交耗时 {self.latency:.2f}秒）")
+            self.rows = rows
+
+    def metrics(self) -> dict:
+        return {
+            'batch_rows': self.batch_rows(),
+            'target_latency': self.target_latency,
+            'latency': self.latency or 0.0,
+            'throughput': self.throughput or 0.0,
+            'samples': self.samples,
+            'adjustments': self.adjustments
+        }
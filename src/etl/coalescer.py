@@ -0,0 +1,115 @@
+import time
+import asyncio
+from collections import deque
+import pandas as pd
+from loguru import logger
+from typing import Awaitable, Callable, Deque, List, Optional
+
+class MicroBatch:
+    """由多个小文件合并而成的微批"""
+
+    def __init__(self, queue: asyncio.Queue):
+        self.queue = queue
+        self.files: List[str] = []
+        # 每个文件提取出的数据，使用进程池时为保存在 IPC 文件中的 ArrowHandle
+        self.frames: List[pd.DataFrame] = []
+        # 提取失败、没有进入微批的文件
+        self.failed: List[str] = []
+        # 需要流式分块处理的大文件，此时微批只包含这一个文件
+        self.stream_file: Optional[str] = None
+        self.taken = 0
+        self.extract_time = 0.0
+
+    @property
+    def rows(self) -> int:
+        return sum(len(frame) for frame in self.frames)
+
+    def to_frame(self) -> pd.DataFrame:
+        """将微批内的所有文件数据合并为一个DataFrame"""
+        if len(self.frames) == 1:
+            return self.frames[0]
+        return pd.concat(self.frames, ignore_index=True)
+
+    def task_done(self) -> None:
+        """将微批从队列中取出的所有任务标记为完成"""
+        for _ in range(self.taken):
+            self.queue.task_done()
+        self.taken = 0
+
+class MicroBatchCoalescer:
+    """从处理队列中收集文件并合并为微批，按行数、文件数或最长等待时间切分"""
+
+    def __init__(self, queue: asyncio.Queue, extract: Callable[[str], Awaitable[Optional[pd.DataFrame]]],
+                 max_rows: int = 5000, max_wait_seconds: float = 2.0, max_files: int = 100,
+                 should_stream: Optional[Callable[[str], bool]] = None):
+        self.queue = queue
+        self.extract = extract
+        self.should_stream = should_stream
+        # 收集过程中遇到的大文件，留给下一个微批单独处理
+        self._deferred: Deque[str] = deque()
+        self.max_rows = max_rows
+        self.max_wait_seconds = max_wait_seconds
+        self.max_files = max_files
+        # 已取到第一个文件、正在收集和提取的微批数
+        self.collecting = 0
+
+    async def next_batch(self) -> MicroBatch:
+        """等待第一个文件到达后开始收集，直到达到行数/文件数上限或等待超时"""
+        batch = MicroBatch(self.queue)
+        file_path = self._deferred.popleft() if self._deferred else await self.queue.get()
+        batch.taken += 1
+        self.collecting += 1
+        try:
+            return await self._collect(batch, file_path)
+        finally:
+            self.collecting -= 1
+
+    async def _collect(self, batch: MicroBatch, file_path: str) -> MicroBatch:
+        if self._is_large(file_path):
+            batch.stream_file = file_path
+            logger.debug(f"大文件单独使用流式处理: {file_path}")
+            return batch
+
+        deadline = time.monotonic() + self.max_wait_seconds
+        rows = await self._add_file(batch, file_path)
+
+        while rows < self.max_rows and batch.taken < self.max_files:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                file_path = await asyncio.wait_for(self.queue.get(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+            if self._is_large(file_path):
+                self._deferred.append(file_path)
+                break
+            batch.taken += 1
+            rows += await self._add_file(batch, file_path)
+
+        logger.debug(f"微批收集完成，文件数: {len(batch.files)}，数据行数: {rows}")
+        return batch
+
+    def _is_large(self, file_path: str) -> bool:
+        return self.should_stream is not None and self.should_stream(file_path)
+
+    async def _add_file(self, batch: MicroBatch, file_path: str) -> int:
+        """提取单个文件并加入微批，提取失败的文件不会进入微批"""
+        extract_start = time.time()
+        try:
+            df = await self.extract(file_path)
+        except Exception as e:
+            logger.error(f"数据提取过程发生错误: {file_path}, {str(e)}")
+            batch.failed.append(file_path)
+            return 0
+        finally:
+            batch.extract_time += time.time() - extract_start
+
+        if df is None:
+            logger.warning(f"文件提取失败: {file_path}")
+            batch.failed.append(file_path)
+            return 0
+
+        batch.files.append(file_path)
+        batch.frames.append(df)
+        return len(df)
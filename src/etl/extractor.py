@@ -1,18 +1,226 @@
+import os
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from pyarrow import csv as pa_csv
 from loguru import logger
-from typing import Optional
+from typing import Dict, Iterator, List, Optional
+from .format_cache import ISO_FORMATS, FormatCache
+from .schema import ORDER_SCHEMA, column_types
+from ..config import EXTRACT_CONFIG, FORMAT_CACHE_CONFIG
+
+# 文件后缀与数据格式的对应关系，压缩的 CSV 由 pyarrow 根据后缀自动解压
+FILE_FORMATS = {
+    '.csv': 'csv',
+    '.csv.gz': 'csv',
+    '.csv.bz2': 'csv',
+    '.csv.zst': 'csv',
+    '.parquet': 'parquet',
+    '.arrow': 'ipc',
+    '.feather': 'ipc',
+    '.ipc': 'ipc'
+}
+
+def detect_format(file_path: str) -> Optional[str]:
+    """根据文件后缀判断数据格式，无法识别时返回 None"""
+    name = file_path.lower()
+    for suffix in sorted(FILE_FORMATS, key=len, reverse=True):
+        if name.endswith(suffix):
+            return FILE_FORMATS[suffix]
+    return None
 
 class CSVExtractor:
-    def __init__(self):
-        pass
+    """订单文件提取器，支持 CSV（含压缩）、Parquet 和 Arrow IPC 格式"""
+
+    def __init__(self, columns: Optional[List[str]] = None, format_cache: Optional[FormatCache] = None):
+        # columns 为需要读取的列，None 表示读取全部列
+        self.columns = columns
+        # 按数据源缓存的 CSV 解析格式，未启用时沿用默认的解析选项
+        if format_cache is None and FORMAT_CACHE_CONFIG['enabled']:
+            format_cache = FormatCache(FORMAT_CACHE_CONFIG['cache_file'], FORMAT_CACHE_CONFIG['sample_rows'])
+        self.format_cache = format_cache
+        self.convert_options = self._convert_options(columns)
+        self.stream_threshold_bytes = EXTRACT_CONFIG['stream_threshold_bytes']
+        self.stream_batch_rows = EXTRACT_CONFIG['stream_batch_rows']
+        self.read_options = pa_csv.ReadOptions(block_size=EXTRACT_CONFIG['block_size'])
+
+    @staticmethod
+    def _convert_options(columns: Optional[List[str]]) -> pa_csv.ConvertOptions:
+        """基于 Order 模型的 Schema 构建类型化解析选项"""
+        return pa_csv.ConvertOptions(
+            column_types=column_types(columns),
+            include_columns=columns,
+            strings_can_be_null=True
+        )
+
+    def _csv_options(self, file_path: str, columns: Optional[List[str]]):
+        """返回 CSV 的 (读取选项, 解析选项, 转换选项, 时间格式)，有缓存时按数据源的固定格式解析"""
+        convert_options = self.convert_options if columns == self.columns else self._convert_options(columns)
+        if self.format_cache is None:
+            return self.read_options, pa_csv.ParseOptions(), convert_options, {}
+        profile = self.format_cache.lookup(file_path)
+
+        types = dict(convert_options.column_types)
+        datetime_formats = {name: fmt for name, fmt in profile['datetime_formats'].items() if name in types}
+        timestamp_parsers = []
+        for name, fmt in datetime_formats.items():
+            if fmt is None:
+                # 没有统一格式的列按字符串读取，之后逐个推断
+                types[name] = pa.string()
+            elif fmt in ISO_FORMATS:
+                if pa_csv.ISO8601 not in timestamp_parsers:
+                    timestamp_parsers.insert(0, pa_csv.ISO8601)
+            elif fmt not in timestamp_parsers:
+                timestamp_parsers.append(fmt)
+        read_options = pa_csv.ReadOptions(
+            block_size=self.read_options.block_size,
+            encoding=profile['encoding'],
+            column_names=profile['columns'],
+            skip_rows=1
+        )
+        convert_options = pa_csv.ConvertOptions(
+            column_types=types,
+            include_columns=convert_options.include_columns,
+            strings_can_be_null=True,
+            timestamp_parsers=timestamp_parsers or None
+        )
+        return read_options, pa_csv.ParseOptions(delimiter=profile['delimiter']), convert_options, datetime_formats
+
+    @staticmethod
+    def _parse_datetimes(data, datetime_formats: Dict[str, Optional[str]]):
+        """将按字符串读取的时间列解析为时间戳，没有固定格式时逐个推断"""
+        for name, fmt in datetime_formats.items():
+            if name not in data.column_names or not pa.types.is_string(data.schema.field(name).type):
+                continue
+            values = pd.to_datetime(data[name].to_pandas(), format=fmt or 'mixed')
+            data = data.set_column(data.schema.get_field_index(name), name,
+                                   pa.array(values, type=ORDER_SCHEMA.field(name).type, from_pandas=True))
+        return data
+
+    def _read_csv(self, file_path: str, columns: Optional[List[str]]) -> pa.Table:
+        read_options, parse_options, convert_options, datetime_formats = self._csv_options(file_path, columns)
+        try:
+            table = pa_csv.read_csv(file_path, read_options=read_options, parse_options=parse_options,
+                                    convert_options=convert_options)
+        except pa.ArrowInvalid as e:
+            if self.format_cache is None or not datetime_formats:
+                raise
+            logger.warning(f"文件 {file_path} 与缓存的解析格式不符，重新推断: {str(e)}")
+            # 时间列先按字符串读取，根据整个文件的取值重新确定格式并更新缓存
+            types = dict(convert_options.column_types)
+            types.update({name: pa.string() for name in datetime_formats})
+            convert_options = pa_csv.ConvertOptions(column_types=types, include_columns=convert_options.include_columns,
+                                                    strings_can_be_null=True)
+            table = pa_csv.read_csv(file_path, read_options=read_options, parse_options=parse_options,
+                                    convert_options=convert_options)
+            cached = self.format_cache.lookup(file_path)
+            profile = self.format_cache.refine(cached, {
+                name: pc.unique(table[name]).drop_null().to_pylist() for name in datetime_formats
+            })
+            datetime_formats = {name: profile['datetime_formats'][name] for name in datetime_formats}
+            # 只有找到新的统一格式才更新缓存，个别文件格式混杂时不影响同一数据源的后续文件
+            changed = {name: fmt for name, fmt in datetime_formats.items() if fmt is not None}
+            if changed:
+                self.format_cache.update(file_path, {
+                    **cached, 'datetime_formats': {**cached['datetime_formats'], **changed}
+                })
+        return self._parse_datetimes(table, datetime_formats)
+
+    @staticmethod
+    def _conform(data):
+        """将自带 Schema 的列式数据（Parquet/IPC）转换为 Order Schema 的类型，类型一致的列不做复制"""
+        fields = []
+        changed = False
+        for field in data.schema:
+            if field.name in ORDER_SCHEMA.names and field.type != ORDER_SCHEMA.field(field.name).type:
+                field = field.with_type(ORDER_SCHEMA.field(field.name).type)
+                changed = True
+            fields.append(field)
+        return data.cast(pa.schema(fields)) if changed else data
+
+    def should_stream(self, file_path: str) -> bool:
+        """判断文件是否需要使用流式分块提取"""
+        try:
+            return os.path.getsize(file_path) > self.stream_threshold_bytes
+        except OSError:
+            return False
+
+    def read_table(self, file_path: str, columns: Optional[List[str]] = None) -> pa.Table:
+        """按文件格式读取整个文件，Parquet 和 Arrow IPC 通过内存映射零拷贝读取"""
+        columns = columns if columns is not None else self.columns
+        file_format = detect_format(file_path)
+        if file_format == 'parquet':
+            return self._conform(pq.read_table(file_path, columns=columns, memory_map=True))
+        if file_format == 'ipc':
+            table = self._open_ipc(file_path).read_all()
+            return self._conform(table.select(columns) if columns is not None else table)
+        if file_format == 'csv':
+            return self._read_csv(file_path, columns)
+        raise ValueError(f"不支持的文件格式: {file_path}")
+
+    @staticmethod
+    def _open_ipc(file_path: str):
+        """以内存映射方式打开 Arrow IPC 文件，兼容 file 和 stream 两种格式"""
+        source = pa.memory_map(file_path, 'r')
+        try:
+            return pa.ipc.open_file(source)
+        except pa.ArrowInvalid:
+            source.seek(0)
+            return pa.ipc.open_stream(source)
+
+    def _iter_record_batches(self, file_path: str, batch_rows: int,
+                             columns: Optional[List[str]]) -> Iterator[pa.RecordBatch]:
+        """按文件格式逐块读取记录批次"""
+        file_format = detect_format(file_path)
+        if file_format == 'parquet':
+            parquet_file = pq.ParquetFile(file_path, memory_map=True)
+            for record_batch in parquet_file.iter_batches(batch_size=batch_rows, columns=columns):
+                yield self._conform(record_batch)
+        elif file_format == 'ipc':
+            reader = self._open_ipc(file_path)
+            if isinstance(reader, pa.ipc.RecordBatchFileReader):
+                record_batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+            else:
+                record_batches = iter(reader)
+            for record_batch in record_batches:
+                yield self._conform(record_batch.select(columns) if columns is not None else record_batch)
+        elif file_format == 'csv':
+            read_options, parse_options, convert_options, datetime_formats = self._csv_options(file_path, columns)
+            for record_batch in pa_csv.open_csv(file_path, read_options=read_options, parse_options=parse_options,
+                                                convert_options=convert_options):
+                yield self._parse_datetimes(record_batch, datetime_formats)
+        else:
+            raise ValueError(f"不支持的文件格式: {file_path}")
+
+    def iter_tables(self, file_path: str, batch_rows: Optional[int] = None,
+                    columns: Optional[List[str]] = None) -> Iterator[pa.Table]:
+        """流式读取文件，按固定行数切分为多个批次，内存占用只与批次大小相关"""
+        batch_rows = batch_rows or self.stream_batch_rows
+        columns = columns if columns is not None else self.columns
+
+        pending: List[pa.RecordBatch] = []
+        pending_rows = 0
+        for record_batch in self._iter_record_batches(file_path, batch_rows, columns):
+            pending.append(record_batch)
+            pending_rows += record_batch.num_rows
+            while pending_rows >= batch_rows:
+                table = pa.Table.from_batches(pending)
+                yield table.slice(0, batch_rows)
+                rest = table.slice(batch_rows)
+                pending = rest.to_batches()
+                pending_rows = rest.num_rows
+        if pending_rows:
+            yield pa.Table.from_batches(pending)
 
-    async def extract(self, file_path: str) -> Optional[pd.DataFrame]:
-        """从CSV文件中提取数据"""
+    async def extract(self, file_path: str, columns: Optional[List[str]] = None) -> Optional[pd.DataFrame]:
+        """从订单文件中提取数据"""
         try:
             logger.info(f"开始读取文件: {file_path}")
-            df = pd.read_csv(file_path, dtype_backend='pyarrow')
+            table = self.read_table(file_path, columns)
+            df = table.to_pandas(types_mapper=pd.ArrowDtype)
             logger.info(f"成功读取文件: {file_path}, 共 {len(df)} 行数据")
             return df
         except Exception as e:
             logger.error(f"读取文件 {file_path} 时发生错误: {str(e)}")
-            raise
\ No newline at end of file
+            raise
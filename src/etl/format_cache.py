@@ -0,0 +1,200 @@
+import os
+import re
+import csv
+import json
+import hashlib
+import threading
+from datetime import datetime
+import pyarrow as pa
+from loguru import logger
+from typing import Dict, List, Optional
+from .schema import ORDER_SCHEMA
+
+# 依次尝试的文件编码，订单文件中含中文，utf-8 之后优先尝试 gb18030
+ENCODINGS = ['utf-8', 'gb18030', 'latin-1']
+
+# 候选的分隔符
+DELIMITERS = ',;\t|'
+
+# 依次尝试的日期时间格式，日/月顺序有歧义时以先匹配全部样本的格式为准
+DATETIME_FORMATS = [
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%dT%H:%M:%S',
+    '%Y-%m-%d %H:%M:%S.%f',
+    '%Y-%m-%dT%H:%M:%S.%f',
+    '%Y-%m-%d %H:%M',
+    '%Y-%m-%d',
+    '%Y/%m/%d %H:%M:%S',
+    '%Y/%m/%d %H:%M',
+    '%Y/%m/%d',
+    '%d/%m/%Y %H:%M:%S',
+    '%m/%d/%Y %H:%M:%S',
+    '%d.%m.%Y %H:%M:%S',
+    '%Y%m%d%H%M%S',
+    '%Y%m%d'
+]
+
+# pyarrow 内置 ISO8601 解析器可以直接处理的格式，无需逐个 strptime
+ISO_FORMATS = {
+    '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S.%f',
+    '%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%d %H:%M', '%Y-%m-%d'
+}
+
+# 读取文件开头用于识别格式的字节数
+HEAD_BYTES = 64 * 1024
+
+def timestamp_columns(columns: List[str]) -> List[str]:
+    """返回列名中按 Order Schema 应解析为时间戳的列"""
+    return [name for name in columns if name in ORDER_SCHEMA.names and pa.types.is_timestamp(ORDER_SCHEMA.field(name).type)]
+
+def detect_datetime_format(values: List[str]) -> Optional[str]:
+    """返回能解析全部样本的固定格式，没有时返回 None（需要逐个推断）"""
+    values = [value for value in values if value]
+    if not values:
+        return None
+    for fmt in DATETIME_FORMATS:
+        try:
+            for value in values:
+                datetime.strptime(value, fmt)
+            return fmt
+        except ValueError:
+            continue
+    return None
+
+class FormatCache:
+    """按数据源缓存 CSV 文件的解析格式
+
+    同一个生产方发送的文件布局固定，以文件名前缀和表头签名作为数据源的键，
+    记住识别出的分隔符、编码、列顺序和每个时间列的精确格式，之后的文件直接按固定格式解析；
+    文件与缓存不符时回退到重新推断并更新缓存。
+    read_only 为 True 时（处理进程中）不写缓存文件，新识别的格式只保存在内存中，
+    由主进程通过 drain 取出后 merge 到自己的缓存并保存，缓存文件只有主进程一个写入方。
+    """
+
+    def __init__(self, cache_file: str = 'format_cache.json', sample_rows: int = 200, read_only: bool = False):
+        self.cache_file = cache_file
+        self.sample_rows = sample_rows
+        self.read_only = read_only
+        self.lock = threading.Lock()
+        self.profiles: Dict[str, dict] = {}
+        # 只读模式下尚未交给主进程保存的格式
+        self.learned: Dict[str, dict] = {}
+        self._load_cache()
+
+    def _load_cache(self) -> None:
+        try:
+            if os.path.exists(self.cache_file):
+                with open(self.cache_file, encoding='utf-8') as f:
+                    self.profiles = json.load(f)
+                logger.info(f"成功加载解析格式缓存，共 {len(self.profiles)} 个数据源")
+        except Exception as e:
+            logger.error(f"加载解析格式缓存时发生错误: {str(e)}")
+            self.profiles = {}
+
+    def save_cache(self) -> None:
+        """先写临时文件再替换，避免中途失败留下不完整的缓存"""
+        try:
+            with self.lock:
+                data = json.dumps(self.profiles, ensure_ascii=False, indent=2)
+            tmp_file = f"{self.cache_file}.{os.getpid()}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_file, self.cache_file)
+        except Exception as e:
+            logger.error(f"保存解析格式缓存时发生错误: {str(e)}")
+
+    @staticmethod
+    def _read_head(file_path: str) -> bytes:
+        """读取文件开头的字节，压缩文件按后缀自动解压"""
+        with pa.input_stream(file_path, compression='detect') as stream:
+            return stream.read(HEAD_BYTES)
+
+    @staticmethod
+    def source_prefix(file_path: str) -> str:
+        """文件名去掉扩展名和末尾的时间戳、序号后作为数据源前缀"""
+        name = os.path.basename(file_path).split('.', 1)[0]
+        return re.sub(r'[\d_\-]+$', '', name) or name
+
+    def source_key(self, file_path: str, head: bytes) -> str:
+        header = head.split(b'\n', 1)[0].rstrip(b'\r')
+        return f"{self.source_prefix(file_path)}:{hashlib.sha1(header).hexdigest()[:16]}"
+
+    def lookup(self, file_path: str) -> dict:
+        """返回文件对应数据源的解析格式，缓存未命中时从文件开头推断并写入缓存"""
+        head = self._read_head(file_path)
+        key = self.source_key(file_path, head)
+        with self.lock:
+            profile = self.profiles.get(key)
+        if profile is not None:
+            return profile
+        profile = self.infer(head)
+        logger.info(f"识别数据源 {key} 的解析格式: 分隔符 {profile['delimiter']!r}, 编码 {profile['encoding']}, "
+                    f"时间格式 {profile['datetime_formats']}")
+        self.update(file_path, profile, head)
+        return profile
+
+    def update(self, file_path: str, profile: dict, head: Optional[bytes] = None) -> None:
+        key = self.source_key(file_path, head if head is not None else self._read_head(file_path))
+        with self.lock:
+            self.profiles[key] = profile
+            if self.read_only:
+                self.learned[key] = profile
+                return
+        self.save_cache()
+
+    def drain(self) -> Dict[str, dict]:
+        """取出并清空只读模式下新识别的格式"""
+        with self.lock:
+            learned, self.learned = self.learned, {}
+        return learned
+
+    def merge(self, profiles: Dict[str, dict]) -> None:
+        """合并处理进程识别的格式并保存"""
+        if not profiles:
+            return
+        with self.lock:
+            self.profiles.update(profiles)
+        self.save_cache()
+
+    def infer(self, head: bytes) -> dict:
+        """从文件开头推断编码、分隔符、列顺序和时间列格式"""
+        text, encoding = None, ENCODINGS[-1]
+        for encoding in ENCODINGS:
+            try:
+                text = head.decode(encoding)
+                break
+            except UnicodeDecodeError as e:
+                # 截断在多字节字符中间时只丢弃末尾不完整的字符
+                if e.start >= len(head) - 4:
+                    text = head[:e.start].decode(encoding)
+                    break
+        lines = text.lstrip('\ufeff').splitlines()
+        if len(head) == HEAD_BYTES and len(lines) > 1:
+            # 最后一行可能被截断
+            lines = lines[:-1]
+        lines = lines[:self.sample_rows + 1]
+
+        # 表头中一般不含引号包裹的字段，出现次数最多的候选字符即为分隔符
+        header = lines[0] if lines else ''
+        delimiter = max(DELIMITERS, key=header.count) if any(d in header for d in DELIMITERS) else ','
+        rows = list(csv.reader(lines, delimiter=delimiter))
+        columns = rows[0] if rows else []
+        samples = rows[1:]
+
+        datetime_formats = {}
+        for name in timestamp_columns(columns):
+            index = columns.index(name)
+            datetime_formats[name] = detect_datetime_format([row[index] for row in samples if len(row) > index])
+        return {
+            'delimiter': delimiter,
+            'encoding': encoding,
+            'columns': columns,
+            'datetime_formats': datetime_formats
+        }
+
+    def refine(self, profile: dict, values: Dict[str, List[str]]) -> dict:
+        """根据整个文件中时间列的取值重新确定格式，用于固定格式解析失败后的回退"""
+        datetime_formats = dict(profile['datetime_formats'])
+        for name, column_values in values.items():
+            datetime_formats[name] = detect_datetime_format(column_values)
+        return {**profile, 'datetime_formats': datetime_formats}
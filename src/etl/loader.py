@@ -1,31 +1,205 @@
-import psycopg2
+import time
 from loguru import logger
 import pandas as pd
-from typing import Optional
-from tortoise import Tortoise
-from ..models import Order, DATABASE_CONFIG
+import pyarrow as pa
+from asyncpg.exceptions import FeatureNotSupportedError
+from typing import Dict, Iterator, Optional
+from ..config import LOAD_CONFIG, ORDER_INDEX_CONFIG, ADAPTIVE_BATCH_CONFIG
+from ..models import Order
+from ..utils.db_pool import DatabasePool, WriterGroup
+from ..utils.migrations import apply_migrations
+from ..utils.order_index import OrderIndex
+from .batch_sizer import AdaptiveBatchSizer
+from .sinks import Sink
 
-class PostgresLoader:
-    def __init__(self):
-        self.initialized = False
+# 数据库或连接不支持 COPY 时的错误，只有这些错误回退到 ORM 写入；数据错误和连接错误直接抛出
+COPY_UNSUPPORTED_ERRORS = (FeatureNotSupportedError, NotImplementedError)
 
-    async def _ensure_db_initialized(self):
-        if not self.initialized:
-            await Tortoise.init(config=DATABASE_CONFIG)
-            self.initialized = True
+class PostgresLoader(Sink):
+    name = 'postgres'
+    # 合并写入使用的临时暂存表
+    STAGING_TABLE = 'orders_staging'
+
+    def __init__(self, order_index: Optional[OrderIndex] = None, mode: Optional[str] = None,
+                 pool: Optional[DatabasePool] = None, writers: Optional[WriterGroup] = None,
+                 sizer: Optional[AdaptiveBatchSizer] = None):
+        # 所有处理协程共享的连接池，以及限制同时写入事务数的写入组
+        self.pool = pool or DatabasePool()
+        self.writers = writers or WriterGroup()
+        # 写入方式: upsert 为 COPY 到暂存表后合并，copy 为直接二进制 COPY，orm 为原有的 Tortoise bulk_create
+        self.mode = mode or LOAD_CONFIG['mode']
+        self.copy_batch_rows = LOAD_CONFIG['copy_batch_rows']
+        # orders 表的列名及类型，首次 COPY 时查询
+        self.table_columns: Optional[Dict[str, str]] = None
+        # 跨文件的 order_id 索引，已加载过的订单在写入数据库前丢弃
+        if order_index is None and ORDER_INDEX_CONFIG['enabled']:
+            order_index = OrderIndex(
+                ORDER_INDEX_CONFIG['db_file'],
+                ORDER_INDEX_CONFIG['bloom_file'],
+                ORDER_INDEX_CONFIG['initial_capacity'],
+                ORDER_INDEX_CONFIG['error_rate']
+            )
+        self.order_index = order_index
+        # 按最近的提交耗时拆分写入批次，未启用时整批写入
+        if sizer is None and ADAPTIVE_BATCH_CONFIG['enabled']:
+            sizer = AdaptiveBatchSizer.from_config(ADAPTIVE_BATCH_CONFIG)
+        self.sizer = sizer
+
+    def _drop_loaded(self, df: pd.DataFrame) -> pd.DataFrame:
+        """丢弃已经加载过或正在由其他批次写入的订单"""
+        keep = self.order_index.reserve(df['order_id'].tolist())
+        dropped = len(keep) - sum(keep)
+        if dropped:
+            logger.info(f"跨文件去重:\n- 已加载的订单数: {dropped}条\n- 待写入订单数: {len(keep) - dropped}条")
+            df = df[keep]
+        return df
+
+    async def _fetch_column_types(self, conn) -> Dict[str, str]:
+        rows = await conn.fetch(
+            'SELECT column_name, data_type FROM information_schema.columns '
+            'WHERE table_schema = current_schema() AND table_name = $1 ORDER BY ordinal_position',
+            Order._meta.db_table
+        )
+        return {row['column_name']: row['data_type'] for row in rows}
+
+    async def _table_column_types(self, conn) -> Dict[str, str]:
+        """首次写入时查询 orders 表的列，缺少 Order 模型中的列时先执行结构变更"""
+        if self.table_columns is None:
+            column_types = await self._fetch_column_types(conn)
+            missing = [name for name in Order._meta.db_fields if name not in column_types]
+            if missing:
+                logger.warning(f"orders 表缺少列 {missing}，执行数据库结构变更")
+                await apply_migrations(conn)
+                column_types = await self._fetch_column_types(conn)
+            self.table_columns = column_types
+        return self.table_columns
+
+    @staticmethod
+    def _copy_ready(table: pa.Table, column_types: Dict[str, str]) -> pa.Table:
+        """解码字典列；与 ORM 一致，不带时区的时间按 UTC 写入 timestamptz 列（asyncpg 会把不带时区的时间当作本地时间）"""
+        for index, name in enumerate(table.column_names):
+            values = table[name]
+            if pa.types.is_dictionary(values.type):
+                values = values.cast(values.type.value_type)
+            if pa.types.is_timestamp(values.type) and values.type.tz is None \
+                    and column_types[name] == 'timestamp with time zone':
+                values = values.cast(pa.timestamp(values.type.unit, 'UTC'))
+            table = table.set_column(index, name, values)
+        return table
+
+    @staticmethod
+    def _records(table: pa.Table) -> Iterator[tuple]:
+        """按列转换为 Python 值后逐行组成元组，不创建 ORM 对象"""
+        return zip(*(column.to_pylist() for column in table.columns))
+
+    async def _copy_table(self, conn, table_name: str, table: pa.Table, column_types: Dict[str, str]) -> None:
+        """按 copy_batch_rows 分块，通过 asyncpg 的二进制 COPY 写入指定的表"""
+        if not hasattr(conn, 'copy_records_to_table'):
+            raise NotImplementedError(f"数据库连接 {type(conn).__name__} 不支持 COPY")
+        table = self._copy_ready(table, column_types)
+        for offset in range(0, table.num_rows, self.copy_batch_rows):
+            chunk = table.slice(offset, self.copy_batch_rows)
+            await conn.copy_records_to_table(table_name, records=self._records(chunk), columns=table.column_names)
+
+    def _load_columns(self, table: pa.Table, column_types: Dict[str, str]) -> pa.Table:
+        """选出写入 orders 的列，主键由数据库生成
+
+        Order 模型中的列在表中不存在时抛出异常，不静默丢弃；不属于模型的列（例如中间列）与 ORM 一致忽略。
+        """
+        missing = [name for name in table.column_names
+                   if name in Order._meta.db_fields and name not in column_types]
+        if missing:
+            raise ValueError(f"orders 表缺少列 {missing}，请执行 python -m src.utils.migrations")
+        return table.select([name for name in table.column_names if name in column_types and name != Order._meta.pk_attr])
+
+    async def _copy(self, df: pd.DataFrame) -> None:
+        """通过二进制 COPY 直接写入 orders，所有分块在同一个事务中提交"""
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        async with self.pool.acquire() as conn:
+            column_types = await self._table_column_types(conn)
+            table = self._load_columns(table, column_types)
+            async with conn.transaction():
+                await self._copy_table(conn, Order._meta.db_table, table, column_types)
+
+    async def _upsert(self, df: pd.DataFrame) -> None:
+        """先 COPY 到临时暂存表，再在同一个事务中合并到 orders，已存在的 order_id 直接跳过
+
+        临时表不写 WAL，每个连接各有一份，提交时自动清空；重复处理同一批数据只是一次空合并。
+        """
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        async with self.pool.acquire() as conn:
+            column_types = await self._table_column_types(conn)
+            table = self._load_columns(table, column_types)
+            staging_columns = ', '.join(name for name in column_types if name != Order._meta.pk_attr)
+            columns = ', '.join(table.column_names)
+            async with conn.transaction():
+                await conn.execute(
+                    f'CREATE TEMP TABLE IF NOT EXISTS {self.STAGING_TABLE} ON COMMIT DELETE ROWS AS '
+                    f'SELECT {staging_columns} FROM {Order._meta.db_table} WITH NO DATA'
+                )
+                await self._copy_table(conn, self.STAGING_TABLE, table, column_types)
+                status = await conn.execute(
+                    f'INSERT INTO {Order._meta.db_table} ({columns}) '
+                    f'SELECT {columns} FROM {self.STAGING_TABLE} '
+                    f'ON CONFLICT (order_id) DO NOTHING'
+                )
+            inserted = int(status.split()[-1])
+            if inserted < table.num_rows:
+                logger.info(f"合并写入:\n- 新增订单数: {inserted}条\n- 已存在而跳过的订单数: {table.num_rows - inserted}条")
+
+    async def _bulk_create(self, df: pd.DataFrame, ignore_conflicts: bool = False) -> None:
+        """使用 Tortoise ORM 逐行创建对象后批量写入"""
+        # 将 DataFrame 转换为字典列表
+        records = df.to_dict('records')
+        
+        # 批量创建记录
+        orders = [Order(**record) for record in records]
+        await Order.bulk_create(orders, ignore_conflicts=ignore_conflicts)
+
+    async def _write(self, df: pd.DataFrame) -> None:
+        """在一个写入名额内提交一个批次，并把提交耗时反馈给批次大小调节器"""
+        async with self.writers.slot():
+            start = time.perf_counter()
+            if self.mode in ('copy', 'upsert'):
+                try:
+                    await (self._upsert(df) if self.mode == 'upsert' else self._copy(df))
+                except COPY_UNSUPPORTED_ERRORS as e:
+                    # COPY 已随事务回滚，重试时已存在的订单同样跳过
+                    logger.warning(f"数据库不支持 COPY，回退到 ORM 写入: {str(e)}")
+                    await self._bulk_create(df, ignore_conflicts=True)
+            else:
+                await self._bulk_create(df)
+            if self.sizer is not None:
+                self.sizer.record(len(df), time.perf_counter() - start)
 
     async def load(self, df: pd.DataFrame) -> None:
-        """使用 Tortoise ORM 将数据加载到数据库"""
+        """将数据加载到数据库，默认经暂存表合并写入，数据库不支持 COPY 时回退到 Tortoise ORM
+
+        启用自适应批次时按调节器给出的行数拆分，每一部分单独提交。
+        """
+        reserved = False
         try:
-            await self._ensure_db_initialized()
+            await self.pool.init()
+            if self.order_index is not None:
+                df = self._drop_loaded(df)
+                reserved = True
+                if df.empty:
+                    logger.info("批次中的订单均已加载，跳过数据库写入")
+                    return
             logger.info("开始数据库写入操作")
             
-            # 将 DataFrame 转换为字典列表
-            records = df.to_dict('records')
-            
-            # 批量创建记录
-            orders = [Order(**record) for record in records]
-            await Order.bulk_create(orders)
+            if self.sizer is not None:
+                self.sizer.observe(df)
+            offset = 0
+            while offset < len(df):
+                rows = self.sizer.batch_rows() if self.sizer is not None else len(df)
+                chunk = df.iloc[offset:offset + rows]
+                await self._write(chunk)
+                # 每一部分提交后即记录，后续部分失败时只需重试未提交的订单
+                if reserved:
+                    self.order_index.add(chunk['order_id'].tolist())
+                offset += rows
+            reserved = False
             
             logger.info(f"成功写入 {len(df)} 条数据到数据库")
             
@@ -34,7 +208,33 @@ class PostgresLoader:
             raise
             
         finally:
-            if 'cur' in locals():
-                cur.close()
-            if 'conn' in locals():
-                conn.close()
\ No newline at end of file
+            if reserved:
+                self.order_index.release(df['order_id'].tolist())
+
+    def metrics(self) -> dict:
+        metrics = {'pool': self.pool.metrics(), 'writers': self.writers.metrics()}
+        if self.sizer is not None:
+            metrics['batch'] = self.sizer.metrics()
+        return metrics
+
+    def log_metrics(self) -> None:
+        pool = self.pool.metrics()
+        writers = self.writers.metrics()
+        logger.info(f"数据库写入指标:\n"
+                    f"- 连接池: {pool['pool_size']}个连接，空闲 {pool['pool_idle']}个，使用中 {pool['in_use']}个"
+                    f"（利用率 {pool['utilization']:.0%}，峰值 {pool['peak_in_use']}个）\n"
+                    f"- 获取连接: 平均等待 {pool['avg_wait'] * 1000:.1f}毫秒，最长 {pool['max_wait'] * 1000:.1f}毫秒，"
+                    f"超时 {pool['timeouts']}次\n"
+                    f"- 写入事务: 进行中 {writers['in_flight']}/{writers['max_concurrent']}，排队 {writers['waiting']}个，"
+                    f"完成 {writers['completed']}个，失败 {writers['failed']}个\n"
+                    f"- 平均排队 {writers['avg_wait'] * 1000:.1f}毫秒，平均写入 {writers['avg_write'] * 1000:.1f}毫秒")
+        if self.sizer is not None:
+            batch = self.sizer.metrics()
+            logger.info(f"写入批次: 当前 {batch['batch_rows']}行，目标提交耗时 {batch['target_latency']:.2f}秒，"
+                        f"平均提交耗时 {batch['latency']:.2f}秒，吞吐 {batch['throughput']:.0f}行/秒，"
+                        f"调整 {batch['adjustments']}次")
+
+    async def close(self) -> None:
+        if self.order_index is not None:
+            self.order_index.close()
+        await self.pool.close()
\ No newline at end of file
@@ -0,0 +1,101 @@
+import ast
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from loguru import logger
+from typing import Dict, List, Optional
+
+# log_info 中的字段及其类型
+LOG_INFO_FIELDS = {
+    'timestamp': pa.timestamp('us'),
+    'device_model': pa.string(),
+    'os_version': pa.string(),
+    'browser': pa.string(),
+    'browser_version': pa.string(),
+    'ip_address': pa.string(),
+    'user_agent': pa.string()
+}
+
+# 与订单字段重名的日志字段在输出时使用的列名
+LOG_INFO_COLUMNS = {
+    'timestamp': 'log_timestamp'
+}
+
+def _field_pattern(field: str, capture: bool) -> str:
+    # 值中不含引号和反斜杠时 repr 使用单引号且不转义，含有时交给 ast 解析
+    value = f"(?P<{field}>[^'\\\\]*)" if capture else "[^'\\\\]*"
+    return f"'{field}': '{value}'"
+
+class LogInfoParser:
+    """用一次 pc.extract_regex 将 Python dict repr 格式的 log_info 解析为多个类型化列
+
+    正则按 log_info 中字段的固定顺序匹配整个字符串，只为需要保留的字段设置命名分组，
+    所有行在一次 C++ 正则匹配中完成；字段顺序不同、值中含引号或反斜杠等无法匹配的行逐行回退到 ast 解析。
+    """
+
+    def __init__(self, fields: Optional[List[str]] = None):
+        fields = fields if fields is not None else list(LOG_INFO_FIELDS)
+        unknown = [field for field in fields if field not in LOG_INFO_FIELDS]
+        if unknown:
+            raise ValueError(f"未知的 log_info 字段: {unknown}")
+        self.fields = fields
+        self.schema = pa.schema([(field, LOG_INFO_FIELDS[field]) for field in self.fields])
+        self.pattern = '^\\{' + ', '.join(
+            _field_pattern(field, field in self.fields) for field in LOG_INFO_FIELDS) + '\\}$'
+
+    @staticmethod
+    def column_name(field: str) -> str:
+        return LOG_INFO_COLUMNS.get(field, field)
+
+    def parse(self, values) -> pa.Table:
+        """解析 log_info 列，返回与输入行一一对应的类型化表"""
+        if isinstance(values, pa.ChunkedArray):
+            values = values.combine_chunks()
+        values = pc.cast(values, pa.string())
+        if len(values) == 0:
+            return self.schema.empty_table().rename_columns([self.column_name(field) for field in self.fields])
+
+        matched = pc.extract_regex(values, self.pattern)
+        columns = [self._cast(pc.struct_field(matched, field), field) for field in self.fields]
+
+        # 非空但未匹配的行逐行解析后填回
+        unmatched = pc.and_(pc.is_null(matched), pc.invert(pc.equal(pc.fill_null(values, ''), '')))
+        unmatched_count = pc.sum(unmatched).as_py() or 0
+        if unmatched_count:
+            logger.debug(f"log_info 有 {unmatched_count} 行无法按固定格式匹配，逐行解析")
+            literal = self._parse_literal(values.filter(unmatched))
+            columns = [pc.replace_with_mask(column, unmatched, literal[field].combine_chunks())
+                       for column, field in zip(columns, self.fields)]
+        return pa.table(columns, names=[self.column_name(field) for field in self.fields])
+
+    @staticmethod
+    def _cast(values: pa.Array, field: str) -> pa.Array:
+        target = LOG_INFO_FIELDS[field]
+        if values.type == target:
+            return values
+        try:
+            return pc.cast(values, target)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            # 个别无法直接转换的值（例如时间格式不一致）置为空
+            converted = pd.to_datetime(values.to_pandas(), errors='coerce', format='mixed') \
+                if pa.types.is_timestamp(target) else values.to_pandas()
+            return pa.array(converted, type=target, from_pandas=True)
+
+    def _parse_literal(self, values: pa.StringArray) -> pa.Table:
+        """逐行使用 ast.literal_eval 解析，仅用于无法批量解析的行"""
+        rows = []
+        for value in values.to_pylist():
+            try:
+                record = ast.literal_eval(value)
+            except (ValueError, SyntaxError):
+                record = None
+            rows.append(record if isinstance(record, dict) else {})
+        columns: Dict[str, pa.Array] = {}
+        for field in self.fields:
+            column = [row.get(field) for row in rows]
+            try:
+                columns[field] = pa.array(column, type=LOG_INFO_FIELDS[field])
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                columns[field] = pc.cast(pa.array([None if v is None else str(v) for v in column]),
+                                         LOG_INFO_FIELDS[field], safe=False)
+        return pa.table(columns, schema=self.schema)
@@ -0,0 +1,174 @@
+import os
+import json
+import uuid
+import shutil
+import asyncio
+import threading
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from loguru import logger
+from typing import List, Set
+from .sinks import Sink
+
+# 分区列：订单日期（按天）和省份，目录采用 Hive 风格，例如 order_day=2024-01-01/province=浙江省（目录名中的分区值经 URL 编码）
+PARTITION_SCHEMA = pa.schema([('order_day', pa.string()), ('province', pa.string())])
+
+class ParquetSink(Sink):
+    """按订单日期和省份分区写入 Parquet 数据湖
+
+    每个批次先写入暂存目录再按文件原子移动到分区目录，读取方不会看到写了一半的文件；
+    分区内未合并的小文件达到 compact_min_files 个后合并为一个新文件，按 row_group_rows 行划分行组，
+    之前合并的文件保持不变；合并时按 order_id 去重，并丢弃已合并文件中已有的订单（只读取这些文件的 order_id 列），
+    重放的批次在合并后不再重复。
+    合并前在分区目录写入日志文件，中途失败后下次写入该分区时继续完成或回滚。
+    """
+
+    name = 'parquet'
+    STAGING_DIR = '_staging'
+    JOURNAL_FILE = '_compaction.json'
+
+    def __init__(self, root: str = 'lake/orders', row_group_rows: int = 100000, compact_min_files: int = 8,
+                 compression: str = 'zstd'):
+        self.root = root
+        self.row_group_rows = row_group_rows
+        self.compact_min_files = compact_min_files
+        self.compression = compression
+        self.lock = threading.Lock()
+        # 上次运行中断时留下的暂存文件尚未移动到分区目录，对应的批次会由本地缓冲重放
+        shutil.rmtree(os.path.join(root, self.STAGING_DIR), ignore_errors=True)
+        os.makedirs(root, exist_ok=True)
+        # 指标
+        self.batches = 0
+        self.rows = 0
+        self.files = 0
+        self.compactions = 0
+        self.duplicates = 0
+        logger.info(f"Parquet 写入目标已打开: {root}")
+
+    def _partitioned(self, table: pa.Table) -> pa.Table:
+        """添加按天的分区列，省份统一为普通字符串"""
+        table = table.append_column('order_day', pc.strftime(table['order_date'], format='%Y-%m-%d'))
+        province = table['province']
+        if province.type != pa.string():
+            table = table.set_column(table.schema.get_field_index('province'), 'province', province.cast(pa.string()))
+        return table
+
+    def _write_options(self):
+        return ds.ParquetFileFormat().make_write_options(compression=self.compression)
+
+    def _write(self, table: pa.Table) -> Set[str]:
+        """写入一个批次，返回涉及的分区目录"""
+        staging = os.path.join(self.root, self.STAGING_DIR, uuid.uuid4().hex)
+        written: List[str] = []
+        ds.write_dataset(
+            self._partitioned(table).unify_dictionaries(),
+            staging,
+            format='parquet',
+            file_options=self._write_options(),
+            partitioning=ds.partitioning(PARTITION_SCHEMA, flavor='hive'),
+            basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+            max_rows_per_group=self.row_group_rows,
+            file_visitor=lambda written_file: written.append(written_file.path)
+        )
+        partitions = set()
+        for path in written:
+            relative = os.path.relpath(path, staging)
+            target = os.path.join(self.root, relative)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(path, target)
+            partitions.add(os.path.dirname(target))
+        shutil.rmtree(staging, ignore_errors=True)
+        self.files += len(written)
+        return partitions
+
+    def _recover(self, partition: str) -> None:
+        """按合并日志完成或回滚中断的合并"""
+        journal_path = os.path.join(partition, self.JOURNAL_FILE)
+        if not os.path.exists(journal_path):
+            return
+        with open(journal_path, encoding='utf-8') as f:
+            journal = json.load(f)
+        if os.path.exists(os.path.join(partition, journal['target'])):
+            # 合并后的文件已生效，删除剩余的源文件
+            for name in journal['sources']:
+                try:
+                    os.remove(os.path.join(partition, name))
+                except FileNotFoundError:
+                    pass
+        else:
+            try:
+                os.remove(os.path.join(partition, journal['tmp']))
+            except FileNotFoundError:
+                pass
+        os.remove(journal_path)
+
+    @staticmethod
+    def _drop_duplicates(table: pa.Table) -> pa.Table:
+        """按 order_id 去重，保留最早写入的一行"""
+        table = table.append_column('_row', pa.array(np.arange(table.num_rows)))
+        first = table.group_by('order_id', use_threads=False).aggregate([('_row', 'min')])['_row_min']
+        return table.take(np.sort(first.to_numpy())).drop_columns(['_row'])
+
+    def _compacted_order_ids(self, partition: str) -> pa.Array:
+        """已合并文件中的 order_id，只读取这一列"""
+        names = [name for name in os.listdir(partition) if name.startswith('compacted-') and name.endswith('.parquet')]
+        if not names:
+            return pa.array([], pa.string())
+        table = pa.concat_tables([pq.read_table(os.path.join(partition, name), columns=['order_id']) for name in names],
+                                 promote_options='permissive')
+        return pc.cast(table['order_id'], pa.string()).combine_chunks()
+
+    def _compact(self, partition: str) -> None:
+        """合并分区内未合并的小文件，文件数未达到阈值时跳过"""
+        self._recover(partition)
+        sources = sorted(name for name in os.listdir(partition) if name.startswith('part-') and name.endswith('.parquet'))
+        if len(sources) < self.compact_min_files:
+            return
+        tables = [pq.read_table(os.path.join(partition, name)) for name in sources]
+        table = pa.concat_tables(tables, promote_options='permissive').unify_dictionaries()
+        rows = table.num_rows
+        table = self._drop_duplicates(table)
+        compacted = self._compacted_order_ids(partition)
+        if len(compacted):
+            table = table.filter(pc.invert(pc.is_in(pc.cast(table['order_id'], pa.string()), value_set=compacted)))
+
+        name = f"compacted-{uuid.uuid4().hex}.parquet"
+        tmp_name = f"_{name}.tmp"
+        pq.write_table(table, os.path.join(partition, tmp_name), row_group_size=self.row_group_rows,
+                       compression=self.compression)
+        journal = {'target': name, 'tmp': tmp_name, 'sources': sources}
+        journal_path = os.path.join(partition, self.JOURNAL_FILE)
+        with open(f"{journal_path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(journal, f, ensure_ascii=False)
+        os.replace(f"{journal_path}.tmp", journal_path)
+        os.replace(os.path.join(partition, tmp_name), os.path.join(partition, name))
+        self._recover(partition)
+
+        self.compactions += 1
+        self.duplicates += rows - table.num_rows
+        logger.debug(f"合并分区 {partition}: {len(sources)} 个文件 -> 1 个，{table.num_rows}行，"
+                     f"去除重复订单 {rows - table.num_rows}条")
+
+    def _load(self, table: pa.Table) -> None:
+        with self.lock:
+            for partition in self._write(table):
+                self._compact(partition)
+
+    async def load(self, df: pd.DataFrame) -> None:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        await asyncio.to_thread(self._load, table)
+        self.batches += 1
+        self.rows += table.num_rows
+        logger.info(f"成功写入 {table.num_rows} 条数据到 Parquet 数据湖")
+
+    def metrics(self) -> dict:
+        return {'batches': self.batches, 'rows': self.rows, 'files': self.files,
+                'compactions': self.compactions, 'duplicates': self.duplicates}
+
+    def log_metrics(self) -> None:
+        logger.info(f"Parquet 写入指标: 批次 {self.batches}个，{self.rows}行，写入文件 {self.files}个，"
+                    f"合并 {self.compactions}次，合并时去除重复订单 {self.duplicates}条")
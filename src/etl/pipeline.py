@@ -0,0 +1,159 @@
+import time
+import asyncio
+from loguru import logger
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from .coalescer import MicroBatch
+from .worker_pool import AutoscalingWorkerPool
+
+class BatchProgress:
+    """跟踪一个微批拆分出的所有工作，全部结束后回调一次
+
+    普通微批只拆分出一项工作；流式处理的大文件每个分块一项工作。
+    提取阶段交出所有工作后调用 seal，任何一项失败时整个微批视为失败。
+    """
+
+    def __init__(self, batch: MicroBatch, on_complete: Callable[['BatchProgress'], None]):
+        self.batch = batch
+        self.on_complete = on_complete
+        self.pending = 0
+        self.sealed = False
+        self.failed = False
+        self.rows = 0
+        self.start_time = time.time()
+        # 各阶段累计耗时（秒）
+        self.timings: Dict[str, float] = {'extract': batch.extract_time, 'transform': 0.0, 'load': 0.0}
+
+    @property
+    def files(self) -> List[str]:
+        return [self.batch.stream_file] if self.batch.stream_file is not None else self.batch.files
+
+    def job(self, data: Any) -> 'PipelineJob':
+        self.pending += 1
+        return PipelineJob(self, data)
+
+    def seal(self) -> None:
+        self.sealed = True
+        self._check()
+
+    def _settle(self, failed: bool) -> None:
+        self.failed = self.failed or failed
+        self.pending -= 1
+        self._check()
+
+    def _check(self) -> None:
+        if self.sealed and self.pending == 0:
+            self.on_complete(self)
+
+class PipelineJob:
+    """在阶段之间传递的一项工作，data 为当前阶段的输入"""
+
+    def __init__(self, progress: BatchProgress, data: Any):
+        self.progress = progress
+        self.data = data
+
+    def done(self) -> None:
+        self.progress._settle(False)
+
+    def fail(self) -> None:
+        self.progress._settle(True)
+
+class PipelineStage:
+    """流水线中的一个阶段
+
+    handler(item, emit) 处理一项工作，通过 emit 把零个或多个结果交给下一阶段的有界输入队列；
+    下一阶段的队列满时 emit 等待，背压逐级传回上游。每个阶段的工作协程数按自己的输入队列积压伸缩。
+    """
+
+    def __init__(self, name: str, handler: Callable[[Any, Callable[[Any], Awaitable[None]]], Awaitable[None]],
+                 min_workers: int = 1, max_workers: int = 1, queue_size: int = 0):
+        self.name = name
+        self.handler = handler
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        # 输入队列，第一个阶段使用流水线的源队列
+        self.queue: asyncio.Queue = asyncio.Queue(queue_size or 2 * max(max_workers, 1))
+        self.acquire: Callable[[], Awaitable[Any]] = self.queue.get
+        self.owns_queue = True
+        self.next: Optional['PipelineStage'] = None
+        self.pool: Optional[AutoscalingWorkerPool] = None
+        # 指标
+        self.emitted = 0
+        self.failed = 0
+        self.blocked_seconds = 0.0
+
+    async def emit(self, item: Any) -> None:
+        if self.next is None:
+            return
+        start = time.perf_counter()
+        await self.next.queue.put(item)
+        self.blocked_seconds += time.perf_counter() - start
+        self.emitted += 1
+
+    async def _process(self, item: Any) -> None:
+        try:
+            await self.handler(item, self.emit)
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"{self.name} 阶段处理时发生错误: {str(e)}")
+            logger.exception(e)
+        finally:
+            if self.owns_queue:
+                self.queue.task_done()
+
+    def metrics(self) -> dict:
+        metrics = self.pool.metrics() if self.pool is not None else {}
+        metrics.update({'emitted': self.emitted, 'failed': self.failed, 'blocked_seconds': self.blocked_seconds})
+        return metrics
+
+class StagedPipeline:
+    """由有界队列连接的多阶段流水线
+
+    第一个阶段从源队列（处理队列）取工作，source_busy 返回正在源中处理（例如提取文件）的协程数；
+    之后的阶段各自有输入队列和独立伸缩的工作协程，不同文件的提取、转换和加载可以同时进行，
+    一个慢的加载不会占住提取和转换的协程。
+    """
+
+    def __init__(self, source: Callable[[], Awaitable[Any]], source_queue: asyncio.Queue,
+                 stages: List[PipelineStage], target_latency: float = 30.0, scale_interval: float = 5.0,
+                 source_busy: Optional[Callable[[], int]] = None):
+        self.stages = stages
+        first = stages[0]
+        first.acquire = source
+        first.queue = source_queue
+        first.owns_queue = False
+        for stage, following in zip(stages, stages[1:]):
+            stage.next = following
+        for stage in stages:
+            stage.pool = AutoscalingWorkerPool(
+                stage.acquire,
+                stage._process,
+                stage.queue,
+                min_workers=stage.min_workers,
+                max_workers=stage.max_workers,
+                target_latency=target_latency,
+                scale_interval=scale_interval,
+                acquiring=source_busy if stage is first else None,
+                name=f"{stage.name} 阶段"
+            )
+
+    async def run(self) -> None:
+        """启动各阶段的工作协程，被取消时停止所有阶段"""
+        logger.info("流水线已启动: " + " → ".join(
+            f"{stage.name}({stage.min_workers}-{stage.max_workers})" for stage in self.stages))
+        tasks = [asyncio.create_task(stage.pool.run()) for stage in self.stages]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def metrics(self) -> Dict[str, dict]:
+        return {stage.name: stage.metrics() for stage in self.stages}
+
+    def log_metrics(self) -> None:
+        for name, metrics in self.metrics().items():
+            logger.info(f"{name} 阶段: 输入积压 {metrics['queue_depth']}/{metrics['queue_maxsize']}，"
+                        f"工作协程 {metrics['busy']}/{metrics['workers']} 个忙，"
+                        f"已处理 {metrics['processed']} 项，平均耗时 {metrics['latency']:.2f}秒，"
+                        f"等待下游 {metrics['blocked_seconds']:.2f}秒，失败 {metrics['failed']} 项")
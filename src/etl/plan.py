@@ -0,0 +1,150 @@
+import pyarrow as pa
+from loguru import logger
+from typing import Callable, Dict, List, Optional, Sequence
+
+class PlanStep:
+    """转换计划中的一个步骤，声明读取的列和产生的列"""
+    kind = 'step'
+
+    def __init__(self, name: str, inputs: Sequence[str] = (), outputs: Sequence[str] = ()):
+        self.name = name
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+
+    def run(self, table: pa.Table) -> pa.Table:
+        raise NotImplementedError
+
+    def __repr__(self) -> str:
+        return f"{self.kind}:{self.name}"
+
+class Derive(PlanStep):
+    """逐行派生新列（或替换已有列），与过滤可交换顺序，可以延后到过滤之后按需计算"""
+    kind = 'derive'
+
+    def __init__(self, name: str, inputs: Sequence[str], outputs: Sequence[str],
+                 func: Callable[[pa.Table], Dict[str, pa.ChunkedArray]]):
+        super().__init__(name, inputs, outputs)
+        self.func = func
+
+    def run(self, table: pa.Table) -> pa.Table:
+        for column, values in self.func(table).items():
+            if column in table.column_names:
+                table = table.set_column(table.schema.get_field_index(column), column, values)
+            else:
+                table = table.append_column(column, values)
+        return table
+
+class Aggregate(Derive):
+    """依赖全部行的派生（如分组统计），必须在它之前声明的过滤不能越过它"""
+    kind = 'aggregate'
+
+class Dedup(PlanStep):
+    """按键列去重，结果依赖全部行，是重排的边界"""
+    kind = 'dedup'
+
+    def __init__(self, name: str, keys: Sequence[str], func: Callable[[pa.Table, List[str]], pa.Table]):
+        super().__init__(name, keys, ())
+        self.func = func
+
+    def run(self, table: pa.Table) -> pa.Table:
+        return self.func(table, self.inputs)
+
+class Filter(PlanStep):
+    """行过滤，读取的列由计划保证在它执行前已经可用"""
+    kind = 'filter'
+
+    def __init__(self, name: str, inputs: Sequence[str], predicate: Callable[[pa.Table], pa.ChunkedArray]):
+        super().__init__(name, inputs, ())
+        self.predicate = predicate
+
+    def run(self, table: pa.Table) -> pa.Table:
+        return table.filter(self.predicate(table))
+
+class Observe(PlanStep):
+    """只读的统计观察，在声明位置看到的行不变，不会被重排到过滤之后"""
+    kind = 'observe'
+
+    def __init__(self, name: str, inputs: Sequence[str], func: Callable[[pa.Table], None]):
+        super().__init__(name, inputs, ())
+        self.func = func
+
+    def run(self, table: pa.Table) -> pa.Table:
+        self.func(table)
+        return table
+
+class TransformPlan:
+    """声明式转换计划
+
+    步骤按语义顺序声明，优化器在不改变结果的前提下：
+    - 只读取下游真正用到的输入列（投影下推）
+    - 删除产出列没有被任何步骤或输出使用的派生步骤（惰性列）
+    - 逐行派生步骤延后到过滤之后，只对保留下来的行计算（谓词下推）
+    去重、分组聚合、过滤和统计观察之间保持声明顺序。
+    """
+
+    def __init__(self, steps: List[PlanStep], output_columns: Optional[Sequence[str]] = None):
+        self.steps = steps
+        self.output_columns = list(output_columns) if output_columns is not None else None
+        self._cache: Dict[tuple, tuple] = {}
+
+    def _producer(self, column: str, before: int) -> Optional[int]:
+        """返回在 before 之前声明的、最后一个产出 column 的派生步骤下标"""
+        for index in range(min(before, len(self.steps)) - 1, -1, -1):
+            step = self.steps[index]
+            if isinstance(step, Derive) and column in step.outputs:
+                return index
+        return None
+
+    def optimize(self, available_columns: Sequence[str]):
+        """根据输入列生成物理执行顺序，返回 (需要读取的输入列, 步骤列表, 输出列)"""
+        key = tuple(available_columns)
+        if key in self._cache:
+            return self._cache[key]
+
+        available = set(available_columns)
+        produced = [column for step in self.steps if isinstance(step, Derive) for column in step.outputs]
+        output_columns = self.output_columns
+        if output_columns is None:
+            output_columns = list(available_columns) + [column for column in produced if column not in available]
+        output_columns = [column for column in output_columns if column in available or column in produced]
+
+        ordered: List[PlanStep] = []
+        emitted = set()
+        base_columns = set()
+
+        def require(column: str, before: int) -> None:
+            index = self._producer(column, before)
+            if index is None:
+                if column in available:
+                    base_columns.add(column)
+                return
+            if index in emitted:
+                return
+            step = self.steps[index]
+            for input_column in step.inputs:
+                require(input_column, index)
+            emitted.add(index)
+            ordered.append(step)
+
+        for index, step in enumerate(self.steps):
+            if isinstance(step, Derive) and not isinstance(step, Aggregate):
+                continue
+            for column in step.inputs:
+                require(column, index)
+            emitted.add(index)
+            ordered.append(step)
+        for column in output_columns:
+            require(column, len(self.steps))
+
+        input_columns = [column for column in available_columns if column in base_columns or column in output_columns]
+        plan = (input_columns, ordered, output_columns)
+        self._cache[key] = plan
+        logger.debug(f"转换计划: 读取列 {input_columns}\n执行顺序: {ordered}\n输出列 {output_columns}")
+        return plan
+
+    def execute(self, table: pa.Table) -> pa.Table:
+        input_columns, steps, output_columns = self.optimize(table.column_names)
+        table = table.select(input_columns)
+        for step in steps:
+            table = step.run(table)
+        return table.select(output_columns)
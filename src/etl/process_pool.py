@@ -0,0 +1,151 @@
+import os
+import uuid
+import signal
+import asyncio
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import pyarrow as pa
+from loguru import logger
+from typing import List, Optional, Tuple
+
+# 进程间交换数据的目录，优先使用内存文件系统
+DEFAULT_SPOOL_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+class ArrowHandle:
+    """保存在 Arrow IPC 文件中的一个表，进程之间只传递文件路径和行数"""
+
+    def __init__(self, path: str, rows: int):
+        self.path = path
+        self.rows = rows
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def __repr__(self) -> str:
+        return f"ArrowHandle({self.path}, rows={self.rows})"
+
+    @classmethod
+    def write(cls, table: pa.Table, directory: str) -> 'ArrowHandle':
+        path = os.path.join(directory, f"etl-{os.getpid()}-{uuid.uuid4().hex}.arrow")
+        with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        return cls(path, table.num_rows)
+
+    def read(self) -> pa.Table:
+        """以内存映射方式零拷贝读取"""
+        with pa.memory_map(self.path, 'r') as source:
+            return pa.ipc.open_file(source).read_all()
+
+    def unlink(self) -> None:
+        """删除文件，已经映射的内存在表释放前仍然有效"""
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+# 每个工作进程各自持有的提取器和转换器，由 _init_worker 创建
+_worker = {}
+
+def _init_worker(spool_dir: str) -> None:
+    from ..config import FORMAT_CACHE_CONFIG, USER_STATS_CONFIG
+    from ..utils.user_stats import UserStatsRecorder
+    from .extractor import CSVExtractor
+    from .format_cache import FormatCache
+    from .transformer import DataTransformer
+
+    # Ctrl-C 同时发给整个进程组，工作进程忽略它，由主进程关闭进程池
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _worker['spool_dir'] = spool_dir
+    # 格式缓存和用户聚合只由主进程写入，工作进程只读缓存、只记录订单的贡献
+    format_cache = None
+    if FORMAT_CACHE_CONFIG['enabled']:
+        format_cache = FormatCache(FORMAT_CACHE_CONFIG['cache_file'], FORMAT_CACHE_CONFIG['sample_rows'], read_only=True)
+    _worker['extractor'] = CSVExtractor(format_cache=format_cache)
+    _worker['transformer'] = DataTransformer(user_stats=UserStatsRecorder() if USER_STATS_CONFIG['enabled'] else None)
+    logger.debug(f"处理进程 {os.getpid()} 初始化完成")
+
+def _extract(file_path: str):
+    """提取文件，返回 IPC 文件句柄和本次新识别的解析格式"""
+    extractor = _worker['extractor']
+    table = extractor.read_table(file_path)
+    learned = extractor.format_cache.drain() if extractor.format_cache is not None else {}
+    return ArrowHandle.write(table, _worker['spool_dir']), learned
+
+def _transform(handles: List[ArrowHandle]):
+    """合并微批中各文件的表并执行转换，返回结果表、本次转换累加的统计和记录的用户聚合贡献"""
+    tables = [handle.read() for handle in handles]
+    table = tables[0] if len(tables) == 1 else pa.concat_tables(tables, promote_options='permissive')
+    # 各文件的字典编码列字典不同，合并为统一的字典
+    table = table.unify_dictionaries()
+    transformer = _worker['transformer']
+    result = transformer.transform_table(table)
+    for handle in handles:
+        handle.unlink()
+    contributions = transformer.user_stats.drain() if transformer.user_stats is not None else None
+    if contributions is not None:
+        contributions = ArrowHandle.write(contributions, _worker['spool_dir'])
+    return ArrowHandle.write(result, _worker['spool_dir']), transformer.stats.drain(), contributions
+
+class ProcessPoolRunner:
+    """在进程池中执行 CPU 密集的提取和转换
+
+    事件循环只负责调度、监控事件和数据库 I/O；
+    进程之间通过内存文件系统上的 Arrow IPC 文件交换数据，不对 DataFrame 做 pickle。
+    工作进程识别的解析格式合并到主进程的 format_cache，记录的订单由主进程的 transformer 计入用户聚合。
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, spool_dir: Optional[str] = None,
+                 start_method: str = 'spawn', format_cache=None, transformer=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.format_cache = format_cache
+        self.transformer = transformer
+        self.spool_dir = spool_dir or DEFAULT_SPOOL_DIR
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context(start_method),
+            initializer=_init_worker,
+            initargs=(self.spool_dir,)
+        )
+        logger.info(f"处理进程池已启动，进程数: {self.max_workers}，数据交换目录: {self.spool_dir}")
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def extract(self, file_path: str) -> ArrowHandle:
+        """在工作进程中提取文件，返回 IPC 文件句柄"""
+        logger.info(f"开始读取文件: {file_path}")
+        handle, learned = await self._run(_extract, file_path)
+        if learned and self.format_cache is not None:
+            await asyncio.to_thread(self.format_cache.merge, learned)
+        logger.info(f"成功读取文件: {file_path}, 共 {handle.rows} 行数据")
+        return handle
+
+    async def transform(self, handles: List[ArrowHandle]) -> Tuple[pd.DataFrame, object]:
+        """在工作进程中转换微批，返回结果 DataFrame 和工作进程的统计"""
+        try:
+            result, stats, contributions = await self._run(_transform, handles)
+        except Exception:
+            for handle in handles:
+                handle.unlink()
+            raise
+        try:
+            df = result.read().to_pandas(types_mapper=pd.ArrowDtype)
+        finally:
+            result.unlink()
+        if contributions is not None:
+            try:
+                if self.transformer is not None:
+                    df = await asyncio.to_thread(self.transformer.apply_user_stats, df, contributions.read())
+            finally:
+                contributions.unlink()
+        return df, stats
+
+    def write(self, table: pa.Table) -> ArrowHandle:
+        """将主进程中的表写入交换目录，交给工作进程处理"""
+        return ArrowHandle.write(table, self.spool_dir)
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True, cancel_futures=True)
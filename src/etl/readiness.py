@@ -0,0 +1,127 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from loguru import logger
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+# 文件签名: (大小, 修改时间纳秒)
+Signature = Tuple[int, int]
+
+class FileReadinessTracker:
+    """等待文件写入完成后再交给处理队列
+
+    监控线程中的事件通过 call_soon_threadsafe 交给事件循环，不在监控线程中操作事件循环的对象。
+    收到关闭写入事件（inotify 的 IN_CLOSE_WRITE）或重命名到位的文件视为已写完；
+    没有这类事件时，每隔 poll_interval 秒检查一次，大小和修改时间不再变化且最后修改已超过
+    stable_seconds 秒后才视为写完。同一个文件的重复事件合并，已交出的文件签名不变时不再交出。
+    启动扫描发现的文件通过 admit 逐个加入，等待中的文件达到 max_tracked 个时等待，
+    交出文件又在处理队列满时等待，因此扫描的速度受处理队列的容量约束，每次检查的文件数也有上限。
+    """
+
+    def __init__(self, dispatch: Callable[[str], Awaitable[None]], stable_seconds: float = 2.0,
+                 poll_interval: float = 0.5, max_remembered: int = 100000, max_tracked: int = 1000):
+        self.dispatch = dispatch
+        self.stable_seconds = stable_seconds
+        self.poll_interval = poll_interval
+        self.max_remembered = max_remembered
+        self.max_tracked = max(1, max_tracked)
+        self.loop = asyncio.get_running_loop()
+        # 等待写完的文件及上次检查时的签名
+        self.tracked: Dict[str, Optional[Signature]] = {}
+        # 已收到关闭写入或重命名事件的文件
+        self.completed: Set[str] = set()
+        # 已交出的文件及交出时的签名，用于合并重复事件
+        self.dispatched: 'OrderedDict[str, Signature]' = OrderedDict()
+        self.wakeup = asyncio.Event()
+        # 等待中的文件数低于 max_tracked 时置位，admit 据此等待
+        self.space = asyncio.Event()
+        self.space.set()
+        # 指标
+        self.events = 0
+        self.duplicates = 0
+
+    def notify_threadsafe(self, file_path: str, complete: bool = False) -> None:
+        """在监控线程中调用，把事件交给事件循环"""
+        self.loop.call_soon_threadsafe(self.notify, file_path, complete)
+
+    def notify(self, file_path: str, complete: bool = False) -> None:
+        """在事件循环中记录文件事件，complete 表示文件已关闭写入或重命名到位"""
+        self.events += 1
+        self.tracked.setdefault(file_path, None)
+        if complete:
+            self.completed.add(file_path)
+            self.wakeup.set()
+
+    async def admit(self, file_path: str) -> None:
+        """加入启动扫描发现的文件，等待中的文件达到上限时先等待有文件交出或被移走"""
+        while len(self.tracked) >= self.max_tracked and file_path not in self.tracked:
+            self.space.clear()
+            await self.space.wait()
+        self.notify(file_path)
+
+    def _check(self, items: List[Tuple[str, Optional[Signature], bool]]) -> List[Tuple[str, Optional[Signature], bool]]:
+        """在线程中检查文件状态，返回 (路径, 当前签名, 是否已写完)，文件已不存在时签名为 None"""
+        now = time.time()
+        results = []
+        for file_path, previous, complete in items:
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                results.append((file_path, None, False))
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            settled = now - stat.st_mtime_ns / 1e9 >= self.stable_seconds
+            # 刚创建就关闭的空文件可能还会被再次打开写入，继续等待
+            ready = (complete and stat.st_size > 0) or (settled and previous in (None, signature))
+            results.append((file_path, signature, ready))
+        return results
+
+    async def run(self) -> None:
+        logger.debug("文件就绪检查协程启动")
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            if not self.tracked:
+                continue
+            items = [(path, previous, path in self.completed) for path, previous in self.tracked.items()]
+            try:
+                results = await asyncio.to_thread(self._check, items)
+            except Exception as e:
+                logger.error(f"检查文件是否写完时发生错误: {str(e)}")
+                continue
+            for file_path, signature, ready in results:
+                if signature is None:
+                    logger.debug(f"文件在写完之前被删除或移走: {file_path}")
+                    self._forget(file_path)
+                elif ready:
+                    self._forget(file_path)
+                    await self._dispatch(file_path, signature)
+                elif file_path in self.tracked:
+                    self.tracked[file_path] = signature
+
+    def _forget(self, file_path: str) -> None:
+        self.tracked.pop(file_path, None)
+        self.completed.discard(file_path)
+        if len(self.tracked) < self.max_tracked:
+            self.space.set()
+
+    async def _dispatch(self, file_path: str, signature: Signature) -> None:
+        if self.dispatched.get(file_path) == signature:
+            self.duplicates += 1
+            return
+        self.dispatched[file_path] = signature
+        self.dispatched.move_to_end(file_path)
+        while len(self.dispatched) > self.max_remembered:
+            self.dispatched.popitem(last=False)
+        logger.debug(f"文件已写完: {file_path}")
+        try:
+            await self.dispatch(file_path)
+        except Exception as e:
+            logger.error(f"提交已写完的文件时发生错误: {file_path}, {str(e)}")
+
+    def metrics(self) -> dict:
+        return {'tracked': len(self.tracked), 'events': self.events, 'duplicates': self.duplicates}
@@ -0,0 +1,42 @@
+import pyarrow as pa
+from tortoise import fields
+from typing import Dict, List, Optional
+from ..models import Order
+
+# 以字典编码存储的低基数字段
+CATEGORICAL_COLUMNS = ('payment_method', 'order_status')
+
+def _field_to_arrow(name: str, field: fields.Field) -> pa.DataType:
+    """将 Tortoise 字段类型映射为 Arrow 类型"""
+    if name in CATEGORICAL_COLUMNS:
+        return pa.dictionary(pa.int32(), pa.string())
+    if isinstance(field, fields.DecimalField):
+        return pa.decimal128(field.max_digits, field.decimal_places)
+    if isinstance(field, fields.DatetimeField):
+        return pa.timestamp('us')
+    if isinstance(field, (fields.BigIntField, fields.IntField, fields.SmallIntField)):
+        return pa.int64()
+    if isinstance(field, fields.FloatField):
+        return pa.float64()
+    if isinstance(field, fields.BooleanField):
+        return pa.bool_()
+    # UUID 以规范的字符串形式保存，便于去重和分组
+    return pa.string()
+
+def build_order_schema() -> pa.Schema:
+    """根据 Order 模型构建 Arrow Schema，不包含自增主键"""
+    schema_fields = []
+    for name, field in Order._meta.fields_map.items():
+        if field.pk:
+            continue
+        schema_fields.append(pa.field(name, _field_to_arrow(name, field), nullable=field.null))
+    return pa.schema(schema_fields)
+
+# 模块加载时构建一次，供提取器和转换器共享
+ORDER_SCHEMA = build_order_schema()
+
+def column_types(columns: Optional[List[str]] = None) -> Dict[str, pa.DataType]:
+    """返回指定列（默认全部列）的类型映射"""
+    if columns is None:
+        return {field.name: field.type for field in ORDER_SCHEMA}
+    return {name: ORDER_SCHEMA.field(name).type for name in columns if name in ORDER_SCHEMA.names}
@@ -0,0 +1,79 @@
+import asyncio
+import pandas as pd
+from loguru import logger
+from typing import List
+
+class Sink:
+    """数据写入目标的接口
+
+    load 需要是幂等的：本地缓冲重放或扇出写入部分失败后重试时，同一批次可能被再次写入。
+    """
+
+    name = 'sink'
+    # 自适应批次调节器，只有按提交耗时调整批次的写入目标才有
+    sizer = None
+
+    async def load(self, df: pd.DataFrame) -> None:
+        raise NotImplementedError
+
+    def metrics(self) -> dict:
+        return {}
+
+    def log_metrics(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+class FanOutSink(Sink):
+    """将同一批次并发写入多个目标，所有目标都写入成功才算成功
+
+    部分目标失败时整批报错，由上层重试；各目标的写入都是幂等的，已成功的目标重复写入不会产生重复数据。
+    """
+
+    name = 'fanout'
+
+    def __init__(self, sinks: List[Sink]):
+        self.sinks = sinks
+        # 合并小批次时以带有调节器的目标（通常是数据库）为准
+        self.sizer = next((sink.sizer for sink in sinks if sink.sizer is not None), None)
+
+    async def load(self, df: pd.DataFrame) -> None:
+        results = await asyncio.gather(*(sink.load(df) for sink in self.sinks), return_exceptions=True)
+        errors = [(sink, result) for sink, result in zip(self.sinks, results) if isinstance(result, BaseException)]
+        for sink, error in errors:
+            logger.error(f"写入目标 {sink.name} 失败: {str(error)}")
+        if errors:
+            raise errors[0][1]
+
+    def metrics(self) -> dict:
+        return {sink.name: sink.metrics() for sink in self.sinks}
+
+    def log_metrics(self) -> None:
+        for sink in self.sinks:
+            sink.log_metrics()
+
+    async def close(self) -> None:
+        for sink in self.sinks:
+            await sink.close()
+
+def create_sink(config: dict) -> Sink:
+    """按配置创建写入目标，配置多个时返回扇出目标"""
+    from .loader import PostgresLoader
+    from .sqlite_sink import SQLiteSink
+    from .parquet_sink import ParquetSink
+
+    sinks = []
+    for name in config['sinks']:
+        if name == 'postgres':
+            sinks.append(PostgresLoader())
+        elif name == 'sqlite':
+            sinks.append(SQLiteSink(**config['sqlite']))
+        elif name == 'parquet':
+            sinks.append(ParquetSink(**config['parquet']))
+        else:
+            raise ValueError(f"未知的写入目标: {name}")
+    if not sinks:
+        raise ValueError("至少需要配置一个写入目标")
+    logger.info(f"数据写入目标: {', '.join(sink.name for sink in sinks)}")
+    return sinks[0] if len(sinks) == 1 else FanOutSink(sinks)
@@ -0,0 +1,263 @@
+import os
+import asyncio
+import pandas as pd
+import pyarrow as pa
+from asyncpg.exceptions import InterfaceError, PostgresConnectionError
+from loguru import logger
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+# 数据库暂时不可用时的错误，不计入段文件的失败次数
+TRANSIENT_ERRORS = (ConnectionError, TimeoutError, OSError, InterfaceError, PostgresConnectionError)
+
+class SpoolSegment:
+    """缓冲目录中的一个 Arrow IPC 段文件，对应一个已转换的批次"""
+
+    def __init__(self, sequence: int, path: str, size: int, rows: int):
+        self.sequence = sequence
+        self.path = path
+        self.size = size
+        self.rows = rows
+
+    def __repr__(self) -> str:
+        return f"SpoolSegment({self.sequence}, rows={self.rows}, size={self.size})"
+
+    def read(self) -> pa.Table:
+        with pa.memory_map(self.path, 'r') as source:
+            return pa.ipc.open_file(source).read_all()
+
+    @staticmethod
+    def count_rows(path: str) -> int:
+        """只读取 IPC 文件尾部的元数据得到行数"""
+        with pa.memory_map(path, 'r') as source:
+            return pa.ipc.open_file(source).count_rows()
+
+class WriteAheadSpool:
+    """本地追加写的预写缓冲
+
+    转换后的批次先以 Arrow IPC 段文件落盘（写临时文件、fsync 后原子重命名），随即确认；
+    后台排空协程按顺序加载到数据库，成功后删除段文件。启动时重放目录中遗留的段文件。
+    段文件总大小超过 max_bytes 时，新的写入等待排空（背压）。
+    加载失败过的段文件之后单独领取，不与其他批次合并；失败 max_attempts 次后移入 quarantine 子目录（死信），
+    不再阻塞后面的批次，修复后移回缓冲目录即可在下次启动时重放。
+    """
+
+    SUFFIX = '.arrow'
+    QUARANTINE_DIR = 'quarantine'
+
+    def __init__(self, directory: str = 'spool', max_bytes: int = 1024 * 1024 * 1024, fsync: bool = True,
+                 max_attempts: int = 5):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self.max_attempts = max(1, max_attempts)
+        os.makedirs(directory, exist_ok=True)
+        self.segments: List[SpoolSegment] = []
+        self.claimed: Set[int] = set()
+        # 段文件序号 -> 加载失败次数
+        self.attempts: Dict[int, int] = {}
+        self.quarantined = 0
+        self.total_bytes = 0
+        self.condition = asyncio.Condition()
+        self._recover()
+        self.next_sequence = self.segments[-1].sequence + 1 if self.segments else 0
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'WriteAheadSpool':
+        return cls(config['directory'], config['max_bytes'], config['fsync'], config['max_attempts'])
+
+    def _recover(self) -> None:
+        """扫描缓冲目录，删除未完成的临时文件，按序号恢复待加载的段文件"""
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith('.tmp'):
+                os.remove(path)
+                continue
+            if not name.endswith(self.SUFFIX):
+                continue
+            try:
+                sequence = int(name[:-len(self.SUFFIX)])
+            except ValueError:
+                continue
+            self.segments.append(SpoolSegment(sequence, path, os.path.getsize(path), SpoolSegment.count_rows(path)))
+        self.segments.sort(key=lambda segment: segment.sequence)
+        self.total_bytes = sum(segment.size for segment in self.segments)
+        if self.segments:
+            logger.info(f"发现本地缓冲中待加载的批次 {len(self.segments)} 个，共 {self.total_bytes} 字节，将重放到数据库")
+
+    def _write(self, table: pa.Table, sequence: int) -> SpoolSegment:
+        path = os.path.join(self.directory, f"{sequence:012d}{self.SUFFIX}")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            with pa.ipc.new_file(f, table.schema) as writer:
+                writer.write_table(table)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        if self.fsync:
+            # 目录项也需要落盘，重命名才能在掉电后保留
+            dir_fd = os.open(self.directory, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        return SpoolSegment(sequence, path, os.path.getsize(path), table.num_rows)
+
+    async def append(self, df: pd.DataFrame) -> SpoolSegment:
+        """将批次写入缓冲并返回段文件，缓冲已满时等待排空"""
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        async with self.condition:
+            if self.total_bytes >= self.max_bytes:
+                logger.warning(f"本地缓冲已满（{self.total_bytes} 字节），等待数据库排空")
+                await self.condition.wait_for(lambda: self.total_bytes < self.max_bytes)
+            sequence = self.next_sequence
+            self.next_sequence += 1
+        segment = await asyncio.to_thread(self._write, table, sequence)
+        async with self.condition:
+            self.segments.append(segment)
+            self.segments.sort(key=lambda item: item.sequence)
+            self.total_bytes += segment.size
+            self.condition.notify_all()
+        logger.debug(f"批次已写入本地缓冲: {segment}")
+        return segment
+
+    async def claim(self, max_rows: Optional[int] = None) -> List[SpoolSegment]:
+        """等待并领取最早的未被领取的段文件
+
+        指定 max_rows 时继续领取紧随其后的段文件，把多个小批次合并为一次写入，合计不超过 max_rows 行。
+        """
+        async with self.condition:
+            await self.condition.wait_for(lambda: any(s.sequence not in self.claimed for s in self.segments))
+            claimed = []
+            rows = 0
+            for segment in self.segments:
+                if segment.sequence in self.claimed:
+                    if claimed:
+                        break
+                    continue
+                # 失败过的段文件单独加载，失败只计入它自己
+                if claimed and (max_rows is None or rows + segment.rows > max_rows
+                                or segment.sequence in self.attempts or claimed[0].sequence in self.attempts):
+                    break
+                claimed.append(segment)
+                rows += segment.rows
+            self.claimed.update(segment.sequence for segment in claimed)
+            return claimed
+
+    async def release(self, segment: SpoolSegment) -> None:
+        """加载失败时归还段文件，稍后重试"""
+        async with self.condition:
+            self.claimed.discard(segment.sequence)
+            self.condition.notify_all()
+
+    async def fail(self, segment: SpoolSegment) -> bool:
+        """记录一次加载失败并归还段文件，达到 max_attempts 次时移入隔离目录，返回是否已隔离"""
+        attempts = self.attempts.get(segment.sequence, 0) + 1
+        if attempts < self.max_attempts:
+            self.attempts[segment.sequence] = attempts
+            await self.release(segment)
+            return False
+        directory = os.path.join(self.directory, self.QUARANTINE_DIR)
+        os.makedirs(directory, exist_ok=True)
+        os.replace(segment.path, os.path.join(directory, os.path.basename(segment.path)))
+        await self._remove(segment)
+        self.quarantined += 1
+        logger.error(f"段文件加载失败 {attempts} 次，已移入隔离目录 {directory}: {segment}")
+        return True
+
+    async def ack(self, segment: SpoolSegment) -> None:
+        """段文件已加载到数据库，删除文件并释放空间"""
+        try:
+            os.remove(segment.path)
+        except FileNotFoundError:
+            pass
+        await self._remove(segment)
+
+    async def _remove(self, segment: SpoolSegment) -> None:
+        async with self.condition:
+            self.segments = [s for s in self.segments if s.sequence != segment.sequence]
+            self.claimed.discard(segment.sequence)
+            self.attempts.pop(segment.sequence, None)
+            self.total_bytes -= segment.size
+            self.condition.notify_all()
+
+    def close(self) -> None:
+        """段文件都已落盘，关闭时只记录尚未加载的批次，下次启动时重放"""
+        if self.segments:
+            logger.info(f"本地缓冲中尚有 {len(self.segments)} 个批次（{self.total_bytes} 字节）未加载，下次启动时重放")
+
+    def metrics(self) -> dict:
+        return {
+            'segments': len(self.segments),
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'retrying': len(self.attempts),
+            'quarantined': self.quarantined,
+            'utilization': self.total_bytes / self.max_bytes if self.max_bytes else 0.0
+        }
+
+class SpoolDrainer:
+    """后台排空协程，按数据库能承受的速度把缓冲中的批次加载到数据库
+
+    连续的小批次合并为一次写入，合计行数由 batch_rows 给出（通常为加载器当前的自适应批次行数）；
+    加载失败的批次按指数退避重试，加载本身是幂等的，重放不会产生重复订单。
+    数据库暂时不可用（连接错误、超时）时只等待重试；其他错误计入段文件的失败次数，
+    反复失败的段文件由缓冲隔离，一个坏批次不会一直占住队首。
+    """
+
+    def __init__(self, spool: WriteAheadSpool, load: Callable[[pd.DataFrame], Awaitable[None]],
+                 on_loaded: Optional[Callable[[pd.DataFrame], None]] = None,
+                 retry_initial_seconds: float = 1.0, retry_max_seconds: float = 60.0,
+                 batch_rows: Optional[Callable[[], int]] = None):
+        self.spool = spool
+        self.load = load
+        self.on_loaded = on_loaded
+        self.retry_initial_seconds = retry_initial_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.retry_delay = retry_initial_seconds
+        self.batch_rows = batch_rows
+        self.loaded_segments = 0
+        self.loaded_rows = 0
+        self.failures = 0
+
+    @staticmethod
+    def _read(segments: List[SpoolSegment]) -> pd.DataFrame:
+        tables = [segment.read() for segment in segments]
+        table = tables[0] if len(tables) == 1 else pa.concat_tables(tables, promote_options='permissive')
+        # 各批次的字典编码列字典不同，合并为统一的字典
+        return table.unify_dictionaries().to_pandas(types_mapper=pd.ArrowDtype)
+
+    async def _release(self, segments: List[SpoolSegment]) -> None:
+        for segment in segments:
+            await self.spool.release(segment)
+
+    async def run(self) -> None:
+        logger.debug("缓冲排空协程启动")
+        while True:
+            segments = await self.spool.claim(self.batch_rows() if self.batch_rows is not None else None)
+            try:
+                df = await asyncio.to_thread(self._read, segments)
+                await self.load(df)
+            except asyncio.CancelledError:
+                await self._release(segments)
+                raise
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"从本地缓冲加载批次失败，{self.retry_delay:.0f}秒后重试: {segments}, {str(e)}")
+                if isinstance(e, TRANSIENT_ERRORS):
+                    await self._release(segments)
+                else:
+                    quarantined = [await self.spool.fail(segment) for segment in segments]
+                    if all(quarantined):
+                        continue
+                await asyncio.sleep(self.retry_delay)
+                self.retry_delay = min(self.retry_delay * 2, self.retry_max_seconds)
+                continue
+            self.retry_delay = self.retry_initial_seconds
+            for segment in segments:
+                await self.spool.ack(segment)
+            self.loaded_segments += len(segments)
+            self.loaded_rows += len(df)
+            if self.on_loaded is not None:
+                self.on_loaded(df)
+            logger.debug(f"本地缓冲批次已加载: {segments}")
@@ -0,0 +1,103 @@
+import asyncio
+import sqlite3
+import threading
+import pandas as pd
+import pyarrow as pa
+from loguru import logger
+from typing import List
+from .sinks import Sink
+
+def _sqlite_type(data_type: pa.DataType) -> str:
+    """将 Arrow 类型映射为 SQLite 列类型，金额等精确小数以文本保存"""
+    if pa.types.is_dictionary(data_type):
+        data_type = data_type.value_type
+    if pa.types.is_integer(data_type) or pa.types.is_boolean(data_type):
+        return 'INTEGER'
+    if pa.types.is_floating(data_type):
+        return 'REAL'
+    return 'TEXT'
+
+class SQLiteSink(Sink):
+    """写入嵌入式 SQLite 数据库，不依赖数据库服务，适合本地运行和测试
+
+    order_id 为主键，已存在的订单直接跳过，重复写入同一批次是空操作。
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, db_file: str = 'orders.db', table: str = 'orders'):
+        self.db_file = db_file
+        self.table = table
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_file, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.columns: List[str] = [row[1] for row in self.conn.execute(f'PRAGMA table_info({table})')]
+        # 指标
+        self.batches = 0
+        self.inserted = 0
+        self.skipped = 0
+        logger.info(f"SQLite 写入目标已打开: {db_file}")
+
+    def _ensure_table(self, schema: pa.Schema) -> None:
+        """首次写入时按批次的列创建表，之后出现的新列自动添加"""
+        if not self.columns:
+            columns = ', '.join(
+                f'{field.name} {_sqlite_type(field.type)}' + (' PRIMARY KEY' if field.name == 'order_id' else '')
+                for field in schema
+            )
+            self.conn.execute(f'CREATE TABLE IF NOT EXISTS {self.table} ({columns})')
+            self.columns = schema.names
+            return
+        for field in schema:
+            if field.name not in self.columns:
+                self.conn.execute(f'ALTER TABLE {self.table} ADD COLUMN {field.name} {_sqlite_type(field.type)}')
+                self.columns.append(field.name)
+
+    @staticmethod
+    def _records(table: pa.Table) -> List[tuple]:
+        columns = []
+        for name in table.column_names:
+            values = table[name]
+            if pa.types.is_dictionary(values.type):
+                values = values.cast(values.type.value_type)
+            if pa.types.is_decimal(values.type) or pa.types.is_timestamp(values.type) or pa.types.is_date(values.type):
+                # 精确小数和时间以文本保存，时间格式与 SQLite 日期函数兼容
+                values = values.cast(pa.string())
+            columns.append(values.to_pylist())
+        return list(zip(*columns))
+
+    def _write(self, table: pa.Table) -> int:
+        with self.lock:
+            self._ensure_table(table.schema)
+            columns = ', '.join(table.column_names)
+            placeholders = ', '.join('?' * table.num_columns)
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                before = self.conn.total_changes
+                self.conn.executemany(
+                    f'INSERT OR IGNORE INTO {self.table} ({columns}) VALUES ({placeholders})', self._records(table)
+                )
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+            return self.conn.total_changes - before
+
+    async def load(self, df: pd.DataFrame) -> None:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        inserted = await asyncio.to_thread(self._write, table)
+        self.batches += 1
+        self.inserted += inserted
+        self.skipped += table.num_rows - inserted
+        logger.info(f"成功写入 {inserted} 条数据到 SQLite，跳过已存在的订单 {table.num_rows - inserted} 条")
+
+    def metrics(self) -> dict:
+        return {'batches': self.batches, 'inserted': self.inserted, 'skipped': self.skipped}
+
+    def log_metrics(self) -> None:
+        logger.info(f"SQLite 写入指标: 批次 {self.batches}个，写入 {self.inserted}条，跳过 {self.skipped}条")
+
+    async def close(self) -> None:
+        with self.lock:
+            self.conn.close()
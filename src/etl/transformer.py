@@ -1,56 +1,212 @@
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 from loguru import logger
-from typing import Optional
+from typing import Optional, Union
+from .log_parser import LogInfoParser
+from .plan import Aggregate, Dedup, Derive, Filter, Observe, TransformPlan
+from .schema import ORDER_SCHEMA
+from ..config import STATS_CONFIG, TRANSFORM_CONFIG, USER_STATS_CONFIG
+from ..monitor.stats_collector import StatsCollector
+from ..utils.user_stats import UserAggregateStore
+
+ADDRESS_COLUMNS = ['province', 'city', 'district', 'street']
+# 统计收集器需要读取的原始列
+STATS_INPUT_COLUMNS = ['order_status', 'payment_method', 'province', 'log_info', 'order_date', 'total_price']
 
 class DataTransformer:
-    def __init__(self):
-        pass
+    def __init__(self, engine: Optional[str] = None, user_stats: Optional[UserAggregateStore] = None,
+                 stats: Optional[StatsCollector] = None):
+        # 转换引擎: arrow 为列式向量化实现，pandas 为原有的逐行实现
+        self.engine = engine or TRANSFORM_CONFIG['engine']
+        self.valid_status = pa.array(TRANSFORM_CONFIG['valid_status'])
+        self.log_parser = LogInfoParser(TRANSFORM_CONFIG['log_info_fields'])
+        # 按用户累计的聚合存储，avg_price 取跨文件的累计平均值
+        if user_stats is None and USER_STATS_CONFIG['enabled']:
+            user_stats = UserAggregateStore(USER_STATS_CONFIG['db_file'])
+        self.user_stats = user_stats
+        self.stats = stats or StatsCollector.from_config(STATS_CONFIG)
+        # 下游加载需要的列，派生列只在被需要时计算
+        self.output_columns = TRANSFORM_CONFIG['output_columns'] or ORDER_SCHEMA.names
+        self.plan = self._build_plan()
 
-    async def transform(self, df: pd.DataFrame) -> Optional[pd.DataFrame]:
+    async def transform(self, df: Union[pd.DataFrame, pa.Table]) -> Optional[pd.DataFrame]:
         """执行数据转换操作"""
         try:
-            logger.info("开始数据转换处理")
-            
-            # 记录原始数据统计
-            total_records = len(df)
-            logger.info(f"原始数据统计:\n- 总记录数: {total_records}条")
-
-            # 去重统计
-            df_deduped = df.drop_duplicates(subset=['user_id', 'order_id'])
-            duplicates_count = total_records - len(df_deduped)
-            logger.info(f"数据去重:\n- 重复记录数: {duplicates_count}条\n- 去重后记录数: {len(df_deduped)}条")
-            df = df_deduped
-            
+            if self.engine == 'pandas':
+                if isinstance(df, pa.Table):
+                    df = df.to_pandas(types_mapper=pd.ArrowDtype)
+                return self._transform_pandas(df)
+            table = df if isinstance(df, pa.Table) else pa.Table.from_pandas(df, preserve_index=False)
+            return self.transform_table(table).to_pandas(types_mapper=pd.ArrowDtype)
+        except Exception as e:
+            logger.error(f"数据转换过程中发生错误: {str(e)}")
+            raise
+
+    def _build_plan(self) -> TransformPlan:
+        """按原有语义顺序声明转换步骤，执行顺序由 TransformPlan 优化"""
+        return TransformPlan([
+            # 去重：保留每个 (user_id, order_id) 第一次出现的行
+            Dedup('drop_duplicates', ['user_id', 'order_id'], self._dedup_step),
             # 计算折扣率和订单平均价格
-            df['discount_rate'] = df['discount'] / df['total_price']
+            Derive('discount_rate', ['discount', 'total_price'], ['discount_rate'],
+                   lambda table: {'discount_rate': pc.divide(table['discount'], table['total_price'])}),
+            Aggregate('avg_price', ['order_id', 'user_id', 'total_price', 'order_date'], ['avg_price'],
+                      lambda table: {'avg_price': self._avg_price(table['order_id'], table['user_id'],
+                                                                  table['total_price'], table['order_date'])}),
+            # 一次性解析日志字段中的设备、系统、浏览器等信息
+            Derive('log_info', ['log_info'], [self.log_parser.column_name(field) for field in self.log_parser.fields],
+                   lambda table: {name: values for name, values in zip(*self._parse_log_info(table))}),
+            # 日期格式转换（提取阶段已按 Schema 解析的列无需再次转换）
+            Derive('order_date', ['order_date'], ['order_date'], self._parse_order_date),
+            # 合并地址字段
+            Derive('full_address', ADDRESS_COLUMNS, ['full_address'], self._full_address),
+            # 过滤前的分布统计交给统计收集器增量累加
+            Observe('collect_stats', STATS_INPUT_COLUMNS, lambda table: self.stats.update(table, 'transformed')),
+            # 过滤有效订单
+            Filter('valid_status', ['order_status'], self._valid_status_mask)
+        ], output_columns=self.output_columns)
+
+    def transform_table(self, table: pa.Table) -> pa.Table:
+        """执行声明式转换计划：先去重、统计和过滤，派生列只对保留的行、且只在输出需要时计算"""
+        logger.info("开始数据转换处理")
+
+        # 记录原始数据统计
+        logger.info(f"原始数据统计:\n- 总记录数: {table.num_rows}条")
+
+        table = self.plan.execute(table)
+
+        logger.info(f"数据转换完成，最终数据行数: {table.num_rows}条")
+        return table
+
+    def _dedup_step(self, table: pa.Table, keys: list) -> pa.Table:
+        total_records = table.num_rows
+        table = self._drop_duplicates(table, keys)
+        logger.info(f"数据去重:\n- 重复记录数: {total_records - table.num_rows}条\n- 去重后记录数: {table.num_rows}条")
+        return table
+
+    def _parse_log_info(self, table: pa.Table):
+        log_fields = self.log_parser.parse(table['log_info'])
+        return log_fields.column_names, log_fields.columns
+
+    @staticmethod
+    def _parse_order_date(table: pa.Table) -> dict:
+        if pa.types.is_timestamp(table.schema.field('order_date').type):
+            return {}
+        return {'order_date': pa.chunked_array([pa.array(pd.to_datetime(table['order_date'].to_pandas(), format='mixed'))])}
+
+    @staticmethod
+    def _full_address(table: pa.Table) -> dict:
+        full_address = pc.binary_join_element_wise(
+            *[pc.cast(table[column], pa.string()) for column in ADDRESS_COLUMNS], ' ',
+            null_handling='replace', null_replacement=''
+        )
+        return {'full_address': pc.utf8_trim_whitespace(full_address)}
+
+    def _valid_status_mask(self, table: pa.Table) -> pa.ChunkedArray:
+        mask = pc.is_in(table['order_status'], value_set=self.valid_status)
+        logger.info(f"订单状态过滤:\n- 有效订单数: {pc.sum(mask).as_py() or 0}条")
+        return mask
+
+    @staticmethod
+    def _drop_duplicates(table: pa.Table, keys: list) -> pa.Table:
+        """按键列去重并保持原有行顺序，键列先拼接再字典编码，避免逐行比较"""
+        key = pc.binary_join_element_wise(*[pc.cast(table[name], pa.string()) for name in keys], '\x1f',
+                                          null_handling='replace', null_replacement='\x00')
+        codes = pc.dictionary_encode(key).combine_chunks().indices.to_numpy()
+        _, first_rows = np.unique(codes, return_index=True)
+        if len(first_rows) == table.num_rows:
+            return table
+        return table.take(np.sort(first_rows))
+
+    def _avg_price(self, order_ids, user_ids, prices, order_dates):
+        """更新用户累计聚合（每个 order_id 只计入一次）并返回每行的累计平均订单金额，未启用聚合存储时按批次内分组计算"""
+        if self.user_stats is None:
+            return self._group_mean(user_ids, prices)
+        if not pa.types.is_timestamp(order_dates.type):
+            order_dates = None
+        avg_price = self.user_stats.update(order_ids, user_ids, prices, order_dates)
+        return self._cast_price(avg_price, prices.type)
+
+    @staticmethod
+    def _cast_price(avg_price: pa.Array, price_type: pa.DataType) -> pa.Array:
+        if pa.types.is_decimal(price_type):
+            avg_price = pc.cast(pc.round(avg_price, price_type.scale), price_type, safe=False)
+        return avg_price
+
+    def apply_user_stats(self, df: pd.DataFrame, contributions: Optional[pa.Table]) -> pd.DataFrame:
+        """在主进程中把处理进程记录的订单计入用户累计聚合，并按累计结果填充 avg_price"""
+        if contributions is None or self.user_stats is None:
+            return df
+        order_dates = contributions['order_date'] if 'order_date' in contributions.column_names else None
+        if order_dates is not None and not pa.types.is_timestamp(order_dates.type):
+            order_dates = None
+        self.user_stats.update(contributions['order_id'], contributions['user_id'], contributions['total_price'],
+                               order_dates)
+        if 'avg_price' in df.columns:
+            avg_price = self.user_stats.averages(pa.array(df['user_id'], from_pandas=True))
+            avg_price = self._cast_price(avg_price, contributions.schema.field('total_price').type)
+            df['avg_price'] = pd.Series(avg_price.to_pandas(types_mapper=pd.ArrowDtype).array, index=df.index)
+        return df
+
+    @staticmethod
+    def _group_mean(keys: pa.ChunkedArray, values: pa.ChunkedArray) -> pa.ChunkedArray:
+        """计算分组均值并按行广播回原表，等价于 groupby().transform('mean')"""
+        codes = pc.dictionary_encode(keys).combine_chunks().indices
+        means = pa.table({'code': codes, 'value': values}).group_by('code', use_threads=False) \
+            .aggregate([('value', 'mean')]).sort_by('code')['value_mean']
+        return pc.take(means, codes)
+
+    def _transform_pandas(self, df: pd.DataFrame) -> pd.DataFrame:
+        """原有的 pandas 转换实现，保留用于对照和回退"""
+        logger.info("开始数据转换处理")
+
+        # 记录原始数据统计
+        total_records = len(df)
+        logger.info(f"原始数据统计:\n- 总记录数: {total_records}条")
+
+        # 去重统计
+        df_deduped = df.drop_duplicates(subset=['user_id', 'order_id'])
+        duplicates_count = total_records - len(df_deduped)
+        logger.info(f"数据去重:\n- 重复记录数: {duplicates_count}条\n- 去重后记录数: {len(df_deduped)}条")
+        df = df_deduped
+
+        # 计算折扣率和订单平均价格
+        df['discount_rate'] = df['discount'] / df['total_price']
+        if self.user_stats is None:
             df['avg_price'] = df.groupby('user_id')['total_price'].transform('mean')
-            logger.info(f"价格统计:\n- 平均订单金额: {df['total_price'].mean():.2f}\n- 平均折扣率: {df['discount_rate'].mean():.2%}")
-            
-            # 从日志字段提取设备型号
-            df['device_model'] = df['log_info'].str.extract(r'device_model[":]\s*(?P<model>[^,"\}]+)')
+        else:
+            avg_price = self._avg_price(pa.array(df['order_id'], from_pandas=True), pa.array(df['user_id'], from_pandas=True),
+                                        pa.array(df['total_price'], from_pandas=True), pa.array(df['order_date'], from_pandas=True))
+            df['avg_price'] = pd.Series(avg_price.to_pandas(types_mapper=pd.ArrowDtype).array, index=df.index)
+        logger.info(f"价格统计:\n- 平均订单金额: {df['total_price'].mean():.2f}\n- 平均折扣率: {df['discount_rate'].mean():.2%}")
+
+        # 一次性解析日志字段中的设备、系统、浏览器等信息
+        log_fields = self.log_parser.parse(pa.array(df['log_info'], from_pandas=True))
+        for name in log_fields.column_names:
+            df[name] = pd.Series(log_fields[name].to_pandas(types_mapper=pd.ArrowDtype).array, index=df.index)
+        if 'device_model' in df.columns:
             device_stats = df['device_model'].value_counts().head()
             logger.info(f"设备统计:\n- 设备型号分布(Top 5):\n{device_stats.to_string()}")
-            
-            # 日期格式转换
+
+        # 日期格式转换（提取阶段已按 Schema 解析的列无需再次转换）
+        if not pd.api.types.is_datetime64_any_dtype(df['order_date']):
             df['order_date'] = pd.to_datetime(df['order_date'], format='mixed')
-            date_stats = df['order_date'].dt.date.value_counts().sort_index().head()
-            logger.info(f"日期统计:\n- 订单日期分布(Top 5):\n{date_stats.to_string()}")
-            
-            # 合并地址字段
-            address_columns = ['province', 'city', 'district', 'street']
-            df['full_address'] = df[address_columns].fillna('').agg(' '.join, axis=1).str.strip()
-            province_stats = df['province'].value_counts().head()
-            logger.info(f"地区统计:\n- 省份分布(Top 5):\n{province_stats.to_string()}")
-            
-            # 过滤有效订单
-            valid_orders = df[df['order_status'].isin(['completed', 'paid'])]
-            status_stats = df['order_status'].value_counts()
-            logger.info(f"订单状态统计:\n- 状态分布:\n{status_stats.to_string()}\n- 有效订单数: {len(valid_orders)}条")
-            df = valid_orders
-            
-            logger.info(f"数据转换完成，最终数据行数: {len(df)}条")
-            return df
-            
-        except Exception as e:
-            logger.error(f"数据转换过程中发生错误: {str(e)}")
-            raise
\ No newline at end of file
+        date_stats = df['order_date'].dt.date.value_counts().sort_index().head()
+        logger.info(f"日期统计:\n- 订单日期分布(Top 5):\n{date_stats.to_string()}")
+
+        # 合并地址字段
+        df['full_address'] = df[ADDRESS_COLUMNS].fillna('').agg(' '.join, axis=1).str.strip() \
+            .astype(pd.ArrowDtype(pa.string()))
+        province_stats = df['province'].value_counts().head()
+        logger.info(f"地区统计:\n- 省份分布(Top 5):\n{province_stats.to_string()}")
+
+        # 过滤有效订单
+        valid_orders = df[df['order_status'].isin(TRANSFORM_CONFIG['valid_status'])]
+        status_stats = df['order_status'].value_counts()
+        logger.info(f"订单状态统计:\n- 状态分布:\n{status_stats.to_string()}\n- 有效订单数: {len(valid_orders)}条")
+        df = valid_orders
+
+        logger.info(f"数据转换完成，最终数据行数: {len(df)}条")
+        return df
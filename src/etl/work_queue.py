@@ -0,0 +1,79 @@
+import os
+import re
+import time
+import heapq
+import asyncio
+import itertools
+from datetime import datetime
+from typing import Dict, Tuple
+from .format_cache import FormatCache
+
+# 文件名中的时间戳，例如 order_data_20250305_063619_0459.csv
+FILE_TIMESTAMP_PATTERN = re.compile(r'(\d{8})[_\-T]?(\d{6})')
+
+def file_timestamp(file_path: str) -> float:
+    """返回文件名中的时间戳，文件名中没有时使用修改时间"""
+    match = FILE_TIMESTAMP_PATTERN.search(os.path.basename(file_path))
+    if match:
+        try:
+            return datetime.strptime(''.join(match.groups()), '%Y%m%d%H%M%S').timestamp()
+        except ValueError:
+            pass
+    try:
+        return os.path.getmtime(file_path)
+    except OSError:
+        return time.time()
+
+def file_size(file_path: str) -> int:
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return 0
+
+class PriorityWorkQueue(asyncio.Queue):
+    """有界的文件处理队列，按可配置的策略决定出队顺序
+
+    - oldest: 按文件名中的时间戳（没有时按修改时间）从早到晚
+    - smallest: 按文件大小从小到大，小文件先处理以尽快降低积压的文件数
+    - fair: 按数据源（文件名前缀）轮流出队，一个数据源的大量积压不会阻塞其他数据源
+    - fifo: 按入队顺序
+
+    队列满时 put 等待，积压不会无限增长（背压）。
+    """
+
+    POLICIES = ('oldest', 'smallest', 'fair', 'fifo')
+
+    def __init__(self, maxsize: int = 0, policy: str = 'oldest'):
+        if policy not in self.POLICIES:
+            raise ValueError(f"未知的队列优先级策略: {policy}")
+        self.policy = policy
+        super().__init__(maxsize)
+
+    def _init(self, maxsize: int) -> None:
+        self._queue = []
+        self._sequence = itertools.count()
+        # 公平策略: 每个数据源上一个文件的虚拟时间，以及最近出队文件的虚拟时间
+        self._producer_time: Dict[str, int] = {}
+        self._virtual_time = 0
+
+    def _key(self, file_path: str) -> Tuple:
+        if self.policy == 'oldest':
+            return (file_timestamp(file_path),)
+        if self.policy == 'smallest':
+            return (file_size(file_path),)
+        if self.policy == 'fair':
+            producer = FormatCache.source_prefix(file_path)
+            # 新出现或空闲过的数据源从当前虚拟时间开始排队，不会因为之前空闲而插队很多
+            start = max(self._producer_time.get(producer, 0), self._virtual_time) + 1
+            self._producer_time[producer] = start
+            return (start,)
+        return ()
+
+    def _put(self, file_path: str) -> None:
+        heapq.heappush(self._queue, (self._key(file_path), next(self._sequence), file_path))
+
+    def _get(self) -> str:
+        key, _, file_path = heapq.heappop(self._queue)
+        if self.policy == 'fair':
+            self._virtual_time = key[0]
+        return file_path
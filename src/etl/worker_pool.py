@@ -0,0 +1,125 @@
+import time
+import asyncio
+from loguru import logger
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+class AutoscalingWorkerPool:
+    """按队列深度和处理耗时自动伸缩的工作协程池
+
+    每个工作协程循环执行 acquire 取得一项工作，再交给 process 处理。
+    每隔 scale_interval 秒检查一次：队列积压超过当前协程数且所有协程都在忙、平均处理耗时未超过
+    target_latency 时增加一个协程；队列为空且有空闲协程，或平均处理耗时超过 target_latency
+    （下游已饱和，再增加并发只会更慢）时减少一个协程。
+    减少协程时只标记退出，协程处理完手头的工作后结束，不会丢失已取出的工作。
+    acquire 本身包含处理（例如收集微批时提取文件）时，acquiring 返回其中正在处理的协程数，计入忙碌协程。
+    """
+
+    def __init__(self, acquire: Callable[[], Awaitable[Any]], process: Callable[[Any], Awaitable[None]],
+                 queue: asyncio.Queue, min_workers: int = 1, max_workers: int = 10,
+                 initial_workers: Optional[int] = None, target_latency: float = 30.0,
+                 scale_interval: float = 5.0, smoothing: float = 0.3,
+                 acquiring: Optional[Callable[[], int]] = None, name: str = '工作协程池'):
+        self.acquire = acquire
+        self.process = process
+        self.queue = queue
+        self.min_workers = max(1, min_workers)
+        self.max_workers = max(self.min_workers, max_workers)
+        self.initial_workers = min(max(initial_workers or self.min_workers, self.min_workers), self.max_workers)
+        self.target_latency = target_latency
+        self.scale_interval = scale_interval
+        self.smoothing = smoothing
+        self.acquiring = acquiring
+        self.name = name
+        self.workers: Dict[int, asyncio.Task] = {}
+        self.retiring: Set[int] = set()
+        self._ids = 0
+        # 指标
+        self.busy = 0
+        self.processed = 0
+        self.latency: Optional[float] = None
+        self.scale_ups = 0
+        self.scale_downs = 0
+
+    @property
+    def active(self) -> int:
+        """未标记退出的协程数"""
+        return len(self.workers) - len(self.retiring)
+
+    def _busy(self) -> int:
+        return self.busy + (self.acquiring() if self.acquiring is not None else 0)
+
+    def _start_worker(self) -> None:
+        worker_id = self._ids
+        self._ids += 1
+        self.workers[worker_id] = asyncio.create_task(self._worker(worker_id))
+
+    def _retire_worker(self) -> None:
+        """标记最近启动的一个协程退出"""
+        candidates = [worker_id for worker_id in self.workers if worker_id not in self.retiring]
+        if candidates:
+            self.retiring.add(candidates[-1])
+
+    async def _worker(self, worker_id: int) -> None:
+        logger.debug(f"{self.name}的工作协程 {worker_id} 启动")
+        try:
+            while worker_id not in self.retiring:
+                item = await self.acquire()
+                self.busy += 1
+                start = time.perf_counter()
+                try:
+                    await self.process(item)
+                except Exception as e:
+                    logger.error(f"工作协程 {worker_id} 处理时发生错误: {str(e)}")
+                    logger.exception(e)
+                finally:
+                    self.busy -= 1
+                    self.processed += 1
+                    elapsed = time.perf_counter() - start
+                    self.latency = elapsed if self.latency is None else \
+                        self.latency + self.smoothing * (elapsed - self.latency)
+        finally:
+            self.workers.pop(worker_id, None)
+            self.retiring.discard(worker_id)
+            logger.debug(f"{self.name}的工作协程 {worker_id} 退出")
+
+    def _scale(self) -> None:
+        depth = self.queue.qsize()
+        active = self.active
+        overloaded = self.latency is not None and self.latency > self.target_latency
+        busy = self._busy()
+        if depth > active and busy >= active and not overloaded and active < self.max_workers:
+            self._start_worker()
+            self.scale_ups += 1
+            logger.info(f"{self.name}: 队列积压 {depth} 项，增加工作协程到 {self.active} 个")
+        elif active > self.min_workers and ((depth == 0 and busy < active) or overloaded):
+            self._retire_worker()
+            self.scale_downs += 1
+            reason = f"平均处理耗时 {self.latency:.2f}秒超过目标" if overloaded else "队列已空"
+            logger.info(f"{self.name}: {reason}，减少工作协程到 {self.active} 个")
+
+    async def run(self) -> None:
+        """启动初始的工作协程并定期伸缩，被取消时停止所有工作协程"""
+        for _ in range(self.initial_workers):
+            self._start_worker()
+        logger.info(f"{self.name}已启动，协程数: {self.initial_workers}（{self.min_workers}-{self.max_workers}）")
+        try:
+            while True:
+                await asyncio.sleep(self.scale_interval)
+                self._scale()
+        finally:
+            workers = list(self.workers.values())
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    def metrics(self) -> dict:
+        return {
+            'workers': self.active,
+            'busy': self._busy(),
+            'queue_depth': self.queue.qsize(),
+            'queue_maxsize': self.queue.maxsize,
+            'processed': self.processed,
+            'latency': self.latency or 0.0,
+            'scale_ups': self.scale_ups,
+            'scale_downs': self.scale_downs
+        }
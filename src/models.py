@@ -1,5 +1,6 @@
 from tortoise import Model, fields
 from typing import Optional
+from .config import DB_CONFIG, DB_POOL_CONFIG
 
 class Order(Model):
     """订单数据模型"""
@@ -26,6 +27,12 @@ class Order(Model):
     tax = fields.DecimalField(max_digits=10, decimal_places=2)
     delivery_time = fields.DatetimeField()
     device_model = fields.CharField(max_length=50, null=True)
+    os_version = fields.CharField(max_length=50, null=True)
+    browser = fields.CharField(max_length=50, null=True)
+    browser_version = fields.CharField(max_length=50, null=True)
+    ip_address = fields.CharField(max_length=45, null=True)
+    user_agent = fields.CharField(max_length=255, null=True)
+    log_timestamp = fields.DatetimeField(null=True)
     log_info = fields.TextField()
     
     class Meta:
@@ -36,11 +43,15 @@ DATABASE_CONFIG = {
         'default': {
             'engine': 'tortoise.backends.asyncpg',
             'credentials': {
-                'host': 'localhost',
-                'port': '5432',
-                'user': 'postgres',
-                'password': 'postgres',
-                'database': 'etl_db',
+                'host': DB_CONFIG['host'],
+                'port': DB_CONFIG['port'],
+                'user': DB_CONFIG['user'],
+                'password': DB_CONFIG['password'],
+                'database': DB_CONFIG['dbname'],
+                'minsize': DB_POOL_CONFIG['min_size'],
+                'maxsize': DB_POOL_CONFIG['max_size'],
+                'timeout': DB_POOL_CONFIG['connect_timeout'],
+                'max_inactive_connection_lifetime': DB_POOL_CONFIG['max_inactive_connection_lifetime'],
             }
         }
     },
@@ -0,0 +1,235 @@
+import math
+import time
+import threading
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from collections import Counter, OrderedDict
+from loguru import logger
+from typing import Dict, Iterable, List, Optional, Union
+
+# 统计设备分布时使用的正则，兼容 dict repr 的单引号和 JSON 的双引号
+DEVICE_MODEL_PATTERN = r'[\'"]device_model[\'"]:\s*[\'"](?P<model>[^\'"]*)'
+
+class QuantileSketch:
+    """相对误差有界的可合并分位数草图（对数分桶，DDSketch 思路）
+
+    每个值落入下标为 ceil(log_gamma(x)) 的桶，任意分位数的相对误差不超过 relative_accuracy；
+    两个草图合并只需把桶计数相加，因此可以跨文件、跨进程、跨时间窗口合并。
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.bins: Counter = Counter()
+        self.zero_count = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def update(self, values: np.ndarray, weight: float = 1.0) -> None:
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        positive = values[values > 0]
+        self.zero_count += (len(values) - len(positive)) * weight
+        if len(positive):
+            keys, counts = np.unique(np.ceil(np.log(positive) / self.log_gamma).astype(np.int64), return_counts=True)
+            for key, count in zip(keys.tolist(), counts.tolist()):
+                self.bins[key] += count * weight
+        self.count += len(values) * weight
+        self.total += float(values.sum()) * weight
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    def merge(self, other: 'QuantileSketch') -> None:
+        self.bins.update(other.bins)
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return min(max(0.0, self.min), self.max)
+        seen = self.zero_count
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                value = 2 * self.gamma ** key / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def describe(self) -> pd.Series:
+        """输出与 pandas describe 相同格式的统计结果"""
+        return pd.Series({
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'min': self.min if self.count else None,
+            '25%': self.quantile(0.25),
+            '50%': self.quantile(0.5),
+            '75%': self.quantile(0.75),
+            'max': self.max if self.count else None
+        })
+
+class StatsWindow:
+    """一个时间窗口内的统计，由各维度的计数器和金额分位数草图组成，可合并"""
+
+    def __init__(self, dimensions: Iterable[str], relative_accuracy: float = 0.01):
+        self.counters: Dict[str, Counter] = {dimension: Counter() for dimension in dimensions}
+        self.price = QuantileSketch(relative_accuracy)
+        self.rows = 0
+        self.sampled_rows = 0
+
+    def merge(self, other: 'StatsWindow') -> None:
+        for dimension, counter in other.counters.items():
+            self.counters.setdefault(dimension, Counter()).update(counter)
+        self.price.merge(other.price)
+        self.rows += other.rows
+        self.sampled_rows += other.sampled_rows
+
+class StatsCollector:
+    """可插拔的流式统计收集器
+
+    按阶段（如 transformed / loaded）和固定时间窗口增量累加计数器与分位数草图，
+    支持按比例抽样或整体关闭，日志输出时再按需合并任意时间范围内的窗口。
+    """
+
+    def __init__(self, dimensions: Optional[List[str]] = None, enabled: bool = True, sample_rate: float = 1.0,
+                 window_seconds: int = 60, retention_windows: int = 60, relative_accuracy: float = 0.01):
+        self.dimensions = dimensions or ['order_status', 'payment_method', 'province', 'device_model', 'order_date']
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.window_seconds = window_seconds
+        self.retention_windows = retention_windows
+        self.relative_accuracy = relative_accuracy
+        self.windows: Dict[str, 'OrderedDict[int, StatsWindow]'] = {}
+        self.lock = threading.Lock()
+        self.rng = np.random.default_rng()
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'StatsCollector':
+        return cls(
+            dimensions=config.get('dimensions'),
+            enabled=config.get('enabled', True),
+            sample_rate=config.get('sample_rate', 1.0),
+            window_seconds=config.get('window_seconds', 60),
+            retention_windows=config.get('retention_windows', 60),
+            relative_accuracy=config.get('relative_accuracy', 0.01)
+        )
+
+    def _new_window(self) -> StatsWindow:
+        return StatsWindow(self.dimensions, self.relative_accuracy)
+
+    @staticmethod
+    def _dimension_values(table: pa.Table, dimension: str) -> Optional[pa.ChunkedArray]:
+        if dimension == 'device_model' and dimension not in table.column_names and 'log_info' in table.column_names:
+            return pc.struct_field(pc.extract_regex(table['log_info'], DEVICE_MODEL_PATTERN), 'model')
+        if dimension not in table.column_names:
+            return None
+        values = table[dimension]
+        if dimension == 'order_date' and pa.types.is_timestamp(values.type):
+            return pc.cast(values, pa.date32())
+        return values
+
+    def update(self, data: Union[pa.Table, pd.DataFrame], stage: str = 'transformed') -> None:
+        """将一批数据增量累加到当前时间窗口"""
+        if not self.enabled or data is None or len(data) == 0:
+            return
+        table = data if isinstance(data, pa.Table) else pa.Table.from_pandas(data, preserve_index=False)
+        rows = table.num_rows
+        if self.sample_rate < 1.0:
+            table = table.filter(pa.array(self.rng.random(rows) < self.sample_rate))
+        weight = 1.0 / self.sample_rate if self.sample_rate < 1.0 else 1.0
+
+        window = self._new_window()
+        window.rows = rows
+        window.sampled_rows = table.num_rows
+        for dimension in self.dimensions:
+            values = self._dimension_values(table, dimension)
+            if values is None:
+                continue
+            counts = pc.value_counts(values)
+            for value, count in zip(counts.field('values').to_pylist(), counts.field('counts').to_pylist()):
+                if value is not None:
+                    window.counters[dimension][value] += count * weight
+        if 'total_price' in table.column_names:
+            prices = pc.cast(table['total_price'], pa.float64()).to_numpy(zero_copy_only=False)
+            window.price.update(prices, weight)
+        self.merge_window(stage, int(time.time() // self.window_seconds), window)
+
+    def merge_window(self, stage: str, window_key: int, window: StatsWindow) -> None:
+        """合并一个窗口的统计，也用于合并其他进程产生的统计"""
+        with self.lock:
+            windows = self.windows.setdefault(stage, OrderedDict())
+            if window_key in windows:
+                windows[window_key].merge(window)
+            else:
+                windows[window_key] = window
+                # 按窗口时间排序并淘汰过期窗口
+                for key in sorted(windows):
+                    windows.move_to_end(key)
+                while len(windows) > self.retention_windows:
+                    windows.popitem(last=False)
+
+    def merge(self, other: 'StatsCollector') -> None:
+        """合并另一个收集器的全部窗口"""
+        with other.lock:
+            items = [(stage, key, window) for stage, windows in other.windows.items() for key, window in windows.items()]
+        for stage, key, window in items:
+            self.merge_window(stage, key, window)
+
+    def drain(self) -> 'StatsCollector':
+        """取出并清空当前收集的统计，用于把子进程的统计交给主进程合并"""
+        drained = StatsCollector(self.dimensions, self.enabled, self.sample_rate, self.window_seconds,
+                                 self.retention_windows, self.relative_accuracy)
+        with self.lock:
+            drained.windows, self.windows = self.windows, {}
+        return drained
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def snapshot(self, stage: str = 'transformed', seconds: Optional[int] = None) -> StatsWindow:
+        """合并最近 seconds 秒（默认全部保留窗口）内的统计"""
+        merged = self._new_window()
+        since = None if seconds is None else int((time.time() - seconds) // self.window_seconds)
+        with self.lock:
+            for key, window in self.windows.get(stage, {}).items():
+                if since is None or key >= since:
+                    merged.merge(window)
+        return merged
+
+    def report(self, stage: str = 'transformed', seconds: Optional[int] = None, top: int = 5) -> str:
+        window = self.snapshot(stage, seconds)
+        period = '全部保留窗口' if seconds is None else f'最近 {seconds} 秒'
+        lines = [f"统计汇总 [{stage}]（{period}）:", f"- 总记录数: {window.rows}条（抽样 {window.sampled_rows}条）"]
+        for dimension, counter in window.counters.items():
+            if not counter:
+                continue
+            if dimension == 'order_date':
+                items = sorted(counter.items())[:top]
+            else:
+                items = counter.most_common(top)
+            distribution = pd.Series({str(key): round(value) for key, value in items}).to_string()
+            lines.append(f"- {dimension} 分布(Top {top}):\n{distribution}")
+        if window.price.count:
+            lines.append(f"- 订单金额统计:\n{window.price.describe().to_string()}")
+        return '\n'.join(lines)
+
+    def log_report(self, stage: str = 'transformed', seconds: Optional[int] = None) -> None:
+        if self.enabled:
+            logger.info(self.report(stage, seconds))
@@ -0,0 +1,88 @@
+import os
+import math
+import mmap
+import struct
+import hashlib
+from loguru import logger
+from typing import Iterator, Optional
+
+class BloomBitmap:
+    """保存在文件中、以内存映射方式访问的布隆过滤器
+
+    位图直接映射到文件，启动时只需映射，不需要读入或重建；写入由操作系统回写。
+    文件头记录位数、哈希函数个数、容量和保存时的元素个数，元素个数由调用方与精确索引比对，
+    不一致（例如上次运行异常退出）时应重建。
+    """
+
+    MAGIC = b'ETLBLOOM'
+    # 文件头: 魔数, 位数, 哈希函数个数, 容量, 元素个数
+    HEADER = struct.Struct('<8sQQQQ')
+
+    def __init__(self, path: str, mm: mmap.mmap, num_bits: int, num_hashes: int, capacity: int, count: int):
+        self.path = path
+        self.mm = mm
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.capacity = capacity
+        self.count = count
+        self.offset = self.HEADER.size
+
+    @classmethod
+    def create(cls, path: str, capacity: int, error_rate: float) -> 'BloomBitmap':
+        """按容量和误判率创建新的全零位图，先写临时文件再替换"""
+        capacity = max(capacity, 1)
+        num_bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(cls.HEADER.pack(cls.MAGIC, num_bits, num_hashes, capacity, 0))
+            f.truncate(cls.HEADER.size + (num_bits + 7) // 8)
+        os.replace(tmp_path, path)
+        return cls.open(path)
+
+    @classmethod
+    def open(cls, path: str) -> Optional['BloomBitmap']:
+        """映射已有的位图文件，文件不存在或不完整时返回 None"""
+        try:
+            with open(path, 'r+b') as f:
+                mm = mmap.mmap(f.fileno(), 0)
+        except (FileNotFoundError, ValueError):
+            return None
+        if len(mm) < cls.HEADER.size:
+            mm.close()
+            return None
+        magic, num_bits, num_hashes, capacity, count = cls.HEADER.unpack_from(mm)
+        if magic != cls.MAGIC or len(mm) != cls.HEADER.size + (num_bits + 7) // 8:
+            mm.close()
+            return None
+        return cls(path, mm, num_bits, num_hashes, capacity, count)
+
+    def _positions(self, key: str) -> Iterator[int]:
+        # 双重哈希: 由一个 128 位摘要派生 k 个位置
+        h1, h2 = struct.unpack('<QQ', hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest())
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            index = self.offset + (position >> 3)
+            self.mm[index] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.mm[self.offset + (position >> 3)] & (1 << (position & 7)) for position in self._positions(key))
+
+    def flush(self, count: int) -> None:
+        """记录元素个数并把位图回写到文件"""
+        self.count = count
+        self.HEADER.pack_into(self.mm, 0, self.MAGIC, self.num_bits, self.num_hashes, self.capacity, count)
+        self.mm.flush()
+
+    def invalidate(self) -> None:
+        """运行期间位图与文件头中的元素个数不一致，异常退出后下次启动会重建"""
+        self.HEADER.pack_into(self.mm, 0, self.MAGIC, self.num_bits, self.num_hashes, self.capacity, 2 ** 64 - 1)
+
+    def close(self) -> None:
+        try:
+            self.mm.close()
+        except Exception as e:
+            logger.error(f"关闭布隆过滤器位图时发生错误: {str(e)}")
@@ -0,0 +1,135 @@
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from loguru import logger
+from tortoise import Tortoise, connections
+from typing import AsyncIterator, Optional
+from ..config import DB_POOL_CONFIG
+from ..models import DATABASE_CONFIG
+
+class DatabasePool:
+    """按配置初始化的共享数据库连接池
+
+    Tortoise ORM 和 COPY 写入使用同一个 asyncpg 连接池，初始化只执行一次；
+    获取连接有超时，并记录等待时间和连接占用情况。
+    """
+
+    def __init__(self, acquire_timeout: Optional[float] = None):
+        self.acquire_timeout = acquire_timeout if acquire_timeout is not None else DB_POOL_CONFIG['acquire_timeout']
+        self.min_size = DB_POOL_CONFIG['min_size']
+        self.max_size = DB_POOL_CONFIG['max_size']
+        self.initialized = False
+        self._init_lock = asyncio.Lock()
+        # 指标
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.acquired = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def init(self) -> None:
+        """初始化 Tortoise 和连接池，多个协程并发调用时只初始化一次"""
+        if self.initialized:
+            return
+        async with self._init_lock:
+            if not self.initialized:
+                await Tortoise.init(config=DATABASE_CONFIG)
+                self.initialized = True
+                logger.info(f"数据库连接池已初始化，连接数: {self.min_size}-{self.max_size}")
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator:
+        """从共享连接池获取一个 asyncpg 连接，超过 acquire_timeout 未获取到时抛出 TimeoutError"""
+        await self.init()
+        wrapper = connections.get('default').acquire_connection()
+        start = time.perf_counter()
+        try:
+            async with asyncio.timeout(self.acquire_timeout):
+                conn = await wrapper.__aenter__()
+        except TimeoutError:
+            self.timeouts += 1
+            logger.warning(f"等待数据库连接超时（{self.acquire_timeout}秒），使用中的连接数: {self.in_use}")
+            raise
+        wait = time.perf_counter() - start
+        self.acquired += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.in_use += 1
+        self.peak_in_use = max(self.peak_in_use, self.in_use)
+        try:
+            yield conn
+        finally:
+            self.in_use -= 1
+            await wrapper.__aexit__(None, None, None)
+
+    def metrics(self) -> dict:
+        pool = getattr(connections.get('default'), '_pool', None) if self.initialized else None
+        return {
+            'pool_size': pool.get_size() if pool is not None else 0,
+            'pool_idle': pool.get_idle_size() if pool is not None else 0,
+            'in_use': self.in_use,
+            'peak_in_use': self.peak_in_use,
+            'utilization': self.in_use / self.max_size if self.max_size else 0.0,
+            'acquired': self.acquired,
+            'timeouts': self.timeouts,
+            'avg_wait': self.total_wait / self.acquired if self.acquired else 0.0,
+            'max_wait': self.max_wait
+        }
+
+    async def close(self) -> None:
+        if self.initialized:
+            await Tortoise.close_connections()
+            self.initialized = False
+
+class WriterGroup:
+    """限制同时进行的写入事务数，使数据库保持满负荷但不过载"""
+
+    def __init__(self, max_concurrent: Optional[int] = None):
+        self.max_concurrent = max_concurrent or DB_POOL_CONFIG['max_concurrent_writes']
+        self.semaphore = asyncio.Semaphore(self.max_concurrent)
+        # 指标
+        self.waiting = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_wait = 0.0
+        self.total_write = 0.0
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """占用一个写入名额，写入数已达上限时排队等待"""
+        start = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        write_start = time.perf_counter()
+        self.total_wait += write_start - start
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            yield
+            self.completed += 1
+        except BaseException:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self.total_write += time.perf_counter() - write_start
+            self.semaphore.release()
+
+    def metrics(self) -> dict:
+        finished = self.completed + self.failed
+        return {
+            'max_concurrent': self.max_concurrent,
+            'in_flight': self.in_flight,
+            'peak_in_flight': self.peak_in_flight,
+            'waiting': self.waiting,
+            'completed': self.completed,
+            'failed': self.failed,
+            'avg_wait': self.total_wait / finished if finished else 0.0,
+            'avg_write': self.total_write / finished if finished else 0.0
+        }
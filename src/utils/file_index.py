@@ -1,61 +1,508 @@
 import os
+import time
 import shelve
-from typing import Set
+import hashlib
+import sqlite3
+import fnmatch
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 from loguru import logger
-from pybloom_live import BloomFilter
+from .bloom_bitmap import BloomBitmap
+
+# 文件指纹: (路径, 大小, 修改时间纳秒)
+Fingerprint = Tuple[str, int, int]
+# 索引中的一行: (路径, 大小, 修改时间纳秒, 抽样哈希, 全文哈希)
+Record = Tuple[str, int, int, Optional[str], Optional[str]]
+
+# 内容哈希读取文件开头和末尾的字节数，不超过两倍该值的文件读取全部内容
+HASH_SAMPLE_BYTES = 64 * 1024
+# 计算全文哈希时每次读取的字节数
+HASH_CHUNK_BYTES = 1024 * 1024
+# 内容哈希方案的版本，方案改变后索引中旧的哈希无法与新文件比较
+HASH_VERSION = 2
+
+def match_patterns(file_path: str, patterns: Iterable[str]) -> bool:
+    """判断文件名是否匹配任一通配符模式"""
+    file_name = os.path.basename(file_path)
+    return any(fnmatch.fnmatch(file_name, pattern) for pattern in patterns)
+
+def file_fingerprint(file_path: str) -> Optional[Fingerprint]:
+    """返回文件的指纹，文件不存在时返回 None"""
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return file_path, stat.st_size, stat.st_mtime_ns
+
+def changed_ns(stat: os.stat_result) -> int:
+    """文件最后一次出现变化的时间
+
+    同步工具可能保留源文件的修改时间，而创建、移入目录时 ctime 一定会更新，取两者中较大的一个。
+    """
+    return max(stat.st_mtime_ns, stat.st_ctime_ns)
+
+def content_hash(file_path: str) -> str:
+    """计算文件大小和开头、末尾各 HASH_SAMPLE_BYTES 字节的 BLAKE2b 哈希
+
+    只读取固定的字节数，耗时与文件大小无关；重新投递的相同文件大小和首尾内容都相同。
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        digest.update(size.to_bytes(8, 'big'))
+        if size <= 2 * HASH_SAMPLE_BYTES:
+            digest.update(f.read())
+        else:
+            digest.update(f.read(HASH_SAMPLE_BYTES))
+            f.seek(-HASH_SAMPLE_BYTES, os.SEEK_END)
+            digest.update(f.read(HASH_SAMPLE_BYTES))
+    return digest.hexdigest()
+
+def full_content_hash(file_path: str) -> str:
+    """计算文件全部内容的 BLAKE2b 哈希，用于确认抽样哈希相同的文件内容完全相同"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        while chunk := f.read(HASH_CHUNK_BYTES):
+            digest.update(chunk)
+    return digest.hexdigest()
 
 class FileIndexManager:
-    def __init__(self, cache_file: str = 'file_index.db', expected_items: int = 100000, false_positive_rate: float = 0.001):
-        self.cache_file = cache_file
-        self.bloom_filter = BloomFilter(capacity=expected_items, error_rate=false_positive_rate)
-        self.processed_files: Set[str] = set()
-        self._load_cache()
-    
-    def _load_cache(self) -> None:
-        """从缓存文件加载已处理的文件索引"""
+    """已处理文件的索引
+
+    以 (路径, 大小, 修改时间) 作为文件指纹，同一路径被重写后指纹改变，会重新处理；
+    启用内容哈希时，还会跳过以新文件名重新投递、内容完全相同的文件：先按大小和首尾内容的抽样哈希查找，
+    抽样哈希相同的大文件再比较全文哈希确认（已处理的文件没有记录全文哈希时，按其当前内容计算）。
+    前面是布隆过滤器，判定不存在的指纹一定是新文件；可能存在时再查精确索引确认，误判不会导致新文件被跳过。
+    布隆过滤器的位图保存在文件中并以内存映射方式打开，启动时无需重建；位图的元素个数与精确索引不一致
+    （上次异常退出）或超出容量时，按两倍容量从精确索引重建。
+
+    启动扫描是增量的：每个目录记录一个时间水位，早于水位的文件都已处理，扫描时用 os.scandir 逐项比较
+    文件的变化时间，只有不早于水位的文件才查询索引。os.scandir 的顺序不确定，完整扫描一遍之后水位才前移到
+    扫描开始的时间，尚未处理完的文件中最早的变化时间更早时取后者，随组提交一起保存。
+
+    每个已处理的文件是 SQLite（WAL 模式）中的一行，标记文件只追加一行，耗时与历史文件数无关；
+    标记先进入内存中的待提交列表，攒够 group_commit_size 个或距上次提交超过 group_commit_interval 秒后
+    由后台线程在一个事务中提交（组提交），多次标记共用一次落盘。每提交 checkpoint_commits 次把 WAL 合并回主库。
+    标记本身不读取文件也不写数据库，可以在事件循环中调用；检查时没有算出内容哈希的文件由后台线程在提交前计算。
+    """
+
+    # 检查时缓存的内容哈希个数上限
+    MAX_CACHED_HASHES = 10000
+    # 抽样哈希相同时最多比较的已处理文件个数
+    MAX_CONTENT_CANDIDATES = 16
+
+    def __init__(self, db_file: str = 'file_index.sqlite3', expected_items: int = 100000,
+                 false_positive_rate: float = 0.001, group_commit_size: int = 64,
+                 group_commit_interval: float = 1.0, checkpoint_commits: int = 1000,
+                 legacy_cache_file: str = 'file_index.db', content_hash: bool = True,
+                 bloom_file: str = 'file_index.bloom', incremental_scan: bool = True):
+        self.db_file = db_file
+        self.bloom_file = bloom_file
+        self.expected_items = expected_items
+        self.false_positive_rate = false_positive_rate
+        self.incremental_scan = incremental_scan
+        self.group_commit_size = group_commit_size
+        self.group_commit_interval = group_commit_interval
+        self.checkpoint_commits = checkpoint_commits
+        self.hash_content = content_hash
+        self.lock = threading.Lock()
+        # 待提交的标记: (路径, 大小, 修改时间, 抽样哈希, 全文哈希)，以及正在提交的标记
+        self.pending: List[Record] = []
+        self.committing: List[Record] = []
+        self.pending_keys: Set[Fingerprint] = set()
+        self.pending_hashes: Set[str] = set()
+        # 待提交、尚未计算内容哈希的指纹
+        self.unhashed: Set[Fingerprint] = set()
+        # 检查时算出的内容哈希，标记时复用，避免重复读取文件
+        self.hashes: Dict[Fingerprint, Tuple[str, Optional[str]]] = {}
+        # 已发现、尚未标记为已处理的文件及其变化时间，用于计算扫描水位
+        self.outstanding: Dict[str, int] = {}
+        # 各目录本次扫描开始时的水位，以及完整扫描一遍后扫描开始的时间
+        self.watermarks: Dict[str, int] = {}
+        self.scan_bounds: Dict[str, int] = {}
+        self.last_commit = time.monotonic()
+        self.commits = 0
+        # 查询使用的连接，由 self.lock 保护
+        self.conn = sqlite3.connect(db_file, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        # 组提交使用单独的写连接，由 commit_lock 保护；提交和落盘时不持有 self.lock，WAL 模式下查询不被阻塞
+        self.commit_lock = threading.Lock()
+        self.writer = sqlite3.connect(db_file, timeout=30, isolation_level=None, check_same_thread=False)
+        # 每次组提交都落盘，标记成功的文件在掉电后也不会重复处理
+        self.writer.execute('PRAGMA synchronous=FULL')
+        self._create_tables()
+        self._check_hash_version()
+        self.count = self._meta('count')
+        if self.count is None:
+            self.count = self.conn.execute('SELECT COUNT(*) FROM processed_files').fetchone()[0]
+            self._set_meta('count', self.count)
+        self._migrate(legacy_cache_file)
+        self.bloom_filter = self._load_cache()
+        # 后台定期提交，标记之后没有新文件时也能及时落盘
+        self.closed = threading.Event()
+        self.wakeup = threading.Event()
+        self.flusher = threading.Thread(target=self._flush_periodically, name='file-index-flusher', daemon=True)
+        self.flusher.start()
+
+    def _create_tables(self) -> None:
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(processed_files)')]
+        if columns == ['path']:
+            # 只按路径记录的旧索引，改名后按文件当前的指纹导入
+            self.conn.execute('ALTER TABLE processed_files RENAME TO processed_paths')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS processed_files ('
+            'path TEXT NOT NULL, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, content_hash TEXT, '
+            'full_hash TEXT, PRIMARY KEY (path, size, mtime_ns)) WITHOUT ROWID'
+        )
+        if 'content_hash' in columns and 'full_hash' not in columns:
+            self.conn.execute('ALTER TABLE processed_files ADD COLUMN full_hash TEXT')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS processed_files_hash ON processed_files (content_hash)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER) WITHOUT ROWID')
+
+    def _check_hash_version(self) -> None:
+        """索引中的内容哈希来自其他方案（或没有记录方案版本）时清除，避免与新文件的哈希比较"""
+        if self._meta('content_hash_version') == HASH_VERSION:
+            return
+        self.writer.execute('BEGIN IMMEDIATE')
         try:
-            with shelve.open(self.cache_file) as db:
-                if 'processed_files' in db:
-                    self.processed_files = db['processed_files']
-                    for file_path in self.processed_files:
-                        self.bloom_filter.add(file_path)
-                    logger.info(f"成功加载文件索引缓存，共 {len(self.processed_files)} 个文件记录")
-        except Exception as e:
-            logger.error(f"加载文件索引缓存时发生错误: {str(e)}")
-            self.processed_files = set()
-    
-    def save_cache(self) -> None:
-        """保存文件索引到缓存文件"""
+            cleared = self.writer.execute(
+                'UPDATE processed_files SET content_hash = NULL, full_hash = NULL '
+                'WHERE content_hash IS NOT NULL OR full_hash IS NOT NULL'
+            ).rowcount
+            self._set_meta('content_hash_version', HASH_VERSION)
+            self.writer.execute('COMMIT')
+        except Exception:
+            self.writer.execute('ROLLBACK')
+            raise
+        if cleared:
+            logger.warning(f"文件索引中 {cleared} 个文件的内容哈希来自旧的方案，已清除，这些文件只按指纹跳过")
+
+    def _meta(self, key: str) -> Optional[int]:
+        row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def _set_meta(self, key: str, value: int) -> None:
+        self.writer.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    def _migrate(self, legacy_cache_file: str) -> None:
+        """导入旧版只按路径记录的已处理文件，已不存在的文件无需记录"""
+        paths = set()
+        if self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'processed_paths'").fetchone():
+            paths.update(row[0] for row in self.conn.execute('SELECT path FROM processed_paths'))
+        elif legacy_cache_file and not self.conn.execute('SELECT 1 FROM processed_files LIMIT 1').fetchone():
+            # 旧版 shelve 缓存只在索引为空时导入一次
+            try:
+                with shelve.open(legacy_cache_file, flag='r') as db:
+                    paths.update(db.get('processed_files', set()))
+            except Exception:
+                pass
+        if not paths:
+            return
+        # 旧索引不知道文件处理时的内容，按当前的指纹记录，不计算内容哈希
+        records = [(*fingerprint, None, None) for fingerprint in map(file_fingerprint, paths) if fingerprint is not None]
+        self.count += self._commit(records, {})
+        self.writer.execute('DROP TABLE IF EXISTS processed_paths')
+        logger.info(f"已从旧版文件索引导入 {len(records)} 个文件记录")
+
+    def _load_cache(self) -> BloomBitmap:
+        """映射保存的布隆过滤器位图，与精确索引不一致或超出容量时重建"""
+        bitmap = BloomBitmap.open(self.bloom_file)
+        if bitmap is not None and bitmap.count == self.count and self.count <= bitmap.capacity:
+            logger.info(f"成功加载文件索引，共 {self.count} 个文件记录")
+        else:
+            if bitmap is not None:
+                logger.warning(f"布隆过滤器位图的文件数 {bitmap.count} 与文件索引 {self.count} 不一致或超出容量 "
+                               f"{bitmap.capacity}，重新构建")
+                bitmap.close()
+            bitmap = BloomBitmap.create(self.bloom_file, max(self.expected_items, self.count * 2),
+                                        self.false_positive_rate)
+            for fingerprint in self.conn.execute('SELECT path, size, mtime_ns FROM processed_files'):
+                bitmap.add(self._key(fingerprint))
+            bitmap.flush(self.count)
+            logger.info(f"文件索引的布隆过滤器已重建，共 {self.count} 个文件记录")
+        # 运行期间位图可能领先于精确索引，标记为过期，正常关闭时再写入元素个数
+        bitmap.invalidate()
+        return bitmap
+
+    @staticmethod
+    def _key(fingerprint: Fingerprint) -> str:
+        return '\0'.join(map(str, fingerprint))
+
+    def _watermark(self, directory: str) -> int:
+        """目录的扫描水位
+
+        os.scandir 的顺序不确定，完整扫描一遍之前保持原来的水位；扫描完后为扫描开始的时间，
+        尚有未处理完的文件时不晚于其中最早的变化时间，且不低于原来的水位。
+        """
+        since = self.watermarks[directory]
+        bound = self.scan_bounds.get(directory)
+        if bound is None:
+            return since
+        return max(since, min([bound, *self.outstanding.values()]))
+
+    def _commit(self, records: List[Record], watermarks: Dict[str, int]) -> int:
+        """在写连接上的一个事务中写入标记、文件数和扫描水位，返回新增的记录数，调用方持有 commit_lock"""
+        self.writer.execute('BEGIN IMMEDIATE')
         try:
-            with shelve.open(self.cache_file) as db:
-                db['processed_files'] = self.processed_files
-            logger.info(f"成功保存文件索引缓存，共 {len(self.processed_files)} 个文件记录")
-        except Exception as e:
-            logger.error(f"保存文件索引缓存时发生错误: {str(e)}")
-    
+            before = self.writer.total_changes
+            self.writer.executemany(
+                'INSERT OR IGNORE INTO processed_files (path, size, mtime_ns, content_hash, full_hash) '
+                'VALUES (?, ?, ?, ?, ?)',
+                records
+            )
+            added = self.writer.total_changes - before
+            # 文件数只在提交时变化，提交由 commit_lock 串行执行
+            self._set_meta('count', self.count + added)
+            for directory, watermark in watermarks.items():
+                self._set_meta(f'scan_watermark:{directory}', watermark)
+            self.writer.execute('COMMIT')
+        except Exception:
+            self.writer.execute('ROLLBACK')
+            raise
+        self.commits += 1
+        if self.commits % self.checkpoint_commits == 0:
+            # 定期把 WAL 合并回主库并截断，避免 WAL 无限增长
+            self.writer.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        return added
+
+    def _hash_unhashed(self) -> None:
+        """在锁外计算待提交标记缺少的内容哈希"""
+        with self.lock:
+            fingerprints = list(self.unhashed)
+        if not fingerprints:
+            return
+        digests = {}
+        for fingerprint in fingerprints:
+            try:
+                digests[fingerprint] = content_hash(fingerprint[0])
+            except OSError:
+                digests[fingerprint] = None
+        with self.lock:
+            self.pending = [(*record[:3], digests.get(tuple(record[:3]), record[3]), record[4])
+                            for record in self.pending]
+            self.pending_hashes.update(digest for digest in digests.values() if digest is not None)
+            self.unhashed.difference_update(fingerprints)
+
+    def flush(self) -> None:
+        """提交所有待提交的标记
+
+        在锁内取出待提交的标记，在锁外提交和落盘；提交完成前标记仍留在 pending_keys 中，检查结果不受影响。
+        """
+        with self.commit_lock:
+            self._hash_unhashed()
+            with self.lock:
+                # 取出之后才加入、哈希尚未算出的标记留到下次提交
+                records = [record for record in self.pending if tuple(record[:3]) not in self.unhashed]
+                if not records:
+                    return
+                self.pending = [record for record in self.pending if tuple(record[:3]) in self.unhashed]
+                self.committing = records
+                watermarks = {directory: self._watermark(directory) for directory in self.watermarks}
+            try:
+                added = self._commit(records, watermarks)
+            except Exception as e:
+                # 提交失败时放回待提交的标记，下次再试
+                logger.error(f"保存文件索引时发生错误: {str(e)}")
+                with self.lock:
+                    self.pending = records + self.pending
+                    self.committing = []
+                return
+            with self.lock:
+                self.count += added
+                self.committing = []
+                # 已提交的标记可以从精确索引中查到
+                self.pending_keys.difference_update(tuple(record[:3]) for record in records)
+                self.pending_hashes = {record[3] for record in self.pending if record[3] is not None}
+                self.last_commit = time.monotonic()
+        logger.debug(f"文件索引已提交 {len(records)} 个文件记录")
+
+    def _flush_periodically(self) -> None:
+        while not self.closed.is_set():
+            self.wakeup.wait(self.group_commit_interval)
+            self.wakeup.clear()
+            if not self.closed.is_set():
+                self.flush()
+
+    def _contains(self, fingerprint: Fingerprint) -> bool:
+        """布隆过滤器判定可能存在时，再查待提交的标记和精确索引确认"""
+        if self._key(fingerprint) not in self.bloom_filter:
+            return False
+        return fingerprint in self.pending_keys or self.conn.execute(
+            'SELECT 1 FROM processed_files WHERE path = ? AND size = ? AND mtime_ns = ?', fingerprint
+        ).fetchone() is not None
+
+    def _content_candidates(self, digest: str) -> List[Tuple[str, int, int, Optional[str]]]:
+        """抽样哈希相同的已处理文件: (路径, 大小, 修改时间, 全文哈希)，记录了全文哈希的优先，调用方持有锁"""
+        candidates = []
+        if digest in self.pending_hashes:
+            candidates = [(*record[:3], record[4]) for record in self.pending + self.committing if record[3] == digest]
+        candidates += self.conn.execute(
+            'SELECT path, size, mtime_ns, full_hash FROM processed_files WHERE content_hash = ? '
+            'ORDER BY full_hash IS NULL LIMIT ?', (digest, self.MAX_CONTENT_CANDIDATES)
+        ).fetchall()
+        return candidates
+
+    @staticmethod
+    def _same_content(file_path: str, size: int, candidates: List[Tuple[str, int, int, Optional[str]]],
+                      full: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+        """确认文件与抽样哈希相同的已处理文件内容完全相同，返回相同的已处理文件（没有时为 None）和本文件的全文哈希
+
+        抽样哈希只覆盖大小和首尾内容，大文件再比较全文哈希；已处理的文件没有记录全文哈希时，
+        只有它仍在原处且未变化才能按当前内容计算。
+        """
+        if size <= 2 * HASH_SAMPLE_BYTES:
+            # 小文件的抽样哈希已经覆盖全部内容
+            return candidates[0][0], full
+        for path, candidate_size, mtime_ns, candidate_full in candidates:
+            if candidate_full is None:
+                if file_fingerprint(path) != (path, candidate_size, mtime_ns):
+                    continue
+                try:
+                    candidate_full = full_content_hash(path)
+                except OSError:
+                    continue
+            if full is None:
+                full = full_content_hash(file_path)
+            if candidate_full == full:
+                return path, full
+        return None, full
+
     def is_file_processed(self, file_path: str) -> bool:
-        """检查文件是否已经处理过"""
-        return file_path in self.bloom_filter
-    
+        """检查文件是否已经处理过：指纹相同，或启用内容哈希时内容与已处理的文件完全相同
+
+        读取文件内容，应在线程中调用。
+        """
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            return False
+        fingerprint = (file_path, stat.st_size, stat.st_mtime_ns)
+        with self.lock:
+            if self._contains(fingerprint):
+                return True
+        digest = full = None
+        if self.hash_content:
+            # 同一指纹的文件可能被检查多次（启动扫描后等待写完），复用已算出的哈希
+            digest, full = self.hashes.get(fingerprint, (None, None))
+            if digest is None:
+                try:
+                    digest = content_hash(file_path)
+                except FileNotFoundError:
+                    return False
+        duplicate = None
+        if digest is not None:
+            with self.lock:
+                candidates = self._content_candidates(digest)
+            if candidates:
+                # 在锁外读取文件确认内容完全相同
+                try:
+                    duplicate, full = self._same_content(file_path, stat.st_size, candidates, full)
+                except FileNotFoundError:
+                    return False
+        if duplicate is None:
+            with self.lock:
+                if digest is not None:
+                    if len(self.hashes) >= self.MAX_CACHED_HASHES:
+                        # 检查后一直未标记的文件（例如处理失败）不再保留哈希
+                        self.hashes.clear()
+                    self.hashes[fingerprint] = (digest, full)
+                self.outstanding[file_path] = changed_ns(stat)
+            return False
+        # 内容相同的文件以新文件名重新投递，记录新的指纹后跳过
+        logger.info(f"文件内容与已处理的文件 {duplicate} 相同，跳过: {file_path}")
+        self._add(fingerprint, digest, full)
+        return True
+
+    def _add(self, fingerprint: Fingerprint, digest: Optional[str], full: Optional[str] = None,
+             hash_later: bool = False) -> None:
+        with self.lock:
+            self.bloom_filter.add(self._key(fingerprint))
+            self.pending.append((*fingerprint, digest, full))
+            self.outstanding.pop(fingerprint[0], None)
+            self.pending_keys.add(fingerprint)
+            if digest is not None:
+                self.pending_hashes.add(digest)
+            elif hash_later:
+                self.unhashed.add(fingerprint)
+            due = len(self.pending) >= self.group_commit_size \
+                or time.monotonic() - self.last_commit >= self.group_commit_interval
+        if due:
+            # 由后台线程提交，调用方（可能是事件循环）不等待落盘
+            self.wakeup.set()
+
     def mark_file_processed(self, file_path: str) -> None:
-        """标记文件为已处理"""
-        self.bloom_filter.add(file_path)
-        self.processed_files.add(file_path)
-        self.save_cache()
-    
-    def scan_directory(self, directory: str) -> None:
-        """扫描目录并更新文件索引"""
+        """按文件当前的指纹标记为已处理，攒够一组或超过提交间隔时通知后台线程提交"""
+        fingerprint = file_fingerprint(file_path)
+        if fingerprint is None:
+            logger.warning(f"文件已不存在，无法记录指纹: {file_path}")
+            return
+        digest = full = None
+        if self.hash_content:
+            # 复用检查时算出的哈希，没有时由后台线程在提交前计算抽样哈希，不在调用方线程中读取文件
+            with self.lock:
+                digest, full = self.hashes.pop(fingerprint, (None, None))
+        self._add(fingerprint, digest, full, hash_later=self.hash_content and digest is None)
+
+    def _scan_entries(self, directory: str, patterns: Iterable[str], since: int, recursive: bool) -> Iterator[str]:
+        """用 os.scandir 遍历目录，只返回变化时间不早于 since 的匹配文件"""
+        with os.scandir(directory) as entries:
+            subdirectories = []
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(entry.path)
+                elif entry.is_file() and match_patterns(entry.name, patterns):
+                    if since and changed_ns(entry.stat()) < since:
+                        continue
+                    yield entry.path
+        if recursive:
+            for subdirectory in subdirectories:
+                yield from self._scan_entries(subdirectory, patterns, since, recursive)
+
+    def scan_directory(self, directory: str, patterns: Iterable[str] = ('*.csv',),
+                       recursive: bool = True) -> Iterator[str]:
+        """扫描目录中未处理的文件，启用增量扫描时跳过早于上次水位的文件"""
+        directory = os.path.abspath(directory)
+        with self.lock:
+            since = (self._meta(f'scan_watermark:{directory}') or 0) if self.incremental_scan else 0
+            self.watermarks[directory] = since
+            self.scan_bounds.pop(directory, None)
+        # 扫描开始之后变化的文件留给下次扫描
+        bound = time.time_ns()
+        if since:
+            logger.info(f"增量扫描目录: {directory}，跳过 {datetime.fromtimestamp(since / 1e9)} 之前的文件")
         try:
-            for root, _, files in os.walk(directory):
-                for file in files:
-                    if file.endswith('.csv'):
-                        file_path = os.path.abspath(os.path.join(root, file))
-                        if not self.is_file_processed(file_path):
-                            logger.info(f"发现未处理的文件: {file_path}")
-                            yield file_path
+            for file_path in self._scan_entries(directory, patterns, since, recursive):
+                if not self.is_file_processed(file_path):
+                    logger.info(f"发现未处理的文件: {file_path}")
+                    yield file_path
         except Exception as e:
             logger.error(f"扫描目录时发生错误: {str(e)}")
-    
+            return
+        with self.lock:
+            self.scan_bounds[directory] = bound
+
+    def close(self) -> None:
+        """提交剩余的标记并关闭索引"""
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        self.wakeup.set()
+        if threading.current_thread() is not self.flusher:
+            self.flusher.join()
+        self.flush()
+        with self.commit_lock, self.lock:
+            for directory in self.watermarks:
+                self._set_meta(f'scan_watermark:{directory}', self._watermark(directory))
+            self.writer.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            self.writer.close()
+            self.conn.close()
+            self.bloom_filter.flush(self.count)
+            self.bloom_filter.close()
+
     def __del__(self):
-        """确保在对象销毁时保存缓存"""
-        self.save_cache()
\ No newline at end of file
+        """确保在对象销毁时提交剩余的标记"""
+        try:
+            self.close()
+        except Exception:
+            pass
@@ -0,0 +1,38 @@
+from loguru import logger
+from typing import List, Tuple
+
+# 按顺序执行的 orders 表结构变更，每条语句都可以重复执行
+MIGRATIONS: List[Tuple[str, List[str]]] = [
+    ('0001_log_info_columns', [
+        'ALTER TABLE orders ADD COLUMN IF NOT EXISTS device_model VARCHAR(50)',
+        'ALTER TABLE orders ADD COLUMN IF NOT EXISTS os_version VARCHAR(50)',
+        'ALTER TABLE orders ADD COLUMN IF NOT EXISTS browser VARCHAR(50)',
+        'ALTER TABLE orders ADD COLUMN IF NOT EXISTS browser_version VARCHAR(50)',
+        'ALTER TABLE orders ADD COLUMN IF NOT EXISTS ip_address VARCHAR(45)',
+        'ALTER TABLE orders ADD COLUMN IF NOT EXISTS user_agent VARCHAR(255)',
+        'ALTER TABLE orders ADD COLUMN IF NOT EXISTS log_timestamp TIMESTAMPTZ'
+    ])
+]
+
+async def apply_migrations(conn) -> None:
+    """在一个事务中执行全部结构变更，已经存在的列直接跳过"""
+    async with conn.transaction():
+        for name, statements in MIGRATIONS:
+            for statement in statements:
+                await conn.execute(statement)
+            logger.info(f"数据库结构变更已执行: {name}")
+
+if __name__ == '__main__':
+    # 执行命令: python -m src.utils.migrations
+    import asyncio
+    from .db_pool import DatabasePool
+
+    async def migrate():
+        pool = DatabasePool()
+        try:
+            async with pool.acquire() as conn:
+                await apply_migrations(conn)
+        finally:
+            await pool.close()
+
+    asyncio.run(migrate())
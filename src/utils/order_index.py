@@ -0,0 +1,185 @@
+import os
+import sqlite3
+import threading
+from loguru import logger
+from pybloom_live import ScalableBloomFilter
+from typing import Iterable, List, Set
+
+class OrderIndex:
+    """跨文件的 order_id 成员索引
+
+    前面是常驻内存的可扩展布隆过滤器，后面是 SQLite 上的精确索引：
+    布隆过滤器判定不存在的订单一定是新订单，无需查询；只有可能存在的订单才回查精确索引，
+    内存只与布隆过滤器的大小有关（千万级订单约数十 MB）。
+    布隆过滤器在关闭时保存到文件，启动时与精确索引的条数一致才直接加载，否则从精确索引重建。
+    """
+
+    # SQLite 单条语句允许的参数个数有限，批量查询时分块
+    QUERY_CHUNK_SIZE = 500
+    # 重建时每页读取的订单数
+    REBUILD_PAGE_ROWS = 100000
+
+    def __init__(self, db_file: str = 'order_index.db', bloom_file: str = 'order_index.bloom',
+                 initial_capacity: int = 1000000, error_rate: float = 0.001):
+        self.db_file = db_file
+        self.bloom_file = bloom_file
+        self.initial_capacity = initial_capacity
+        self.error_rate = error_rate
+        self.lock = threading.Lock()
+        # 已通过检查、尚未提交到数据库的订单，避免并发的批次重复写入同一订单
+        self.pending: Set[str] = set()
+        self.conn = sqlite3.connect(db_file, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS order_ids (order_id TEXT PRIMARY KEY) WITHOUT ROWID')
+        # 记录保存布隆过滤器时精确索引的条数，用于判断保存的文件是否过期
+        self.conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER) WITHOUT ROWID')
+        self.count = self.conn.execute('SELECT COUNT(*) FROM order_ids').fetchone()[0]
+        self.bloom_filter = self._load_bloom_filter()
+        logger.info(f"订单索引已打开: {db_file}，共 {self.count} 个订单")
+
+    def _new_bloom_filter(self) -> ScalableBloomFilter:
+        return ScalableBloomFilter(initial_capacity=self.initial_capacity, error_rate=self.error_rate,
+                                   mode=ScalableBloomFilter.LARGE_SET_GROWTH)
+
+    def _load_bloom_filter(self) -> ScalableBloomFilter:
+        """加载保存的布隆过滤器，与精确索引不一致时从精确索引重建"""
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'bloom_count'").fetchone()
+        if os.path.exists(self.bloom_file) and row is not None:
+            try:
+                if row[0] == self.count:
+                    with open(self.bloom_file, 'rb') as f:
+                        return ScalableBloomFilter.fromfile(f)
+                logger.warning(f"布隆过滤器保存时的订单数 {row[0]} 与订单索引 {self.count} 不一致，重新构建")
+            except Exception as e:
+                logger.error(f"加载布隆过滤器时发生错误: {str(e)}")
+        bloom_filter = self._new_bloom_filter()
+        cursor = self.conn.execute('SELECT order_id FROM order_ids')
+        while True:
+            rows = cursor.fetchmany(100000)
+            if not rows:
+                break
+            for (order_id,) in rows:
+                bloom_filter.add(order_id)
+        return bloom_filter
+
+    def save_bloom_filter(self) -> None:
+        """先写临时文件再替换，避免中途失败留下不完整的文件"""
+        try:
+            tmp_file = f"{self.bloom_file}.tmp"
+            with self.lock:
+                with open(tmp_file, 'wb') as f:
+                    self.bloom_filter.tofile(f)
+                os.replace(tmp_file, self.bloom_file)
+                self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('bloom_count', ?)", (self.count,))
+        except Exception as e:
+            logger.error(f"保存布隆过滤器时发生错误: {str(e)}")
+
+    def _existing(self, order_ids: List[str]) -> Set[str]:
+        """在精确索引中查找已存在的订单"""
+        existing = set()
+        for start in range(0, len(order_ids), self.QUERY_CHUNK_SIZE):
+            chunk = order_ids[start:start + self.QUERY_CHUNK_SIZE]
+            placeholders = ','.join('?' * len(chunk))
+            existing.update(row[0] for row in self.conn.execute(
+                f'SELECT order_id FROM order_ids WHERE order_id IN ({placeholders})', chunk
+            ))
+        return existing
+
+    def reserve(self, order_ids: Iterable[str]) -> List[bool]:
+        """返回每个订单是否需要写入：已加载、正在写入或在本批次中重复出现的订单为 False
+
+        返回 True 的订单被标记为正在写入，写入成功后调用 add，失败后调用 release。
+        """
+        order_ids = list(order_ids)
+        with self.lock:
+            candidates = [order_id for order_id in order_ids if order_id in self.bloom_filter]
+            existing = self._existing(list(set(candidates))) if candidates else set()
+            keep = []
+            for order_id in order_ids:
+                is_new = order_id is not None and order_id not in existing and order_id not in self.pending
+                if is_new:
+                    self.pending.add(order_id)
+                keep.append(is_new)
+        return keep
+
+    def add(self, order_ids: Iterable[str]) -> None:
+        """数据库提交成功后记录订单"""
+        order_ids = [order_id for order_id in order_ids if order_id is not None]
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                before = self.conn.total_changes
+                self.conn.executemany('INSERT OR IGNORE INTO order_ids (order_id) VALUES (?)',
+                                      ((order_id,) for order_id in order_ids))
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+            self.count += self.conn.total_changes - before
+            for order_id in order_ids:
+                self.bloom_filter.add(order_id)
+            self.pending.difference_update(order_ids)
+
+    def release(self, order_ids: Iterable[str]) -> None:
+        """写入失败时取消正在写入的标记，之后可以重试"""
+        with self.lock:
+            self.pending.difference_update(order_ids)
+
+    def __contains__(self, order_id: str) -> bool:
+        with self.lock:
+            return order_id in self.bloom_filter and bool(self._existing([order_id]))
+
+    def clear(self) -> None:
+        with self.lock:
+            self.conn.execute('DELETE FROM order_ids')
+            self.count = 0
+            self.bloom_filter = self._new_bloom_filter()
+            self.pending.clear()
+
+    def close(self) -> None:
+        self.save_bloom_filter()
+        with self.lock:
+            self.conn.close()
+
+    async def rebuild(self) -> int:
+        """清空后从数据库中已有的订单重建索引，返回订单数"""
+        from ..models import Order
+
+        self.clear()
+        # 按主键分页（keyset），每页都从上一页最后的 id 开始走索引，耗时与已读取的行数无关
+        last_id = None
+        while True:
+            query = Order.all() if last_id is None else Order.filter(id__gt=last_id)
+            rows = await query.order_by('id').limit(self.REBUILD_PAGE_ROWS).values_list('id', 'order_id')
+            if not rows:
+                break
+            self.add(str(order_id) for _, order_id in rows)
+            last_id = rows[-1][0]
+        self.save_bloom_filter()
+        logger.info(f"订单索引重建完成，共 {self.count} 个订单")
+        return self.count
+
+if __name__ == '__main__':
+    # 重建命令: python -m src.utils.order_index rebuild
+    import sys
+    import asyncio
+    from tortoise import Tortoise
+    from ..config import ORDER_INDEX_CONFIG
+    from ..models import DATABASE_CONFIG
+
+    if len(sys.argv) < 2 or sys.argv[1] != 'rebuild':
+        print('用法: python -m src.utils.order_index rebuild')
+        sys.exit(1)
+
+    async def rebuild():
+        await Tortoise.init(config=DATABASE_CONFIG)
+        index = OrderIndex(ORDER_INDEX_CONFIG['db_file'], ORDER_INDEX_CONFIG['bloom_file'],
+                           ORDER_INDEX_CONFIG['initial_capacity'], ORDER_INDEX_CONFIG['error_rate'])
+        try:
+            await index.rebuild()
+        finally:
+            index.close()
+            await Tortoise.close_connections()
+
+    asyncio.run(rebuild())
@@ -0,0 +1,213 @@
+import os
+import sqlite3
+import threading
+import pyarrow as pa
+import pyarrow.compute as pc
+from loguru import logger
+from typing import Dict, Optional
+
+class UserAggregateStore:
+    """基于 SQLite 的按用户累计聚合存储
+
+    每个用户一行（主键查找为 O(1)），金额以分为单位的整数保存，累计求和没有精度损失。
+    每个订单按 order_id 只计入一次：批次先写入临时表，去掉已经计入过的订单后记入 user_orders，
+    再只把新订单按用户聚合后通过一次 UPSERT 合并，重试、重放或重复处理同一个文件不会重复累加。
+    """
+
+    # SQLite 单条语句允许的参数个数有限，批量查询时分块
+    QUERY_CHUNK_SIZE = 500
+
+    def __init__(self, db_file: str = 'user_stats.db'):
+        self.db_file = db_file
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_file, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS user_stats ('
+            ' user_id TEXT PRIMARY KEY,'
+            ' order_count INTEGER NOT NULL,'
+            ' total_cents INTEGER NOT NULL,'
+            ' min_cents INTEGER,'
+            ' max_cents INTEGER,'
+            ' last_order_date TEXT'
+            ') WITHOUT ROWID'
+        )
+        # 已计入聚合的订单
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS user_orders ('
+            ' order_id TEXT PRIMARY KEY,'
+            ' user_id TEXT NOT NULL,'
+            ' cents INTEGER,'
+            ' order_date TEXT'
+            ') WITHOUT ROWID'
+        )
+        self.conn.execute(
+            'CREATE TEMP TABLE IF NOT EXISTS batch_orders ('
+            ' order_id TEXT PRIMARY KEY,'
+            ' user_id TEXT NOT NULL,'
+            ' cents INTEGER,'
+            ' order_date TEXT'
+            ')'
+        )
+        logger.debug(f"用户聚合存储已打开: {db_file}")
+
+    @staticmethod
+    def _to_cents(values) -> pa.Array:
+        return pc.cast(pc.round(pc.multiply(pc.cast(values, pa.float64()), 100)), pa.int64())
+
+    def update(self, order_ids, user_ids, prices, order_dates=None) -> pa.Array:
+        """将一个批次中尚未计入的订单累加到用户聚合中，并返回每一行对应用户的累计平均订单金额"""
+        codes = pc.dictionary_encode(user_ids)
+        if isinstance(codes, pa.ChunkedArray):
+            codes = codes.combine_chunks()
+        users = codes.dictionary.to_pylist()
+        if order_dates is not None:
+            order_dates = [value.isoformat(sep=' ') if value is not None else None for value in order_dates.to_pylist()]
+        else:
+            order_dates = [None] * len(codes)
+        rows = list(zip(
+            pc.cast(order_ids, pa.string()).to_pylist(),
+            pc.cast(user_ids, pa.string()).to_pylist(),
+            self._to_cents(prices).to_pylist(),
+            order_dates
+        ))
+
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                # 批次内重复的订单只保留第一行，已经计入过的订单不再计入
+                self.conn.executemany('INSERT OR IGNORE INTO batch_orders VALUES (?, ?, ?, ?)', rows)
+                self.conn.execute('DELETE FROM batch_orders WHERE order_id IN (SELECT order_id FROM user_orders)')
+                self.conn.execute('INSERT INTO user_orders SELECT * FROM batch_orders')
+                self.conn.execute(
+                    'INSERT INTO user_stats (user_id, order_count, total_cents, min_cents, max_cents, last_order_date) '
+                    'SELECT user_id, COUNT(cents), COALESCE(SUM(cents), 0), MIN(cents), MAX(cents), MAX(order_date) '
+                    'FROM batch_orders WHERE true GROUP BY user_id '
+                    'ON CONFLICT(user_id) DO UPDATE SET '
+                    ' order_count = order_count + excluded.order_count,'
+                    ' total_cents = total_cents + excluded.total_cents,'
+                    ' min_cents = MIN(COALESCE(min_cents, excluded.min_cents), COALESCE(excluded.min_cents, min_cents)),'
+                    ' max_cents = MAX(COALESCE(max_cents, excluded.max_cents), COALESCE(excluded.max_cents, max_cents)),'
+                    ' last_order_date = MAX(COALESCE(last_order_date, excluded.last_order_date), COALESCE(excluded.last_order_date, last_order_date))'
+                )
+                self.conn.execute('DELETE FROM batch_orders')
+                averages = self._averages(users)
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+
+        per_user = pa.array([averages.get(user) for user in users], type=pa.float64())
+        return pc.take(per_user, codes.indices)
+
+    def _averages(self, users) -> Dict[str, float]:
+        averages = {}
+        for start in range(0, len(users), self.QUERY_CHUNK_SIZE):
+            chunk = users[start:start + self.QUERY_CHUNK_SIZE]
+            placeholders = ','.join('?' * len(chunk))
+            for user, count, total in self.conn.execute(
+                f'SELECT user_id, order_count, total_cents FROM user_stats WHERE user_id IN ({placeholders})', chunk
+            ):
+                averages[user] = total / count / 100 if count else None
+        return averages
+
+    def averages(self, user_ids) -> pa.Array:
+        """返回每一行对应用户当前的累计平均订单金额，不修改聚合"""
+        codes = pc.dictionary_encode(user_ids)
+        if isinstance(codes, pa.ChunkedArray):
+            codes = codes.combine_chunks()
+        users = codes.dictionary.to_pylist()
+        with self.lock:
+            averages = self._averages(users)
+        per_user = pa.array([averages.get(user) for user in users], type=pa.float64())
+        return pc.take(per_user, codes.indices)
+
+    def get(self, user_id: str) -> Optional[dict]:
+        """查询单个用户的累计聚合"""
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT order_count, total_cents, min_cents, max_cents, last_order_date FROM user_stats WHERE user_id = ?',
+                (user_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        count, total, low, high, last = row
+        return {
+            'order_count': count,
+            'total_price': total / 100,
+            'avg_price': total / count / 100 if count else None,
+            'min_price': low / 100 if low is not None else None,
+            'max_price': high / 100 if high is not None else None,
+            'last_order_date': last
+        }
+
+    def clear(self) -> None:
+        with self.lock:
+            self.conn.execute('DELETE FROM user_stats')
+            self.conn.execute('DELETE FROM user_orders')
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
+
+    def rebuild(self, directory: str, patterns=('*.csv',)) -> int:
+        """清空后从数据目录中的全部订单文件重建聚合，返回处理的订单数"""
+        from ..etl.extractor import CSVExtractor
+        from ..etl.transformer import DataTransformer
+        from .file_index import match_patterns
+
+        extractor = CSVExtractor(columns=['user_id', 'order_id', 'total_price', 'order_date'])
+        self.clear()
+        total = 0
+        for root, _, files in os.walk(directory):
+            for file in sorted(files):
+                if not match_patterns(file, patterns):
+                    continue
+                try:
+                    table = DataTransformer._drop_duplicates(
+                        extractor.read_table(os.path.join(root, file)), ['user_id', 'order_id']
+                    )
+                    self.update(table['order_id'], table['user_id'], table['total_price'], table['order_date'])
+                    total += table.num_rows
+                except Exception as e:
+                    logger.error(f"重建用户聚合时读取文件 {file} 失败: {str(e)}")
+        logger.info(f"用户聚合重建完成，共 {total} 条订单")
+        return total
+
+class UserStatsRecorder:
+    """处理进程中使用的用户聚合记录器，接口与 UserAggregateStore.update 相同
+
+    只记录批次中每个订单对用户聚合的贡献，不打开聚合存储，返回的平均金额为空；
+    由主进程通过 drain 取出后统一写入 UserAggregateStore 并填充 avg_price，聚合存储只有主进程一个写入方。
+    """
+
+    def __init__(self):
+        self.pending = []
+
+    def update(self, order_ids, user_ids, prices, order_dates=None) -> pa.Array:
+        columns = {'order_id': order_ids, 'user_id': user_ids, 'total_price': prices}
+        if order_dates is not None:
+            columns['order_date'] = order_dates
+        self.pending.append(pa.table(columns))
+        return pa.nulls(len(user_ids), pa.float64())
+
+    def drain(self) -> Optional[pa.Table]:
+        """取出并清空已记录的贡献，没有记录时返回 None"""
+        pending, self.pending = self.pending, []
+        if not pending:
+            return None
+        return pa.concat_tables(pending, promote_options='permissive')
+
+if __name__ == '__main__':
+    # 重建命令: python -m src.utils.user_stats rebuild [数据目录]
+    import sys
+    from ..config import FILE_MONITOR_CONFIG, USER_STATS_CONFIG
+
+    if len(sys.argv) < 2 or sys.argv[1] != 'rebuild':
+        print('用法: python -m src.utils.user_stats rebuild [数据目录]')
+        sys.exit(1)
+    directory = sys.argv[2] if len(sys.argv) > 2 else FILE_MONITOR_CONFIG['watch_path']
+    store = UserAggregateStore(USER_STATS_CONFIG['db_file'])
+    store.rebuild(directory, FILE_MONITOR_CONFIG['patterns'])
+    store.close()
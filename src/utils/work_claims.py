@@ -0,0 +1,290 @@
+import os
+import json
+import time
+import uuid
+import socket
+import hashlib
+import threading
+from loguru import logger
+from typing import Dict, List, Optional, Set, Tuple
+
+class WorkClaimManager:
+    """多个 ETL 实例共享同一个监控目录时的文件认领
+
+    认领记录保存在所有实例共享的目录（例如 NAS）中，每个文件版本（相对路径、大小、修改时间）对应一个租约文件
+    和一个完成标记。租约先写入临时文件，再用 os.link 硬链接到租约路径，目标已存在时链接失败，
+    NFS 等网络文件系统上同样是原子的，同一时间只有一个实例能认领成功。
+    持有者每隔 renew_interval 秒更新租约文件的修改时间续期；超过 lease_seconds 秒未续期的租约视为持有者已停止，
+    其他实例把它重命名（只有一个实例能成功）后重新认领；每个租约写入随机令牌，原持有者续期或结束前先核对令牌，
+    租约已被接管时不会续期或删除对方的租约。数据提交到数据库后先写完成标记再删除租约，
+    其他实例看到完成标记即跳过；处理失败时删除租约，其他实例可以重试。
+
+    partitions 大于 1 时按相对路径的哈希把文件分给各实例，只认领自己分区的文件；
+    其他分区的文件修改后超过 partition_grace_seconds 秒仍未完成时（所属实例可能已停止）同样可以认领。
+    租约到期被接管时文件可能被加载两次，加载按 order_id 幂等；各实例的时钟需要同步。
+    """
+
+    CLAIMED = 'claimed'     # 本实例认领成功
+    DONE = 'done'           # 已由某个实例处理完成
+    HELD = 'held'           # 其他实例持有租约，或属于其他分区
+
+    def __init__(self, claim_dir: str = 'claims', root: str = '.', node_id: Optional[str] = None,
+                 lease_seconds: float = 60.0, renew_interval: float = 15.0, partitions: int = 1,
+                 partition: int = 0, partition_grace_seconds: float = 120.0):
+        self.claim_dir = claim_dir
+        self.root = os.path.abspath(root)
+        self.node_id = node_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease_seconds = lease_seconds
+        self.renew_interval = renew_interval
+        self.partitions = max(1, partitions)
+        self.partition = partition % self.partitions
+        self.partition_grace_seconds = partition_grace_seconds
+        os.makedirs(claim_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        # 本实例持有的租约: 文件路径 -> 租约文件路径
+        self.leases: Dict[str, str] = {}
+        # 每个租约写入的随机令牌，过期被接管后同一路径上是其他实例的新租约，令牌不同
+        self.tokens: Dict[str, str] = {}
+        # 其他实例持有或属于其他分区的文件，定期重试认领
+        self.held: Set[str] = set()
+        # 等待后台线程完成或释放的文件: (文件路径, 是否处理成功)
+        self.finished: List[Tuple[str, bool]] = []
+        # 指标
+        self.claimed = 0
+        self.completed = 0
+        self.released = 0
+        self.reclaimed = 0
+        self.lost = 0
+        self.closed = threading.Event()
+        self.wakeup = threading.Event()
+        self.renewer = threading.Thread(target=self._renew_periodically, name='work-claim-renewer', daemon=True)
+        self.renewer.start()
+        logger.info(f"工作认领已启用，节点: {self.node_id}，认领目录: {claim_dir}，"
+                    f"分区: {self.partition}/{self.partitions}")
+
+    def _relative_path(self, file_path: str) -> str:
+        # 各实例挂载共享目录的位置可能不同，使用相对监控目录的路径
+        return os.path.relpath(os.path.abspath(file_path), self.root).replace(os.sep, '/')
+
+    def _paths(self, file_path: str, stat: os.stat_result) -> Tuple[str, str]:
+        """返回文件当前版本的租约文件和完成标记路径"""
+        version = f"{self._relative_path(file_path)}\0{stat.st_size}\0{stat.st_mtime_ns}"
+        key = hashlib.blake2b(version.encode('utf-8'), digest_size=16).hexdigest()
+        # 按哈希前两位分子目录，避免单个目录中的文件过多
+        directory = os.path.join(self.claim_dir, key[:2])
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, f"{key}.lease"), os.path.join(directory, f"{key}.done")
+
+    def _owns_partition(self, file_path: str) -> bool:
+        if self.partitions == 1:
+            return True
+        digest = hashlib.blake2b(self._relative_path(file_path).encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'big') % self.partitions == self.partition
+
+    def _write_marker(self, target: str, file_path: str, token: Optional[str] = None) -> bool:
+        """原子地创建标记文件，目标已存在时返回 False"""
+        tmp_path = f"{target}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'node': self.node_id, 'path': self._relative_path(file_path), 'time': time.time(),
+                       'token': token}, f)
+        try:
+            os.link(tmp_path, target)
+            return True
+        except FileExistsError:
+            return False
+        finally:
+            os.unlink(tmp_path)
+
+    def _holds(self, lease: str) -> bool:
+        """租约文件仍是本实例写入的那一个"""
+        try:
+            with open(lease, encoding='utf-8') as f:
+                return json.load(f).get('token') == self.tokens.get(lease)
+        except (OSError, ValueError):
+            return False
+
+    @staticmethod
+    def _owner(path: str) -> str:
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f).get('node', '?')
+        except (OSError, ValueError):
+            return '?'
+
+    def _break_expired(self, lease: str) -> bool:
+        """租约已过期时把它移走，返回是否可以重新尝试认领"""
+        try:
+            age = time.time() - os.stat(lease).st_mtime
+        except FileNotFoundError:
+            return True
+        if age < self.lease_seconds:
+            return False
+        stale = f"{lease}.{uuid.uuid4().hex}.stale"
+        try:
+            os.rename(lease, stale)
+        except FileNotFoundError:
+            # 其他实例已经移走
+            return True
+        try:
+            # 判断过期之后、重命名之前持有者可能刚刚续期，此时放回原处
+            if time.time() - os.stat(stale).st_mtime < self.lease_seconds:
+                try:
+                    os.link(stale, lease)
+                except FileExistsError:
+                    pass
+                return False
+            logger.warning(f"节点 {self._owner(stale)} 的租约已过期 {age:.0f} 秒，重新认领")
+            self.reclaimed += 1
+            return True
+        finally:
+            os.unlink(stale)
+
+    def claim(self, file_path: str) -> str:
+        """尝试认领文件，返回 CLAIMED、DONE 或 HELD"""
+        with self.lock:
+            if file_path in self.leases:
+                return self.CLAIMED
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            with self.lock:
+                self.held.discard(file_path)
+            return self.HELD
+        if not self._owns_partition(file_path) and time.time() - stat.st_mtime < self.partition_grace_seconds:
+            with self.lock:
+                self.held.add(file_path)
+            return self.HELD
+        lease, done = self._paths(file_path, stat)
+        token = uuid.uuid4().hex
+        status = self.HELD
+        if os.path.exists(done):
+            status = self.DONE
+        elif self._write_marker(lease, file_path, token) or \
+                (self._break_expired(lease) and self._write_marker(lease, file_path, token)):
+            if os.path.exists(done):
+                # 检查完成标记之后、认领之前其他实例刚好处理完成
+                os.unlink(lease)
+                status = self.DONE
+            else:
+                status = self.CLAIMED
+        with self.lock:
+            if status == self.HELD:
+                self.held.add(file_path)
+            else:
+                self.held.discard(file_path)
+            if status == self.CLAIMED:
+                self.leases[file_path] = lease
+                self.tokens[lease] = token
+                self.claimed += 1
+        return status
+
+    def reclaim(self) -> List[Tuple[str, str]]:
+        """重试认领其他实例持有的文件，返回状态不再是 HELD 的 (文件路径, 状态)"""
+        with self.lock:
+            files = list(self.held)
+        results = []
+        for file_path in files:
+            status = self.claim(file_path)
+            if status != self.HELD:
+                results.append((file_path, status))
+        return results
+
+    def complete(self, file_path: str) -> None:
+        """文件处理成功，由后台线程写完成标记并删除租约"""
+        self._finish(file_path, True)
+
+    def release(self, file_path: str) -> None:
+        """文件处理失败，由后台线程删除租约，其他实例可以重试"""
+        self._finish(file_path, False)
+
+    def _finish(self, file_path: str, success: bool) -> None:
+        with self.lock:
+            if file_path not in self.leases:
+                return
+            self.finished.append((file_path, success))
+        self.wakeup.set()
+
+    def _settle_finished(self) -> None:
+        with self.lock:
+            finished, self.finished = self.finished, []
+        for file_path, success in finished:
+            with self.lock:
+                lease = self.leases.get(file_path)
+            if lease is None:
+                continue
+            try:
+                if success:
+                    # 数据已经提交，租约被接管时同样写完成标记
+                    self._write_marker(lease[:-len('.lease')] + '.done', file_path)
+                    self.completed += 1
+                else:
+                    self.released += 1
+                if self._holds(lease):
+                    os.unlink(lease)
+                else:
+                    # 租约已被其他实例接管，不能删除对方的租约
+                    self.lost += 1
+                    logger.warning(f"文件的租约已被其他节点接管: {file_path}")
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.error(f"更新文件认领记录时发生错误: {file_path}, {str(e)}")
+                continue
+            with self.lock:
+                self.leases.pop(file_path, None)
+                self.tokens.pop(lease, None)
+
+    def _renew(self) -> None:
+        with self.lock:
+            leases = list(self.leases.items())
+        for file_path, lease in leases:
+            try:
+                if not self._holds(lease):
+                    raise FileNotFoundError(lease)
+                os.utime(lease)
+            except FileNotFoundError:
+                # 续期不及时，租约已被其他实例接管（可能已在同一路径上写入新的租约）
+                self.lost += 1
+                logger.warning(f"文件的租约已被其他节点接管: {file_path}")
+                with self.lock:
+                    self.leases.pop(file_path, None)
+                    self.tokens.pop(lease, None)
+            except Exception as e:
+                logger.error(f"续期租约时发生错误: {file_path}, {str(e)}")
+
+    def _renew_periodically(self) -> None:
+        next_renew = time.monotonic() + self.renew_interval
+        while not self.closed.is_set():
+            self.wakeup.wait(max(0.0, next_renew - time.monotonic()))
+            self.wakeup.clear()
+            self._settle_finished()
+            if time.monotonic() >= next_renew:
+                self._renew()
+                next_renew = time.monotonic() + self.renew_interval
+
+    def close(self) -> None:
+        """完成已处理的文件，释放尚未处理的租约，其他实例可以立即认领"""
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        self.wakeup.set()
+        self.renewer.join()
+        self._settle_finished()
+        with self.lock:
+            remaining = list(self.leases)
+        for file_path in remaining:
+            self._finish(file_path, False)
+        self._settle_finished()
+        logger.info(f"工作认领已关闭，释放未处理的租约 {len(remaining)} 个")
+
+    def metrics(self) -> dict:
+        with self.lock:
+            return {
+                'leases': len(self.leases),
+                'held': len(self.held),
+                'claimed': self.claimed,
+                'completed': self.completed,
+                'released': self.released,
+                'reclaimed': self.reclaimed,
+                'lost': self.lost
+            }
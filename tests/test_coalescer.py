@@ -0,0 +1,57 @@
+import asyncio
+import pandas as pd
+from src.etl.coalescer import MicroBatchCoalescer
+
+def frame(rows):
+    return pd.DataFrame({'order_id': [str(i) for i in range(rows)]})
+
+def collect(files, sizes, batches=1, **kwargs):
+    """把文件放入队列后收集 batches 个微批，sizes 为各文件提取出的行数，None 表示提取失败"""
+    async def run():
+        queue = asyncio.Queue()
+        for file_path in files:
+            queue.put_nowait(file_path)
+
+        async def extract(file_path):
+            rows = sizes.get(file_path, 1)
+            if rows is None:
+                raise ValueError('损坏的文件')
+            return frame(rows)
+
+        coalescer = MicroBatchCoalescer(queue, extract, **kwargs)
+        result = []
+        for _ in range(batches):
+            batch = await coalescer.next_batch()
+            result.append(batch)
+            batch.task_done()
+        return result, queue
+    return asyncio.run(run())
+
+def test_batch_is_cut_at_max_rows():
+    (first, second), _ = collect(['a', 'b', 'c', 'd'], {'a': 40, 'b': 40, 'c': 40, 'd': 40},
+                                 batches=2, max_rows=100, max_wait_seconds=0.5)
+    assert first.files == ['a', 'b', 'c'] and first.rows == 120
+    assert second.files == ['d']
+    assert len(first.to_frame()) == 120
+
+def test_batch_is_cut_at_max_files_and_after_max_wait():
+    (batch,), queue = collect(['a', 'b', 'c'], {}, max_files=2, max_wait_seconds=0.5)
+    assert batch.files == ['a', 'b'] and queue.qsize() == 1
+
+    (batch,), _ = collect(['a'], {}, max_wait_seconds=0.05)
+    assert batch.files == ['a']
+
+def test_failed_extract_is_reported_and_not_batched():
+    (batch,), queue = collect(['a', 'bad', 'c'], {'bad': None}, max_files=3, max_wait_seconds=0.5)
+    assert batch.files == ['a', 'c'] and batch.failed == ['bad']
+    # 取出的三个任务都已标记完成
+    assert batch.taken == 0
+    asyncio.run(asyncio.wait_for(queue.join(), 1))
+
+def test_large_file_is_deferred_to_its_own_stream_batch():
+    (first, second, third), _ = collect(
+        ['a', 'big', 'c'], {}, batches=3, max_files=10, max_wait_seconds=0.5, should_stream=lambda path: path == 'big'
+    )
+    assert first.files == ['a'] and first.stream_file is None
+    assert second.stream_file == 'big' and second.files == []
+    assert third.files == ['c']
@@ -0,0 +1,129 @@
+import os
+import time
+from src.utils.file_index import FileIndexManager
+
+def open_index(tmp_path, **kwargs):
+    return FileIndexManager(db_file=str(tmp_path / 'index.sqlite3'), bloom_file=str(tmp_path / 'index.bloom'),
+                            legacy_cache_file='', **kwargs)
+
+def write_files(directory, count):
+    directory.mkdir()
+    paths = []
+    for i in range(count):
+        path = directory / f'{i}.csv'
+        path.write_text(f'order_id\n{i}\n')
+        paths.append(str(path))
+        # 变化时间（ctime）的精度可能只有几毫秒，错开写入让各文件的变化时间不同
+        time.sleep(0.02)
+    return paths
+
+def newest_first(index):
+    """让扫描先返回变化时间最新的文件，os.scandir 的顺序本身不确定"""
+    scan_entries = index._scan_entries
+
+    def ordered(*args):
+        return iter(sorted(scan_entries(*args), key=lambda path: os.stat(path).st_ctime_ns, reverse=True))
+    index._scan_entries = ordered
+
+def test_interrupted_scan_does_not_advance_watermark(tmp_path):
+    paths = write_files(tmp_path / 'watch', 6)
+    index = open_index(tmp_path)
+    newest_first(index)
+    scan = index.scan_directory(str(tmp_path / 'watch'))
+    first = next(scan)
+    index.mark_file_processed(first)
+    index.close()
+
+    index = open_index(tmp_path)
+    remaining = sorted(index.scan_directory(str(tmp_path / 'watch')))
+    index.close()
+    assert first not in remaining
+    assert remaining == sorted(set(paths) - {first})
+
+def test_complete_scan_keeps_unprocessed_files_above_watermark(tmp_path):
+    paths = write_files(tmp_path / 'watch', 3)
+    index = open_index(tmp_path)
+    found = list(index.scan_directory(str(tmp_path / 'watch')))
+    for path in found[1:]:
+        index.mark_file_processed(path)
+    index.close()
+
+    index = open_index(tmp_path)
+    assert list(index.scan_directory(str(tmp_path / 'watch'))) == found[:1]
+    index.mark_file_processed(found[0])
+    index.close()
+
+    index = open_index(tmp_path)
+    watermark = index._meta(f"scan_watermark:{tmp_path / 'watch'}")
+    assert list(index.scan_directory(str(tmp_path / 'watch'))) == []
+    index.close()
+    assert watermark > max(os.stat(path).st_ctime_ns for path in paths)
+
+def test_sample_hash_match_is_confirmed_with_full_content(tmp_path):
+    head, tail = b'h' * 100000, b't' * 100000
+    (tmp_path / 'watch').mkdir()
+    original = tmp_path / 'watch' / 'original.csv'
+    original.write_bytes(head + b'a' * 1000 + tail)
+    index = open_index(tmp_path)
+    assert not index.is_file_processed(str(original))
+    index.mark_file_processed(str(original))
+
+    # 大小和首尾内容相同，只有中间不同
+    changed = tmp_path / 'watch' / 'changed.csv'
+    changed.write_bytes(head + b'b' * 1000 + tail)
+    assert not index.is_file_processed(str(changed))
+
+    copy = tmp_path / 'watch' / 'copy.csv'
+    copy.write_bytes(original.read_bytes())
+    assert index.is_file_processed(str(copy))
+    index.close()
+
+    # 原文件删除后，按重新投递时记录的全文哈希确认
+    original.unlink()
+    again = tmp_path / 'watch' / 'again.csv'
+    again.write_bytes(copy.read_bytes())
+    index = open_index(tmp_path)
+    assert index.is_file_processed(str(again))
+    assert not index.is_file_processed(str(changed))
+    index.close()
+
+def test_hashes_from_another_scheme_are_cleared(tmp_path):
+    (tmp_path / 'watch').mkdir()
+    original = tmp_path / 'watch' / 'original.csv'
+    original.write_text('order_id\n1\n')
+    index = open_index(tmp_path)
+    index.is_file_processed(str(original))
+    index.mark_file_processed(str(original))
+    index.close()
+
+    index = open_index(tmp_path)
+    index.writer.execute("UPDATE meta SET value = 1 WHERE key = 'content_hash_version'")
+    index.close()
+
+    copy = tmp_path / 'watch' / 'copy.csv'
+    copy.write_text('order_id\n1\n')
+    index = open_index(tmp_path)
+    assert index.is_file_processed(str(original))
+    assert not index.is_file_processed(str(copy))
+    index.close()
+
+def test_marks_are_visible_before_and_after_group_commit(tmp_path):
+    paths = write_files(tmp_path / 'watch', 3)
+    index = open_index(tmp_path, group_commit_size=1000, group_commit_interval=60)
+    for path in paths[:2]:
+        assert not index.is_file_processed(path)
+        index.mark_file_processed(path)
+    # 尚未提交的标记同样可以查到
+    assert index.pending and index.is_file_processed(paths[0])
+    index.flush()
+    assert not index.pending and index.count == 2
+    assert index.is_file_processed(paths[1]) and not index.is_file_processed(paths[2])
+    index.close()
+
+    # 同名文件被重写后指纹改变，需要重新处理
+    with open(paths[0], 'a') as f:
+        f.write('99\n')
+    index = open_index(tmp_path)
+    assert index.count == 2
+    assert not index.is_file_processed(paths[0]) and index.is_file_processed(paths[1])
+    index.close()
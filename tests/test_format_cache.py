@@ -0,0 +1,46 @@
+import json
+from src.etl.format_cache import FormatCache, detect_datetime_format
+
+def write(path, text, encoding='utf-8'):
+    path.write_bytes(text.encode(encoding))
+    return str(path)
+
+def test_infer_detects_delimiter_encoding_and_datetime_formats(tmp_path):
+    cache = FormatCache(str(tmp_path / 'format_cache.json'))
+    head = 'order_id;order_date;province\n1;05/03/2025 06:36:19;浙江省\n2;31/03/2025 10:00:00;江苏省\n'
+    profile = cache.infer(head.encode('gb18030'))
+    assert profile['delimiter'] == ';'
+    assert profile['encoding'] == 'gb18030'
+    assert profile['columns'] == ['order_id', 'order_date', 'province']
+    # 05/03 有歧义，31/03 只能是日/月
+    assert profile['datetime_formats'] == {'order_date': '%d/%m/%Y %H:%M:%S'}
+    assert detect_datetime_format(['2025-03-05 06:36:19', '']) == '%Y-%m-%d %H:%M:%S'
+    assert detect_datetime_format(['yesterday']) is None
+
+def test_lookup_caches_by_source_prefix_and_header(tmp_path):
+    cache_file = str(tmp_path / 'format_cache.json')
+    cache = FormatCache(cache_file)
+    header = 'order_id,order_date\n'
+    first = write(tmp_path / 'shop_20250305_0001.csv', header + '1,2025-03-05 06:36:19\n')
+    second = write(tmp_path / 'shop_20250306_0002.csv', header + '2,2025-03-06 06:36:19\n')
+    other = write(tmp_path / 'shop_20250306_0003.csv', 'order_id|order_date\n3|2025-03-06\n')
+
+    profile = cache.lookup(first)
+    assert cache.lookup(second) is profile
+    assert cache.lookup(other)['delimiter'] == '|'
+    with open(cache_file, encoding='utf-8') as f:
+        assert len(json.load(f)) == 2
+    assert FormatCache(cache_file).lookup(second) == profile
+
+def test_read_only_cache_hands_learned_profiles_to_the_writer(tmp_path):
+    cache_file = str(tmp_path / 'format_cache.json')
+    worker = FormatCache(cache_file, read_only=True)
+    path = write(tmp_path / 'shop_0001.csv', 'order_id,order_date\n1,2025-03-05\n')
+    profile = worker.lookup(path)
+    assert not (tmp_path / 'format_cache.json').exists()
+
+    learned = worker.drain()
+    assert list(learned.values()) == [profile] and worker.drain() == {}
+    parent = FormatCache(cache_file)
+    parent.merge(learned)
+    assert FormatCache(cache_file).profiles == learned
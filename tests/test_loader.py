@@ -0,0 +1,97 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+import pandas as pd
+import pytest
+from asyncpg.exceptions import FeatureNotSupportedError, UniqueViolationError
+from tortoise.fields import DatetimeField
+from src.config import ADAPTIVE_BATCH_CONFIG, LOAD_CONFIG, ORDER_INDEX_CONFIG
+from src.etl.loader import PostgresLoader
+from src.models import Order
+
+class FakeConnection:
+    """记录 COPY 调用和事务的 asyncpg 连接替身"""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.copies = []
+        self.transactions = 0
+
+    @asynccontextmanager
+    async def transaction(self):
+        self.transactions += 1
+        yield
+
+    async def copy_records_to_table(self, table_name, records, columns):
+        if self.error is not None:
+            raise self.error
+        self.copies.append((table_name, columns, list(records)))
+
+class FakePool:
+    def __init__(self, conn):
+        self.conn = conn
+
+    async def init(self):
+        pass
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self.conn
+
+@pytest.fixture
+def make_loader(monkeypatch):
+    monkeypatch.setitem(ORDER_INDEX_CONFIG, 'enabled', False)
+    monkeypatch.setitem(ADAPTIVE_BATCH_CONFIG, 'enabled', False)
+    monkeypatch.setitem(LOAD_CONFIG, 'copy_batch_rows', 2)
+
+    def make(conn, mode='copy'):
+        loader = PostgresLoader(mode=mode, pool=FakePool(conn))
+        loader.table_columns = {
+            name: 'timestamp with time zone' if isinstance(field, DatetimeField) else 'text'
+            for name, field in Order._meta.fields_map.items()
+        }
+        loader.bulk_creates = []
+
+        async def bulk_create(df, ignore_conflicts=False):
+            loader.bulk_creates.append((len(df), ignore_conflicts))
+        loader._bulk_create = bulk_create
+        return loader
+    return make
+
+def orders(count):
+    return pd.DataFrame({
+        'order_id': [f'o{i}' for i in range(count)],
+        'order_date': [datetime(2025, 3, 5, 6, 36, i) for i in range(count)],
+        'total_price': [str(i) for i in range(count)],
+        'intermediate': range(count)
+    })
+
+def test_copy_is_chunked_in_one_transaction_with_utc_timestamps(make_loader):
+    conn = FakeConnection()
+    asyncio.run(make_loader(conn).load(orders(5)))
+    assert conn.transactions == 1
+    assert [len(records) for _, _, records in conn.copies] == [2, 2, 1]
+    table_name, columns, records = conn.copies[0]
+    # 不属于模型的中间列不写入，不带时区的时间按 UTC 写入
+    assert table_name == Order._meta.db_table and columns == ['order_id', 'order_date', 'total_price']
+    assert records[0][0] == 'o0' and records[0][1] == datetime(2025, 3, 5, 6, 36, 0, tzinfo=timezone.utc)
+
+def test_orm_fallback_only_when_copy_is_unsupported(make_loader):
+    loader = make_loader(FakeConnection(FeatureNotSupportedError('COPY is not supported')))
+    asyncio.run(loader.load(orders(3)))
+    assert loader.bulk_creates == [(3, True)]
+
+    class NoCopy:
+        @asynccontextmanager
+        async def transaction(self):
+            yield
+    loader = make_loader(NoCopy())
+    asyncio.run(loader.load(orders(3)))
+    assert loader.bulk_creates == [(3, True)]
+
+@pytest.mark.parametrize('error', [UniqueViolationError('duplicate key'), ConnectionResetError('reset')])
+def test_data_and_connection_errors_are_raised(make_loader, error):
+    loader = make_loader(FakeConnection(error))
+    with pytest.raises(type(error)):
+        asyncio.run(loader.load(orders(3)))
+    assert loader.bulk_creates == []
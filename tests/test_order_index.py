@@ -0,0 +1,62 @@
+import asyncio
+from datetime import datetime, timezone
+from decimal import Decimal
+import pytest
+from tortoise import Tortoise
+from src.models import Order
+from src.utils.order_index import OrderIndex
+
+@pytest.fixture
+def index(tmp_path):
+    index = OrderIndex(str(tmp_path / 'order_index.db'), str(tmp_path / 'order_index.bloom'), initial_capacity=1000)
+    yield index
+    index.close()
+
+def order(order_id):
+    now = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    return Order(order_id=order_id, user_id='00000000-0000-0000-0000-000000000001', order_date=now,
+                 total_price=Decimal('1.00'), discount=Decimal('0.00'), payment_method='支付宝', order_status='已完成',
+                 province='浙江省', city='杭州市', district='西湖区', street='文三路', customer_name='张三',
+                 phone_number='13800000000', email='a@example.com', product_count=1, shipping_fee=Decimal('0.00'),
+                 tax=Decimal('0.00'), delivery_time=now, log_info='{}')
+
+def test_reserve_skips_loaded_pending_and_repeated_orders(index):
+    index.add(['o1'])
+    assert index.reserve(['o1', 'o2', 'o2', None]) == [False, True, False, False]
+    # o2 正在写入，其他批次不再写入
+    assert index.reserve(['o2']) == [False]
+    index.release(['o2'])
+    assert index.reserve(['o2']) == [True]
+    index.add(['o2'])
+    assert 'o2' in index and 'o3' not in index and index.count == 2
+
+def test_bloom_filter_is_reloaded_only_when_counts_match(tmp_path):
+    paths = str(tmp_path / 'order_index.db'), str(tmp_path / 'order_index.bloom')
+    index = OrderIndex(*paths, initial_capacity=1000)
+    index.add(['o1', 'o2'])
+    index.close()
+    reopened = OrderIndex(*paths, initial_capacity=1000)
+    assert 'o1' in reopened and reopened.count == 2
+    # 保存布隆过滤器之后又写入的订单，重新打开时从精确索引重建
+    reopened.add(['o3'])
+    reopened.conn.close()
+    rebuilt = OrderIndex(*paths, initial_capacity=1000)
+    assert 'o3' in rebuilt and rebuilt.count == 3
+    rebuilt.close()
+
+def test_rebuild_pages_by_primary_key(index, monkeypatch):
+    monkeypatch.setattr(OrderIndex, 'REBUILD_PAGE_ROWS', 2)
+
+    async def run():
+        await Tortoise.init(db_url='sqlite://:memory:', modules={'models': ['src.models']})
+        try:
+            await Tortoise.generate_schemas()
+            await Order.bulk_create([order(f'o{number}') for number in range(5)])
+            # 删除中间的订单，id 不连续时分页同样完整
+            await Order.filter(order_id='o2').delete()
+            return await index.rebuild()
+        finally:
+            await Tortoise.close_connections()
+
+    assert asyncio.run(run()) == 4
+    assert all(f'o{number}' in index for number in (0, 1, 3, 4)) and 'o2' not in index
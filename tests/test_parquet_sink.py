@@ -0,0 +1,36 @@
+import os
+import glob
+from datetime import datetime
+import pyarrow as pa
+import pyarrow.parquet as pq
+from src.etl.parquet_sink import ParquetSink
+
+def batch(order_ids):
+    return pa.table({
+        'order_id': [str(order_id) for order_id in order_ids],
+        'order_date': pa.array([datetime(2024, 1, 1)] * len(order_ids), pa.timestamp('us')),
+        'province': ['浙江省'] * len(order_ids),
+        'total_price': [1.0] * len(order_ids)
+    })
+
+def partition_files(root, prefix):
+    return sorted(glob.glob(os.path.join(root, '*', '*', f'{prefix}-*.parquet')))
+
+def test_compaction_leaves_compacted_files_alone(tmp_path):
+    root = str(tmp_path / 'lake')
+    sink = ParquetSink(root, compact_min_files=2)
+    sink._load(batch([1, 2]))
+    sink._load(batch([2, 3]))
+    first = partition_files(root, 'compacted')
+    assert len(first) == 1 and not partition_files(root, 'part')
+    mtime = os.stat(first[0]).st_mtime_ns
+
+    # 重放已合并的订单，再写入新订单
+    sink._load(batch([3, 4]))
+    sink._load(batch([5]))
+
+    compacted = partition_files(root, 'compacted')
+    assert first[0] in compacted and len(compacted) == 2
+    assert os.stat(first[0]).st_mtime_ns == mtime
+    order_ids = pa.concat_tables([pq.read_table(path, columns=['order_id']) for path in compacted])['order_id']
+    assert sorted(order_ids.to_pylist()) == ['1', '2', '3', '4', '5']
@@ -0,0 +1,38 @@
+import asyncio
+from src.etl.readiness import FileReadinessTracker
+
+def test_admit_waits_while_tracked_is_full(tmp_path):
+    files = []
+    for name in ('a.csv', 'b.csv', 'c.csv', 'd.csv'):
+        path = tmp_path / name
+        path.write_text('order_id\n1\n')
+        files.append(str(path))
+
+    async def run():
+        dispatched = []
+        gate = asyncio.Event()
+
+        async def dispatch(file_path):
+            # 模拟处理队列已满
+            await gate.wait()
+            dispatched.append(file_path)
+
+        tracker = FileReadinessTracker(dispatch, stable_seconds=0, poll_interval=0.01, max_tracked=2)
+        checker = asyncio.create_task(tracker.run())
+        async def scan_all():
+            for path in files:
+                await tracker.admit(path)
+
+        scan = asyncio.create_task(scan_all())
+        await asyncio.sleep(0.1)
+        # 一个文件正在等待入队，两个文件在等待检查，扫描停在第四个文件
+        assert len(tracker.tracked) == 2 and not scan.done()
+
+        gate.set()
+        await asyncio.wait_for(scan, 1)
+        while len(dispatched) < len(files):
+            await asyncio.sleep(0.01)
+        checker.cancel()
+        return dispatched
+
+    assert sorted(asyncio.run(run())) == files
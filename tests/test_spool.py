@@ -0,0 +1,77 @@
+import os
+import asyncio
+import pandas as pd
+from src.etl.spool import SpoolDrainer, WriteAheadSpool
+
+def frame(*order_ids):
+    return pd.DataFrame({'order_id': list(order_ids), 'total_price': [1.0] * len(order_ids)})
+
+async def drain(spool, load, until, **kwargs):
+    """运行一个排空协程，直到 until() 成立"""
+    drainer = SpoolDrainer(spool, load, retry_initial_seconds=0, retry_max_seconds=0, **kwargs)
+    task = asyncio.create_task(drainer.run())
+    try:
+        for _ in range(500):
+            if until():
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    return drainer
+
+def test_small_segments_are_merged_up_to_batch_rows(tmp_path):
+    async def run():
+        spool = WriteAheadSpool(str(tmp_path / 'spool'), fsync=False)
+        for order_id in 'abcde':
+            await spool.append(frame(order_id))
+        loads = []
+
+        async def load(df):
+            loads.append(df['order_id'].tolist())
+
+        await drain(spool, load, lambda: not spool.segments, batch_rows=lambda: 2)
+        return loads
+
+    assert asyncio.run(run()) == [['a', 'b'], ['c', 'd'], ['e']]
+
+def test_failing_segment_is_quarantined_and_does_not_block_the_rest(tmp_path):
+    directory = str(tmp_path / 'spool')
+
+    async def run():
+        spool = WriteAheadSpool(directory, fsync=False, max_attempts=3)
+        for order_id in ('bad', 'a', 'b'):
+            await spool.append(frame(order_id))
+        loaded = []
+
+        async def load(df):
+            if 'bad' in df['order_id'].tolist():
+                raise ValueError('数据错误')
+            loaded.extend(df['order_id'].tolist())
+
+        await drain(spool, load, lambda: not spool.segments, batch_rows=lambda: 10)
+        return spool, loaded
+
+    spool, loaded = asyncio.run(run())
+    assert loaded == ['a', 'b']
+    assert spool.metrics()['quarantined'] == 1
+    assert os.listdir(os.path.join(directory, WriteAheadSpool.QUARANTINE_DIR)) == ['000000000000.arrow']
+    # 隔离的段文件不会在启动时重放
+    assert WriteAheadSpool(directory, fsync=False).segments == []
+
+def test_connection_errors_are_not_counted(tmp_path):
+    async def run():
+        spool = WriteAheadSpool(str(tmp_path / 'spool'), fsync=False, max_attempts=2)
+        await spool.append(frame('a'))
+        calls = []
+
+        async def load(df):
+            calls.append(df)
+            if len(calls) <= 5:
+                raise ConnectionRefusedError('数据库不可用')
+
+        await drain(spool, load, lambda: not spool.segments)
+        return spool, calls
+
+    spool, calls = asyncio.run(run())
+    assert len(calls) == 6 and spool.metrics()['quarantined'] == 0
@@ -0,0 +1,36 @@
+import os
+import glob
+import asyncio
+import pandas as pd
+import pyarrow as pa
+import pytest
+from src.config import FORMAT_CACHE_CONFIG, USER_STATS_CONFIG
+from src.etl.extractor import CSVExtractor
+from src.etl.transformer import DataTransformer
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+DATA_FILES = sorted(glob.glob(os.path.join(DATA_DIR, '*.csv')))
+
+@pytest.fixture
+def orders(tmp_path, monkeypatch):
+    """data/ 中的全部订单文件，末尾追加一批重复行以覆盖去重"""
+    if not DATA_FILES:
+        pytest.skip("data/ 中没有订单文件")
+    monkeypatch.chdir(tmp_path)
+    # user_stats=None 时 avg_price 按批次内分组计算，两个引擎不共享累计状态
+    monkeypatch.setitem(USER_STATS_CONFIG, 'enabled', False)
+    monkeypatch.setitem(FORMAT_CACHE_CONFIG, 'enabled', False)
+    extractor = CSVExtractor()
+    table = pa.concat_tables([extractor.read_table(path) for path in DATA_FILES], promote_options='permissive')
+    table = pa.concat_tables([table, table.slice(0, 500)]).unify_dictionaries()
+    return table
+
+def test_arrow_and_pandas_engines_produce_equal_frames(orders):
+    arrow = asyncio.run(DataTransformer(engine='arrow', user_stats=None).transform(orders))
+    pandas = asyncio.run(DataTransformer(engine='pandas', user_stats=None).transform(orders))
+
+    # 两个引擎输出相同的列（顺序可以不同），逐列逐行比较全部取值
+    assert sorted(arrow.columns) == sorted(pandas.columns)
+    assert len(arrow) > 0
+    pandas = pandas[list(arrow.columns)].reset_index(drop=True)
+    pd.testing.assert_frame_equal(arrow.reset_index(drop=True), pandas, check_dtype=True, check_exact=True)
@@ -0,0 +1,40 @@
+import os
+import glob
+import asyncio
+import pyarrow as pa
+import pytest
+from src.config import FORMAT_CACHE_CONFIG
+from src.etl.extractor import CSVExtractor
+from src.etl.transformer import DataTransformer
+from src.utils.user_stats import UserAggregateStore
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+DATA_FILES = sorted(glob.glob(os.path.join(DATA_DIR, '*.csv')))
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setitem(FORMAT_CACHE_CONFIG, 'enabled', False)
+    store = UserAggregateStore(str(tmp_path / 'user_stats.db'))
+    yield store
+    store.close()
+
+def test_update_counts_each_order_once(store):
+    first = store.update(pa.array(['o1', 'o2', 'o2']), pa.array(['u1', 'u1', 'u1']), pa.array([10.0, 20.0, 20.0]))
+    again = store.update(pa.array(['o2', 'o1']), pa.array(['u1', 'u1']), pa.array([20.0, 10.0]))
+
+    assert first.to_pylist() == [15.0, 15.0, 15.0]
+    assert again.to_pylist() == [15.0, 15.0]
+    assert store.get('u1')['order_count'] == 2
+
+def test_transforming_same_file_twice_keeps_avg_price(store):
+    if not DATA_FILES:
+        pytest.skip("data/ 中没有订单文件")
+    table = CSVExtractor().read_table(DATA_FILES[0])
+    transformer = DataTransformer(engine='arrow', user_stats=store)
+
+    first = asyncio.run(transformer.transform(table))
+    # 重试、重放或被其他实例接管时同一个文件会再次转换
+    second = asyncio.run(transformer.transform(table))
+
+    assert first['avg_price'].tolist() == second['avg_price'].tolist()
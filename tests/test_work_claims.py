@@ -0,0 +1,116 @@
+import os
+import time
+import threading
+import pytest
+from src.utils.work_claims import WorkClaimManager
+
+@pytest.fixture
+def shared(tmp_path):
+    """两个实例共享的监控目录和认领目录"""
+    watch = tmp_path / 'watch'
+    watch.mkdir()
+    file_path = watch / 'order_data_20250305_063619_0459.csv'
+    file_path.write_text('order_id\n1\n')
+    managers = []
+
+    def manager(node_id, **kwargs):
+        kwargs.setdefault('lease_seconds', 60.0)
+        kwargs.setdefault('renew_interval', 3600.0)
+        claims = WorkClaimManager(str(tmp_path / 'claims'), root=str(watch), node_id=node_id, **kwargs)
+        managers.append(claims)
+        return claims
+
+    yield str(file_path), manager
+    for claims in managers:
+        claims.close()
+
+def settle(claims):
+    """等待后台线程处理完成和释放"""
+    claims.wakeup.set()
+    deadline = time.time() + 5
+    while claims.metrics()['leases'] and time.time() < deadline:
+        time.sleep(0.01)
+
+def test_only_one_node_wins_a_race(shared):
+    file_path, manager = shared
+    nodes = [manager(f'node-{index}') for index in range(2)]
+    barrier = threading.Barrier(len(nodes))
+    results = {}
+
+    def claim(claims):
+        barrier.wait()
+        results[claims.node_id] = claims.claim(file_path)
+
+    threads = [threading.Thread(target=claim, args=(claims,)) for claims in nodes]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(results.values()) == [WorkClaimManager.CLAIMED, WorkClaimManager.HELD]
+
+def test_completed_file_is_done_for_other_nodes(shared):
+    file_path, manager = shared
+    first, second = manager('node-a'), manager('node-b')
+    assert first.claim(file_path) == WorkClaimManager.CLAIMED
+    assert second.claim(file_path) == WorkClaimManager.HELD
+
+    first.complete(file_path)
+    settle(first)
+
+    assert second.claim(file_path) == WorkClaimManager.DONE
+    assert second.reclaim() == []
+
+def test_released_file_can_be_claimed_again(shared):
+    file_path, manager = shared
+    first, second = manager('node-a'), manager('node-b')
+    assert first.claim(file_path) == WorkClaimManager.CLAIMED
+    assert second.claim(file_path) == WorkClaimManager.HELD
+
+    first.release(file_path)
+    settle(first)
+
+    assert second.reclaim() == [(file_path, WorkClaimManager.CLAIMED)]
+
+def test_expired_lease_is_taken_over(shared):
+    file_path, manager = shared
+    first, second = manager('node-a', lease_seconds=0.2), manager('node-b', lease_seconds=0.2)
+    assert first.claim(file_path) == WorkClaimManager.CLAIMED
+    assert second.claim(file_path) == WorkClaimManager.HELD
+
+    # node-a 停止续期，租约过期后由 node-b 接管
+    time.sleep(0.3)
+    assert second.reclaim() == [(file_path, WorkClaimManager.CLAIMED)]
+    assert second.metrics()['reclaimed'] == 1
+
+    # node-a 续期时发现租约已被接管，之后的完成不会写完成标记
+    first._renew()
+    assert first.metrics()['lost'] == 1
+    first.complete(file_path)
+    second.complete(file_path)
+    settle(second)
+    assert manager('node-c').claim(file_path) == WorkClaimManager.DONE
+
+def test_renewed_lease_is_not_taken_over(shared):
+    file_path, manager = shared
+    first, second = manager('node-a', lease_seconds=0.5), manager('node-b', lease_seconds=0.5)
+    assert first.claim(file_path) == WorkClaimManager.CLAIMED
+    for _ in range(3):
+        time.sleep(0.2)
+        first._renew()
+        assert second.claim(file_path) == WorkClaimManager.HELD
+    assert first.metrics()['lost'] == 0
+
+def test_finishing_after_takeover_keeps_the_new_lease(shared):
+    file_path, manager = shared
+    first, second = manager('node-a', lease_seconds=0.2), manager('node-b', lease_seconds=0.2)
+    assert first.claim(file_path) == WorkClaimManager.CLAIMED
+    time.sleep(0.3)
+    assert second.claim(file_path) == WorkClaimManager.CLAIMED
+
+    # node-a 没来得及续期就处理失败，释放时不能删除 node-b 的租约
+    first.release(file_path)
+    settle(first)
+
+    assert first.metrics()['lost'] == 1
+    assert manager('node-c').claim(file_path) == WorkClaimManager.HELD
@@ -0,0 +1,50 @@
+import asyncio
+import pytest
+from src.etl.work_queue import PriorityWorkQueue, file_timestamp
+
+def drain(queue):
+    return [queue.get_nowait() for _ in range(queue.qsize())]
+
+def fill(policy, files, maxsize=0):
+    async def run():
+        queue = PriorityWorkQueue(maxsize, policy)
+        for file_path in files:
+            queue.put_nowait(file_path)
+        return drain(queue)
+    return asyncio.run(run())
+
+def test_oldest_orders_by_file_name_timestamp():
+    files = ['orders_20250305_063619.csv', 'orders_20250101_000000.csv', 'orders_20250305_063618.csv']
+    assert fill('oldest', files) == [files[1], files[2], files[0]]
+    assert file_timestamp(files[1]) < file_timestamp(files[2])
+
+def test_smallest_orders_by_size_and_fifo_keeps_arrival_order(tmp_path):
+    files = []
+    for name, size in [('a.csv', 300), ('b.csv', 100), ('c.csv', 200)]:
+        path = tmp_path / name
+        path.write_bytes(b'x' * size)
+        files.append(str(path))
+    assert fill('smallest', files) == [files[1], files[2], files[0]]
+    assert fill('fifo', files) == files
+
+def test_fair_alternates_between_sources():
+    backlog = [f'shop_a_{i:04d}.csv' for i in range(4)] + ['shop_b_0000.csv', 'shop_b_0001.csv']
+    order = fill('fair', backlog)
+    assert order[:4] == ['shop_a_0000.csv', 'shop_b_0000.csv', 'shop_a_0001.csv', 'shop_b_0001.csv']
+    assert sorted(order) == sorted(backlog)
+
+def test_unknown_policy_and_bounded_put():
+    with pytest.raises(ValueError):
+        PriorityWorkQueue(policy='random')
+
+    async def run():
+        queue = PriorityWorkQueue(maxsize=1, policy='fifo')
+        await queue.put('a.csv')
+        put = asyncio.create_task(queue.put('b.csv'))
+        await asyncio.sleep(0.01)
+        # 队列已满，put 等待出队
+        blocked = not put.done()
+        assert queue.get_nowait() == 'a.csv'
+        await asyncio.wait_for(put, 1)
+        return blocked, queue.get_nowait()
+    assert asyncio.run(run()) == (True, 'b.csv')